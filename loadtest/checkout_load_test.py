@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the checkout -> webhook -> subscription pipeline.
+
+Requires the backend running against loadtest/fake_stripe.py (see that file for
+the setup). Each virtual customer:
+
+  1. POST /api/stripe/create-checkout-session
+  2. pays on the fake hosted checkout page (fake sends checkout.session.completed)
+  3. loads the success page  GET /api/stripe/session/<id>  (--success-polls times)
+  4. waits until the subscription this checkout created shows up in
+     GET /api/v2/customer-subscriptions/<email> (matched on its Stripe subscription id)
+  5. optionally (--deposits) creates, confirms and completes a booking deposit payment
+
+and the script reports throughput and p50/p95/p99 latency per step:
+
+    python loadtest/checkout_load_test.py --customers 200 --concurrency 20
+"""
+
+import argparse
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import requests
+
+PLANS = [
+    ('PLAN_MINI_VALET_HOME', 'weekly'),
+    ('PLAN_MINI_VALET_HOME', 'monthly'),
+    ('PLAN_FULL_VALET_HOME', 'bi_weekly'),
+    ('PLAN_INTERIOR_DETAILING_HOME', 'monthly'),
+]
+VEHICLE_TYPES = ['small_car', 'medium_car', 'large_car', 'van']
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def timed(self, step, func):
+        started = time.perf_counter()
+        try:
+            result = func()
+        except Exception:
+            self.errors[step] += 1
+            raise
+        self.latencies[step].append((time.perf_counter() - started) * 1000)
+        return result
+
+    def report(self, wall_seconds, customers):
+        print(f"\n{customers} customers in {wall_seconds:.2f}s "
+              f"-> {customers / wall_seconds:.1f} checkouts/s\n")
+        header = f"{'step':<28}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        print(header)
+        print('-' * len(header))
+        for step in sorted(set(self.latencies) | set(self.errors)):
+            values = np.asarray(self.latencies.get(step, []))
+            if values.size:
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                maximum = values.max()
+            else:
+                p50 = p95 = p99 = maximum = float('nan')
+            print(f"{step:<28}{values.size:>7}{self.errors.get(step, 0):>8}{values.size / wall_seconds:>9.1f}"
+                  f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{maximum:>10.1f}")
+
+
+def expect_ok(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.url} -> {response.status_code}: {response.text[:200]}")
+    return response.json()
+
+
+def run_customer(index, args, recorder):
+    http = requests.Session()
+    plan_id, frequency = PLANS[index % len(PLANS)]
+    # A share of checkouts reuse an existing email to exercise the customer mapping
+    customer_number = index % max(1, int(args.customers * args.unique_customer_ratio))
+    email = f"loadtest+{args.run_id}-{customer_number}@example.com"
+
+    checkout = recorder.timed('create_checkout_session', lambda: expect_ok(http.post(
+        f"{args.app_url}/api/stripe/create-checkout-session", json={
+            'plan_id': plan_id,
+            'vehicle_type': VEHICLE_TYPES[index % len(VEHICLE_TYPES)],
+            'frequency': frequency,
+            'customer_info': {
+                'email': email,
+                'name': f"Load Test {customer_number}",
+                'phone': '07000000000',
+                'address': {'line1': '1 Test Street', 'city': 'Derby', 'postal_code': 'DE1 1AA', 'country': 'GB'}
+            }
+        })))
+    session_id = checkout['session_id']
+
+    checkout_paid_at = time.perf_counter()
+    completed = recorder.timed('fake_checkout_complete', lambda: expect_ok(http.post(
+        f"{args.fake_url}/_fake/checkout/sessions/{session_id}/complete")))
+    stripe_subscription_id = completed['session']['subscription']
+
+    for _ in range(args.success_polls):
+        recorder.timed('success_page', lambda: expect_ok(http.get(f"{args.app_url}/api/stripe/session/{session_id}")))
+
+    # Webhook delivered, processed in the background, subscription visible in the API.
+    # Reused emails already have subscriptions, so wait for the one this checkout created.
+    deadline = time.perf_counter() + args.pipeline_timeout
+    while True:
+        subscriptions = expect_ok(http.get(f"{args.app_url}/api/v2/customer-subscriptions/{email}"))
+        if any(s.get('stripe_subscription_id') == stripe_subscription_id
+               for s in subscriptions.get('subscriptions', [])):
+            recorder.latencies['checkout_to_subscription'].append((time.perf_counter() - checkout_paid_at) * 1000)
+            break
+        if time.perf_counter() > deadline:
+            recorder.errors['checkout_to_subscription'] += 1
+            break
+        time.sleep(0.05)
+
+    if args.deposits:
+        booking_id = f"LT-{args.run_id}-{index}"
+        intent = recorder.timed('create_payment_intent', lambda: expect_ok(http.post(
+            f"{args.app_url}/api/payment/create-payment-intent", json={
+                'amount': 2000,
+                'booking_data': {'booking_id': booking_id, 'customer_email': email,
+                                 'customer_name': f"Load Test {customer_number}", 'total_amount': 80}
+            })))
+        recorder.timed('fake_confirm_payment_intent', lambda: expect_ok(http.post(
+            f"{args.fake_url}/v1/payment_intents/{intent['payment_intent_id']}/confirm")))
+        recorder.timed('confirm_payment', lambda: expect_ok(http.post(
+            f"{args.app_url}/api/payment/confirm-payment", json={
+                'payment_intent_id': intent['payment_intent_id'],
+                'booking_data': {'customer_phone': '07000000000', 'address': '1 Test Street'}
+            })))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkout-to-webhook load test against the fake Stripe server')
+    parser.add_argument('--app-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--fake-url', default='http://127.0.0.1:12111')
+    parser.add_argument('--customers', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--success-polls', type=int, default=3, help='Success page loads per checkout')
+    parser.add_argument('--unique-customer-ratio', type=float, default=0.8,
+                        help='Fraction of checkouts that use a new email')
+    parser.add_argument('--pipeline-timeout', type=float, default=30.0,
+                        help='Seconds to wait for a subscription to appear after payment')
+    parser.add_argument('--deposits', action='store_true', help='Also run the booking deposit payment flow')
+    args = parser.parse_args()
+    args.run_id = uuid.uuid4().hex[:8]
+
+    recorder = Recorder()
+    failures = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run_customer, index, args, recorder) for index in range(args.customers)]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failures += 1
+                if failures <= 5:
+                    print(f"Customer flow failed: {e}")
+    wall_seconds = time.perf_counter() - started
+
+    recorder.report(wall_seconds, args.customers)
+    if failures:
+        print(f"\n{failures} customer flows failed")
+
+    try:
+        fake_stats = requests.get(f"{args.fake_url}/_fake/stats", timeout=5).json()
+        print("\nStripe API calls made by the backend:")
+        for label, count in fake_stats['requests'].items():
+            print(f"  {label:<40}{count:>7}")
+        print(f"Webhooks delivered: {fake_stats['webhooks']['sent']}, failed: {fake_stats['webhooks']['failed']}")
+    except requests.RequestException:
+        pass
+
+
+if __name__ == '__main__':
+    main()
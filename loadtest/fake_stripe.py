@@ -0,0 +1,600 @@
+#!/usr/bin/env python3
+"""
+Local Stripe API stand-in for load testing the checkout and webhook pipeline.
+
+Implements the subset of the Stripe API this backend uses (customers, products,
+prices, checkout sessions, payment intents, subscriptions, invoices) with in-memory
+storage, Idempotency-Key replay and optional injected latency. Completing a
+checkout session or confirming a payment intent sends a signed webhook to the
+configured webhook URL(s), the same way Stripe would.
+
+Run the fake, then point the backend at it:
+
+    python loadtest/fake_stripe.py --port 12111 --latency-ms 150 \\
+        --webhook-url http://127.0.0.1:5000/api/stripe/webhook
+
+    STRIPE_API_BASE=http://127.0.0.1:12111 STRIPE_SECRET_KEY=sk_test_fake \\
+    STRIPE_WEBHOOK_SECRET=whsec_fake python src/main.py
+
+Test-only endpoints (not part of the Stripe API):
+    POST /_fake/checkout/sessions/<id>/complete   pay a session and send checkout.session.completed
+    GET  /_fake/stats                             object counts, request counts, webhook deliveries
+    POST /_fake/reset                             drop all objects and stats
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, request, jsonify, make_response
+
+app = Flask(__name__)
+
+config = {
+    'latency_ms': 0.0,
+    'jitter_ms': 0.0,
+    'webhook_urls': [],
+    'webhook_secret': 'whsec_fake',
+    'webhook_attempts': 3,
+}
+
+_lock = threading.Lock()
+objects = {}           # object type -> {id: object}
+idempotent_responses = {}  # idempotency key -> (status, body)
+request_counts = {}    # 'METHOD /path' -> count
+webhook_stats = {'sent': 0, 'failed': 0, 'latencies_ms': []}
+_webhook_pool = ThreadPoolExecutor(max_workers=8)
+
+_ID_SEGMENT = re.compile(r'^(?:[a-z]{2,6}_)+[A-Za-z0-9]{8,}$')
+
+
+def new_id(prefix):
+    return f"{prefix}_{secrets.token_hex(8)}"
+
+
+def store(kind):
+    return objects.setdefault(kind, {})
+
+
+# ---------------------------------------------------------------------------
+# Request helpers
+# ---------------------------------------------------------------------------
+
+def parse_form(form):
+    """Decode Stripe's bracketed form encoding (metadata[a]=1, items[0][price]=x) into nested data"""
+    root = {}
+    for raw_key, value in form.items(multi=True):
+        parts = re.findall(r'[^\[\]]+', raw_key)
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+
+    def listify(node):
+        if isinstance(node, dict):
+            node = {key: listify(child) for key, child in node.items()}
+            if node and all(key.isdigit() for key in node):
+                return [node[key] for key in sorted(node, key=int)]
+        return node
+
+    return listify(root)
+
+
+def as_bool(value):
+    return str(value).lower() in ('true', '1')
+
+
+def error(status, message, code='resource_missing', error_type='invalid_request_error'):
+    return jsonify({'error': {'type': error_type, 'code': code, 'message': message}}), status
+
+
+def not_found(kind, object_id):
+    return error(404, f"No such {kind}: '{object_id}'")
+
+
+def get_object(kind, object_id):
+    with _lock:
+        return store(kind).get(object_id)
+
+
+def list_response(items, params, url):
+    limit = int(params.get('limit', 10))
+    # Stripe lists newest first
+    items = sorted(items, key=lambda item: (item['created'], item['id']), reverse=True)
+    starting_after = params.get('starting_after')
+    if starting_after:
+        ids = [item['id'] for item in items]
+        items = items[ids.index(starting_after) + 1:] if starting_after in ids else []
+    page = items[:limit]
+    return jsonify({'object': 'list', 'url': url, 'has_more': len(items) > limit, 'data': page})
+
+
+@app.before_request
+def simulate_stripe():
+    if request.path.startswith('/_fake'):
+        return None
+
+    path = '/'.join('{id}' if _ID_SEGMENT.match(segment) else segment for segment in request.path.split('/'))
+    with _lock:
+        label = f"{request.method} {path}"
+        request_counts[label] = request_counts.get(label, 0) + 1
+
+    delay_ms = config['latency_ms'] + random.uniform(0, config['jitter_ms'])
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000)
+
+    key = request.headers.get('Idempotency-Key')
+    if request.method == 'POST' and key:
+        with _lock:
+            replay = idempotent_responses.get(key)
+        if replay:
+            response = make_response(replay[1], replay[0])
+            response.headers['Content-Type'] = 'application/json'
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+    return None
+
+
+@app.after_request
+def remember_idempotent_response(response):
+    key = request.headers.get('Idempotency-Key')
+    if request.method == 'POST' and key and not request.path.startswith('/_fake') \
+            and response.status_code < 500 and 'Idempotent-Replayed' not in response.headers:
+        with _lock:
+            idempotent_responses[key] = (response.status_code, response.get_data())
+    response.headers['Request-Id'] = new_id('req')
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Webhooks
+# ---------------------------------------------------------------------------
+
+def sign_payload(payload, secret, timestamp=None):
+    timestamp = timestamp or int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def _deliver(url, payload):
+    for attempt in range(config['webhook_attempts']):
+        started = time.perf_counter()
+        try:
+            response = requests.post(url, data=payload, timeout=30, headers={
+                'Content-Type': 'application/json',
+                'Stripe-Signature': sign_payload(payload, config['webhook_secret'])
+            })
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if response.status_code < 300:
+                with _lock:
+                    webhook_stats['sent'] += 1
+                    webhook_stats['latencies_ms'].append(elapsed_ms)
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5 * (2 ** attempt))
+    with _lock:
+        webhook_stats['failed'] += 1
+
+
+def send_event(event_type, data_object):
+    event = {
+        'id': new_id('evt'),
+        'object': 'event',
+        'api_version': '2024-06-20',
+        'created': int(time.time()),
+        'livemode': False,
+        'type': event_type,
+        'data': {'object': data_object},
+        'pending_webhooks': len(config['webhook_urls']),
+    }
+    with _lock:
+        store('event')[event['id']] = event
+    payload = json.dumps(event)
+    for url in config['webhook_urls']:
+        _webhook_pool.submit(_deliver, url, payload)
+    return event
+
+
+# ---------------------------------------------------------------------------
+# Customers, products, prices
+# ---------------------------------------------------------------------------
+
+@app.post('/v1/customers')
+def create_customer():
+    params = parse_form(request.form)
+    customer = {
+        'id': new_id('cus'), 'object': 'customer', 'created': int(time.time()),
+        'email': params.get('email'), 'name': params.get('name'), 'phone': params.get('phone'),
+        'address': params.get('address'), 'metadata': params.get('metadata', {}), 'livemode': False,
+    }
+    with _lock:
+        store('customer')[customer['id']] = customer
+    return jsonify(customer)
+
+
+@app.get('/v1/customers/<customer_id>')
+def retrieve_customer(customer_id):
+    customer = get_object('customer', customer_id)
+    return jsonify(customer) if customer else not_found('customer', customer_id)
+
+
+@app.post('/v1/products')
+def create_product():
+    params = parse_form(request.form)
+    product_id = params.get('id') or new_id('prod')
+    with _lock:
+        if product_id in store('product'):
+            return error(400, f"Product already exists.", code='resource_already_exists')
+        product = {
+            'id': product_id, 'object': 'product', 'created': int(time.time()),
+            'name': params.get('name'), 'description': params.get('description'),
+            'active': as_bool(params.get('active', 'true')), 'metadata': params.get('metadata', {}),
+        }
+        store('product')[product_id] = product
+    return jsonify(product)
+
+
+@app.get('/v1/products/<product_id>')
+def retrieve_product(product_id):
+    product = get_object('product', product_id)
+    return jsonify(product) if product else not_found('product', product_id)
+
+
+@app.post('/v1/products/<product_id>')
+def update_product(product_id):
+    params = parse_form(request.form)
+    with _lock:
+        product = store('product').get(product_id)
+        if not product:
+            return not_found('product', product_id)
+        for field in ('name', 'description'):
+            if field in params:
+                product[field] = params[field]
+        if 'active' in params:
+            product['active'] = as_bool(params['active'])
+        product['metadata'].update(params.get('metadata', {}))
+    return jsonify(product)
+
+
+@app.get('/v1/products')
+def list_products():
+    params = parse_form(request.args)
+    with _lock:
+        items = list(store('product').values())
+    if 'active' in params:
+        items = [item for item in items if item['active'] == as_bool(params['active'])]
+    return list_response(items, params, '/v1/products')
+
+
+@app.post('/v1/prices')
+def create_price():
+    params = parse_form(request.form)
+    with _lock:
+        if params.get('product') not in store('product'):
+            return not_found('product', params.get('product'))
+        lookup_key = params.get('lookup_key')
+        if lookup_key:
+            holders = [price for price in store('price').values() if price['lookup_key'] == lookup_key]
+            if holders and not as_bool(params.get('transfer_lookup_key')):
+                return error(400, f"A price with lookup_key '{lookup_key}' already exists.",
+                             code='lookup_key_already_exists')
+            for price in holders:
+                price['lookup_key'] = None
+        recurring = params.get('recurring')
+        if recurring:
+            recurring = {'interval': recurring.get('interval', 'month'),
+                         'interval_count': int(recurring.get('interval_count', 1))}
+        price = {
+            'id': new_id('price'), 'object': 'price', 'created': int(time.time()),
+            'product': params['product'], 'unit_amount': int(params.get('unit_amount', 0)),
+            'currency': params.get('currency', 'gbp'), 'recurring': recurring,
+            'type': 'recurring' if recurring else 'one_time', 'lookup_key': lookup_key,
+            'active': True, 'metadata': params.get('metadata', {}),
+        }
+        store('price')[price['id']] = price
+    return jsonify(price)
+
+
+@app.get('/v1/prices/<price_id>')
+def retrieve_price(price_id):
+    price = get_object('price', price_id)
+    return jsonify(price) if price else not_found('price', price_id)
+
+
+@app.post('/v1/prices/<price_id>')
+def update_price(price_id):
+    params = parse_form(request.form)
+    with _lock:
+        price = store('price').get(price_id)
+        if not price:
+            return not_found('price', price_id)
+        if 'active' in params:
+            price['active'] = as_bool(params['active'])
+        if 'lookup_key' in params:
+            price['lookup_key'] = params['lookup_key'] or None
+        price['metadata'].update(params.get('metadata', {}))
+    return jsonify(price)
+
+
+@app.get('/v1/prices')
+def list_prices():
+    params = parse_form(request.args)
+    with _lock:
+        items = list(store('price').values())
+    if 'active' in params:
+        items = [item for item in items if item['active'] == as_bool(params['active'])]
+    if 'product' in params:
+        items = [item for item in items if item['product'] == params['product']]
+    if 'lookup_keys' in params:
+        keys = set(params['lookup_keys'] if isinstance(params['lookup_keys'], list) else [params['lookup_keys']])
+        items = [item for item in items if item['lookup_key'] in keys]
+    return list_response(items, params, '/v1/prices')
+
+
+# ---------------------------------------------------------------------------
+# Checkout sessions and subscriptions
+# ---------------------------------------------------------------------------
+
+def _customer_details(customer_id):
+    customer = store('customer').get(customer_id) or {}
+    return {'email': customer.get('email'), 'name': customer.get('name'), 'phone': customer.get('phone')}
+
+
+@app.post('/v1/checkout/sessions')
+def create_checkout_session():
+    params = parse_form(request.form)
+    line_items = params.get('line_items') or []
+    with _lock:
+        prices = [store('price').get(item.get('price')) for item in line_items]
+        if not line_items or None in prices:
+            return error(400, 'Invalid line_items', code='parameter_invalid')
+        session_id = f"cs_test_{secrets.token_hex(16)}"
+        session = {
+            'id': session_id, 'object': 'checkout.session', 'created': int(time.time()),
+            'mode': params.get('mode', 'payment'), 'customer': params.get('customer'),
+            'customer_details': _customer_details(params.get('customer')),
+            'amount_total': sum(price['unit_amount'] * int(item.get('quantity', 1))
+                                for price, item in zip(prices, line_items)),
+            'currency': prices[0]['currency'], 'metadata': params.get('metadata', {}),
+            'payment_status': 'unpaid', 'status': 'open', 'subscription': None,
+            'success_url': params.get('success_url'), 'cancel_url': params.get('cancel_url'),
+            'url': f"https://checkout.stripe.com/c/pay/{session_id}",
+            'line_items_prices': [price['id'] for price in prices],
+        }
+        store('checkout.session')[session_id] = session
+    return jsonify(session)
+
+
+@app.get('/v1/checkout/sessions/<session_id>')
+def retrieve_checkout_session(session_id):
+    session = get_object('checkout.session', session_id)
+    return jsonify(session) if session else not_found('checkout session', session_id)
+
+
+def _new_subscription(customer_id, price_ids, metadata):
+    now = int(time.time())
+    price = store('price')[price_ids[0]]
+    interval = (price.get('recurring') or {}).get('interval', 'month')
+    period = {'day': 86400, 'week': 7 * 86400, 'month': 30 * 86400, 'year': 365 * 86400}[interval]
+    period *= (price.get('recurring') or {}).get('interval_count', 1)
+    subscription = {
+        'id': new_id('sub'), 'object': 'subscription', 'created': now, 'customer': customer_id,
+        'status': 'active', 'cancel_at_period_end': False, 'canceled_at': None,
+        'current_period_start': now, 'current_period_end': now + period,
+        'items': {'object': 'list', 'data': [
+            {'id': new_id('si'), 'object': 'subscription_item', 'price': store('price')[price_id]}
+            for price_id in price_ids
+        ]},
+        'latest_invoice': new_id('in'), 'metadata': metadata or {},
+    }
+    store('subscription')[subscription['id']] = subscription
+    return subscription
+
+
+@app.post('/v1/subscriptions')
+def create_subscription():
+    params = parse_form(request.form)
+    with _lock:
+        price_ids = [item.get('price') for item in params.get('items') or []]
+        if not price_ids or any(price_id not in store('price') for price_id in price_ids):
+            return error(400, 'Invalid items', code='parameter_invalid')
+        subscription = _new_subscription(params.get('customer'), price_ids, params.get('metadata'))
+        subscription['status'] = 'incomplete'
+        response = dict(subscription)
+        # Mimic expand=['latest_invoice.payment_intent']
+        response['latest_invoice'] = {
+            'id': subscription['latest_invoice'], 'object': 'invoice',
+            'payment_intent': {'id': new_id('pi'), 'object': 'payment_intent',
+                               'client_secret': f"{new_id('pi')}_secret_{secrets.token_hex(8)}"}
+        }
+    return jsonify(response)
+
+
+@app.get('/v1/subscriptions/<subscription_id>')
+def retrieve_subscription(subscription_id):
+    subscription = get_object('subscription', subscription_id)
+    if not subscription:
+        return not_found('subscription', subscription_id)
+    response = dict(subscription)
+    if 'latest_invoice' in (parse_form(request.args).get('expand') or []):
+        response['latest_invoice'] = get_object('invoice', subscription['latest_invoice']) or subscription['latest_invoice']
+    return jsonify(response)
+
+
+@app.get('/v1/subscriptions')
+def list_subscriptions():
+    params = parse_form(request.args)
+    with _lock:
+        items = list(store('subscription').values())
+    status = params.get('status')
+    if status is None:
+        items = [item for item in items if item['status'] != 'canceled']
+    elif status != 'all':
+        items = [item for item in items if item['status'] == status]
+    if 'customer' in params:
+        items = [item for item in items if item['customer'] == params['customer']]
+    return list_response(items, params, '/v1/subscriptions')
+
+
+@app.post('/v1/subscriptions/<subscription_id>')
+def update_subscription(subscription_id):
+    params = parse_form(request.form)
+    with _lock:
+        subscription = store('subscription').get(subscription_id)
+        if not subscription:
+            return not_found('subscription', subscription_id)
+        if 'cancel_at_period_end' in params:
+            subscription['cancel_at_period_end'] = as_bool(params['cancel_at_period_end'])
+        subscription['metadata'].update(params.get('metadata', {}))
+    send_event('customer.subscription.updated', subscription)
+    return jsonify(subscription)
+
+
+@app.delete('/v1/subscriptions/<subscription_id>')
+def cancel_subscription(subscription_id):
+    with _lock:
+        subscription = store('subscription').get(subscription_id)
+        if not subscription:
+            return not_found('subscription', subscription_id)
+        subscription['status'] = 'canceled'
+        subscription['canceled_at'] = int(time.time())
+    send_event('customer.subscription.deleted', subscription)
+    return jsonify(subscription)
+
+
+@app.get('/v1/invoices')
+def list_invoices():
+    params = parse_form(request.args)
+    with _lock:
+        items = list(store('invoice').values())
+    created = params.get('created')
+    if isinstance(created, dict) and 'gte' in created:
+        items = [item for item in items if item['created'] >= int(created['gte'])]
+    for key in ('customer', 'subscription', 'status'):
+        if key in params:
+            items = [item for item in items if item[key] == params[key]]
+    return list_response(items, params, '/v1/invoices')
+
+
+# ---------------------------------------------------------------------------
+# Payment intents
+# ---------------------------------------------------------------------------
+
+@app.post('/v1/payment_intents')
+def create_payment_intent():
+    params = parse_form(request.form)
+    intent_id = new_id('pi')
+    intent = {
+        'id': intent_id, 'object': 'payment_intent', 'created': int(time.time()),
+        'amount': int(params.get('amount', 0)), 'currency': params.get('currency', 'gbp'),
+        'description': params.get('description'), 'metadata': params.get('metadata', {}),
+        'status': 'requires_payment_method', 'client_secret': f"{intent_id}_secret_{secrets.token_hex(8)}",
+    }
+    with _lock:
+        store('payment_intent')[intent_id] = intent
+    return jsonify(intent)
+
+
+@app.get('/v1/payment_intents/<intent_id>')
+def retrieve_payment_intent(intent_id):
+    intent = get_object('payment_intent', intent_id)
+    return jsonify(intent) if intent else not_found('payment_intent', intent_id)
+
+
+@app.post('/v1/payment_intents/<intent_id>/confirm')
+def confirm_payment_intent(intent_id):
+    with _lock:
+        intent = store('payment_intent').get(intent_id)
+        if not intent:
+            return not_found('payment_intent', intent_id)
+        intent['status'] = 'succeeded'
+    send_event('payment_intent.succeeded', intent)
+    return jsonify(intent)
+
+
+# ---------------------------------------------------------------------------
+# Test-only endpoints
+# ---------------------------------------------------------------------------
+
+@app.post('/_fake/checkout/sessions/<session_id>/complete')
+def complete_checkout_session(session_id):
+    """Simulate the customer paying on the hosted checkout page"""
+    with _lock:
+        session = store('checkout.session').get(session_id)
+        if not session:
+            return not_found('checkout session', session_id)
+        if session['status'] != 'complete':
+            subscription = _new_subscription(session['customer'], session['line_items_prices'], session['metadata'])
+            session.update({'status': 'complete', 'payment_status': 'paid', 'subscription': subscription['id']})
+        session_payload = dict(session)
+        subscription = store('subscription')[session['subscription']]
+        invoice = store('invoice').setdefault(subscription['latest_invoice'], {
+            'id': subscription['latest_invoice'], 'object': 'invoice', 'created': int(time.time()),
+            'customer': subscription['customer'], 'subscription': subscription['id'],
+            'amount_due': session_payload['amount_total'], 'amount_paid': session_payload['amount_total'],
+            'currency': session_payload['currency'], 'status': 'paid', 'paid': True, 'attempted': True,
+        })
+
+    event = send_event('checkout.session.completed', session_payload)
+    send_event('invoice.payment_succeeded', invoice)
+    return jsonify({'session': session_payload, 'event_id': event['id']})
+
+
+@app.get('/_fake/stats')
+def stats():
+    with _lock:
+        latencies = sorted(webhook_stats['latencies_ms'])
+        return jsonify({
+            'objects': {kind: len(items) for kind, items in objects.items()},
+            'requests': dict(sorted(request_counts.items())),
+            'webhooks': {
+                'sent': webhook_stats['sent'],
+                'failed': webhook_stats['failed'],
+                'p50_ms': round(latencies[len(latencies) // 2], 2) if latencies else None,
+                'max_ms': round(latencies[-1], 2) if latencies else None,
+            }
+        })
+
+
+@app.post('/_fake/reset')
+def reset():
+    with _lock:
+        objects.clear()
+        idempotent_responses.clear()
+        request_counts.clear()
+        webhook_stats.update({'sent': 0, 'failed': 0, 'latencies_ms': []})
+    return jsonify({'success': True})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Stripe API stand-in for load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Added to every API call')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Random extra latency, 0..N ms')
+    parser.add_argument('--webhook-url', action='append', default=[], help='Webhook endpoint (repeatable)')
+    parser.add_argument('--webhook-secret', default='whsec_fake')
+    args = parser.parse_args()
+
+    config.update({
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'webhook_urls': args.webhook_url,
+        'webhook_secret': args.webhook_secret,
+    })
+    print(f"Fake Stripe listening on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms}ms, webhooks -> {args.webhook_url or 'none'})")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,14 +2,29 @@
 """
 Stripe Product Setup Script for Infinite Carwash Subscription System
 This script creates the subscription products and pricing plans in your new Stripe account.
+
+Modes:
+  sync (default)  Diff the local plan catalog against Stripe and create or update only
+                  what differs. Safe to rerun; an up-to-date account is a no-op. Prices and
+                  products no longer in the catalog are only archived with --prune.
+  create          Legacy behaviour: create every product and price again.
+
+Usage:
+  python setup_stripe_products.py --dry-run
+  python setup_stripe_products.py --concurrency 8
+  python setup_stripe_products.py --prune
 """
 
+import argparse
+import time
 import stripe
-import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from decimal import Decimal
+from src.services.stripe_client import configure_stripe, idempotency_key
 
-# Set your Stripe secret key from environment variable
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+# Set your Stripe secret key and the shared pooled HTTP client from environment variables
+configure_stripe()
 
 if not stripe.api_key:
     print("❌ Error: STRIPE_SECRET_KEY environment variable is not set.")
@@ -234,7 +249,213 @@ def create_subscription_products():
         print(f"❌ Error: {e}")
         return None
 
+def build_local_catalog():
+    """Products and prices the checkout catalog expects, keyed by product id and lookup_key"""
+    from src.services.subscription_service import DEFAULT_SUBSCRIPTION_PLANS
+    from src.services.pricing_engine import PriceMatrix, VEHICLE_TYPES, FREQUENCIES
+    from src.services.stripe_catalog import StripeCatalog
+    from src.services.stripe_service import stripe_service
+
+    plans = [SimpleNamespace(is_active=True, **plan) for plan in DEFAULT_SUBSCRIPTION_PLANS]
+    matrix = PriceMatrix(plans)
+
+    products = {}
+    prices = {}
+    for plan_index, plan in enumerate(plans):
+        product_id = StripeCatalog.product_id(plan.service_type)
+        products[product_id] = {
+            'id': product_id,
+            'name': plan.name,
+            'description': plan.description,
+            'metadata': {'service_type': plan.service_type, 'business': 'infinite_carwash'}
+        }
+
+        for vehicle_type in plan.vehicle_types:
+            for frequency in plan.frequency_options:
+                amount = int(matrix.interval_pence[plan_index, VEHICLE_TYPES.index(vehicle_type),
+                                                   FREQUENCIES.index(frequency)])
+                interval, interval_count = stripe_service.get_stripe_interval(frequency)
+                lookup_key = StripeCatalog.lookup_key(plan.service_type, vehicle_type, frequency, amount)
+                prices[lookup_key] = {
+                    'product': product_id,
+                    'unit_amount': amount,
+                    'currency': 'gbp',
+                    'recurring': {'interval': interval, 'interval_count': interval_count},
+                    'lookup_key': lookup_key,
+                    'metadata': {
+                        'service_type': plan.service_type,
+                        'vehicle_type': vehicle_type,
+                        'frequency': frequency
+                    }
+                }
+
+    return products, prices
+
+
+def fetch_remote_catalog():
+    """Our products (imc_ ids) and active prices (imc_ lookup keys) currently in Stripe"""
+    from src.services.stripe_catalog import LOOKUP_KEY_PREFIX
+
+    prefix = f"{LOOKUP_KEY_PREFIX}_"
+    products = {
+        product.id: product
+        for product in stripe.Product.list(limit=100).auto_paging_iter()
+        if product.id.startswith(prefix)
+    }
+    prices = {}
+    for price in stripe.Price.list(active=True, limit=100).auto_paging_iter():
+        if (price.get('lookup_key') or '').startswith(prefix) or price.get('product') in products:
+            prices[price.id] = price
+    return products, prices
+
+
+def plan_sync(local_products, local_prices, remote_products, remote_prices, prune=False):
+    """Work needed to make Stripe match the local catalog.
+
+    Archiving is opt-in: a running app may still hold the old price ids in its
+    catalog cache, so stale prices and products are only archived with ``prune``.
+    """
+    actions = {'create_product': [], 'update_product': [], 'create_price': [],
+               'archive_price': [], 'archive_product': []}
+
+    for product_id, wanted in local_products.items():
+        existing = remote_products.get(product_id)
+        if existing is None:
+            actions['create_product'].append(wanted)
+        elif (not existing.active or existing.name != wanted['name']
+              or (existing.description or '') != (wanted['description'] or '')):
+            actions['update_product'].append(wanted)
+
+    remote_by_key = {price.get('lookup_key'): price for price in remote_prices.values() if price.get('lookup_key')}
+    for lookup_key, wanted in local_prices.items():
+        existing = remote_by_key.get(lookup_key)
+        if existing is None or existing.get('product') != wanted['product'] \
+                or existing.get('unit_amount') != wanted['unit_amount'] \
+                or (existing.get('recurring') or {}).get('interval') != wanted['recurring']['interval'] \
+                or (existing.get('recurring') or {}).get('interval_count') != wanted['recurring']['interval_count']:
+            actions['create_price'].append(wanted)
+
+    if not prune:
+        return actions
+
+    replaced_keys = {wanted['lookup_key'] for wanted in actions['create_price']}
+    for price in remote_prices.values():
+        lookup_key = price.get('lookup_key')
+        if lookup_key not in local_prices or lookup_key in replaced_keys:
+            actions['archive_price'].append(price)
+
+    for product_id, product in remote_products.items():
+        if product_id not in local_products and product.active:
+            actions['archive_product'].append(product)
+
+    return actions
+
+
+def _create_product(wanted):
+    return stripe.Product.create(idempotency_key=idempotency_key('product', wanted['id']), **wanted)
+
+
+def _update_product(wanted):
+    return stripe.Product.modify(wanted['id'], active=True, name=wanted['name'],
+                                 description=wanted['description'], metadata=wanted['metadata'])
+
+
+def _create_price(wanted):
+    # transfer_lookup_key moves the key off an old price with a different amount or interval
+    return stripe.Price.create(idempotency_key=idempotency_key('price', wanted['lookup_key']),
+                               transfer_lookup_key=True, **wanted)
+
+
+def _archive_price(price):
+    return stripe.Price.modify(price.id, active=False)
+
+
+def _archive_product(product):
+    return stripe.Product.modify(product.id, active=False)
+
+
+def sync_subscription_products(dry_run=False, concurrency=8, prune=False):
+    """Create, update (and with ``prune`` archive) only the Stripe objects that differ from the local catalog"""
+    started = time.perf_counter()
+    print("🔄 Syncing Stripe catalog with local subscription plans...")
+
+    local_products, local_prices = build_local_catalog()
+    remote_products, remote_prices = fetch_remote_catalog()
+    actions = plan_sync(local_products, local_prices, remote_products, remote_prices, prune=prune)
+
+    print(f"\n📋 Sync plan ({len(local_products)} products / {len(local_prices)} prices wanted, "
+          f"{len(remote_products)} / {len(remote_prices)} found in Stripe):")
+    labels = {
+        'create_product': lambda item: item['id'],
+        'update_product': lambda item: item['id'],
+        'create_price': lambda item: f"{item['lookup_key']} (£{item['unit_amount'] / 100:.2f}/{item['recurring']['interval']})",
+        'archive_price': lambda item: f"{item.id} ({item.get('lookup_key')})",
+        'archive_product': lambda item: item.id,
+    }
+    for action, items in actions.items():
+        print(f"  • {action}: {len(items)}")
+        for item in items:
+            print(f"    - {labels[action](item)}")
+
+    total = sum(len(items) for items in actions.values())
+    if total == 0:
+        print(f"\n✅ Stripe catalog already up to date ({time.perf_counter() - started:.2f}s)")
+        return actions
+    if dry_run:
+        print("\n🔍 Dry run - no changes made")
+        return actions
+
+    failures = []
+
+    def run_phase(func, items):
+        if not items:
+            return
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for item, error in zip(items, executor.map(_safe(func), items)):
+                if error:
+                    failures.append((func.__name__.lstrip('_'), item, error))
+
+    # Products first - new prices need them; archive last so nothing points at a dead product mid-sync
+    run_phase(_create_product, actions['create_product'])
+    run_phase(_update_product, actions['update_product'])
+    run_phase(_create_price, actions['create_price'])
+    run_phase(_archive_price, actions['archive_price'])
+    run_phase(_archive_product, actions['archive_product'])
+
+    print(f"\n{'⚠️' if failures else '✅'} Applied {total - len(failures)}/{total} changes "
+          f"in {time.perf_counter() - started:.2f}s")
+    for action, item, error in failures:
+        print(f"  ❌ {action} failed: {error}")
+    return actions
+
+
+def _safe(func):
+    def wrapper(item):
+        try:
+            func(item)
+            return None
+        except stripe.error.StripeError as e:
+            return str(e)
+    return wrapper
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Set up Infinite Carwash subscription products in Stripe')
+    parser.add_argument('--mode', choices=['sync', 'create'], default='sync',
+                        help='sync: apply only the differences (default); create: legacy full create')
+    parser.add_argument('--dry-run', action='store_true', help='Print the sync plan without changing Stripe')
+    parser.add_argument('--concurrency', type=int, default=8, help='Parallel Stripe requests during sync')
+    parser.add_argument('--prune', action='store_true',
+                        help='Also archive prices and products that are no longer in the local catalog')
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.mode == 'sync':
+        sync_subscription_products(dry_run=args.dry_run, concurrency=args.concurrency, prune=args.prune)
+        exit(0)
+
     products = create_subscription_products()
     if products:
         print("\n🎉 Stripe setup complete! Your subscription system is ready to accept payments.")
@@ -6,11 +6,15 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from flask import Flask, request, make_response, jsonify
 from flask_cors import CORS
 from src.models.user import db
-from src.models.driver import Driver  # Import driver model to ensure table creation
+from src.models.driver import Driver, DriverLocationHistory  # Import driver models to ensure table creation
 from src.models.booking import Booking  # Import booking model to ensure table creation
 from src.models.customer import Customer  # Import customer model to ensure table creation
 from src.models.subscription_plan import SubscriptionPlan, CustomerSubscription, SubscriptionService  # Import subscription models
 from src.models.notification import ServiceNotification, LiveNotification  # Import notification models
+from src.models.stripe_event import StripeWebhookEvent  # Import webhook inbox model
+from src.models.stripe_customer import StripeCustomer  # Import Stripe customer mapping model
+from src.models.id_sequence import IdSequence  # Import ID sequence model
+from src.models.schema import upgrade_schema
 from src.routes.user import user_bp
 from src.routes.booking import booking_bp
 from src.routes.subscription import subscription_bp
@@ -21,8 +25,12 @@ from src.routes.payment import payment_bp
 from src.routes.admin import admin_bp
 from src.routes.stripe_routes import stripe_bp
 from src.routes.stripe_session_routes import stripe_session_bp
+from src.routes.export import export_bp
 from src.services.subscription_service import SubscriptionService
 from src.services.notification_scheduler import notification_scheduler
+from src.services.webhook_processor import webhook_processor
+from src.services.location_store import location_store
+from src.services.loyalty_engine import loyalty_engine
 from datetime import timedelta
 
 app = Flask(__name__)
@@ -55,6 +63,7 @@ app.register_blueprint(payment_bp, url_prefix='/api/payment')
 app.register_blueprint(admin_bp, url_prefix='/api')
 app.register_blueprint(stripe_bp, url_prefix='/api/stripe')
 app.register_blueprint(stripe_session_bp, url_prefix='/api/stripe')
+app.register_blueprint(export_bp, url_prefix='/api')
 
 # uncomment if you need to use database
 # Use /var/data for production (Render), local directory for development
@@ -71,10 +80,22 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 with app.app_context():
     db.create_all()
+    # Add columns introduced since the database was created
+    upgrade_schema()
     # Force reinitialize subscription plans on startup to ensure latest pricing
     SubscriptionService.initialize_subscription_plans(force_reinitialize=True)
-    # Start notification scheduler
-    notification_scheduler.start()
+
+# Start notification scheduler
+notification_scheduler.start(app)
+
+# Start background processing of queued Stripe webhook events
+webhook_processor.start(app)
+
+# Start batched write-back of driver GPS pings
+location_store.start(app)
+
+# Start background sending of loyalty reward emails
+loyalty_engine.start(app)
 
 @app.route('/')
 def health_check():
@@ -17,6 +17,7 @@ class Booking(db.Model):
     vehicle_type = db.Column(db.String(50), nullable=False)
     service_type = db.Column(db.String(100), nullable=False)
     service_location = db.Column(db.String(255), nullable=False)
+    address = db.Column(db.Text)
     service_date = db.Column(db.Date, nullable=False)
     service_time = db.Column(db.String(10), nullable=False)
     
@@ -64,6 +65,7 @@ class Booking(db.Model):
                 'vehicle_type': self.vehicle_type,
                 'service_type': self.service_type,
                 'location': self.service_location,
+                'address': self.address,
                 'date': self.service_date.isoformat() if self.service_date else None,
                 'time': self.service_time
             },
@@ -87,11 +89,8 @@ class Booking(db.Model):
     @staticmethod
     def generate_booking_id():
         """Generate unique booking ID"""
-        import random
-        import string
-        year = datetime.now().year
-        random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=3))
-        return f"IMC-{year}-{random_part}"
+        from src.services.id_generator import id_generator
+        return id_generator.next_id('IMC')
     
     def __repr__(self):
         return f'<Booking {self.booking_id} - {self.customer_name}>'
@@ -98,54 +98,27 @@ class Customer(db.Model):
     
     def check_loyalty_rewards(self):
         """Check if customer is eligible for new rewards"""
-        rewards_earned = []
-        
-        # Check for free wash (every 5 completed bookings)
-        if self.completed_bookings > 0 and self.completed_bookings % 5 == 0:
-            if self.free_washes_earned < (self.completed_bookings // 5):
-                self.free_washes_earned = self.completed_bookings // 5
-                rewards_earned.append('free_wash')
+        from src.services.loyalty_engine import LOYALTY_RULES, earned_rewards
         
-        # Check for 15% discount (every 10 completed bookings)
-        if self.completed_bookings > 0 and self.completed_bookings % 10 == 0:
-            if self.discount_15_earned < (self.completed_bookings // 10):
-                self.discount_15_earned = self.completed_bookings // 10
-                rewards_earned.append('15_percent_discount')
+        earned = {rule.earned_column: getattr(self, rule.earned_column) for rule in LOYALTY_RULES}
+        rewards_earned = []
+        for rule, target in earned_rewards(self.completed_bookings, earned):
+            setattr(self, rule.earned_column, target)
+            rewards_earned.append(rule.reward)
         
         return rewards_earned
     
     def get_available_rewards(self):
         """Get list of available unused rewards"""
-        rewards = []
-        
-        # Available free washes
-        free_washes_available = self.free_washes_earned - self.free_washes_used
-        if free_washes_available > 0:
-            rewards.append({
-                'type': 'free_wash',
-                'count': free_washes_available,
-                'description': f'{free_washes_available} Free Wash{"es" if free_washes_available > 1 else ""} Available'
-            })
-        
-        # Available 15% discounts
-        discounts_available = self.discount_15_earned - self.discount_15_used
-        if discounts_available > 0:
-            rewards.append({
-                'type': '15_percent_discount',
-                'count': discounts_available,
-                'description': f'{discounts_available} 15% Discount{"s" if discounts_available > 1 else ""} Available'
-            })
+        from src.services.loyalty_engine import available_rewards
         
-        return rewards
+        return available_rewards(self)
     
     @staticmethod
     def generate_customer_id():
         """Generate unique customer ID"""
-        import random
-        import string
-        year = datetime.now().year
-        random_part = ''.join(random.choices(string.digits, k=4))
-        return f"CUST-{year}-{random_part}"
+        from src.services.id_generator import id_generator
+        return id_generator.next_id('CUST')
     
     def __repr__(self):
         return f'<Customer {self.name} ({self.customer_id})>'
@@ -31,6 +31,19 @@ class Driver(db.Model):
     
     def to_dict(self):
         """Convert driver object to dictionary"""
+        from src.services.location_store import location_store
+        
+        # GPS pings are written back in batches - prefer the newest one
+        latest = location_store.get(self.id)
+        if latest:
+            location = {'lat': latest['lat'], 'lng': latest['lng'], 'address': latest['address']}
+        else:
+            location = {
+                'lat': self.current_location_lat,
+                'lng': self.current_location_lng,
+                'address': self.current_location_address
+            }
+        
         return {
             'id': self.id,
             'driver_id': self.driver_id,
@@ -44,11 +57,7 @@ class Driver(db.Model):
             'status': self.status,
             'rating': self.rating,
             'total_services': self.total_services,
-            'current_location': {
-                'lat': self.current_location_lat,
-                'lng': self.current_location_lng,
-                'address': self.current_location_address
-            },
+            'current_location': location,
             'availability': {
                 'start': self.availability_start,
                 'end': self.availability_end,
@@ -64,12 +73,32 @@ class Driver(db.Model):
     @staticmethod
     def generate_driver_id():
         """Generate unique driver ID"""
-        import random
-        import string
-        year = datetime.now().year
-        random_part = ''.join(random.choices(string.digits, k=4))
-        return f"DRV-{year}-{random_part}"
+        from src.services.id_generator import id_generator
+        return id_generator.next_id('DRV')
     
     def __repr__(self):
         return f'<Driver {self.name} ({self.driver_id})>'
 
+
+
+class DriverLocationHistory(db.Model):
+    """Append-only, downsampled trail of driver GPS positions"""
+    __tablename__ = 'driver_location_history'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    driver_id = db.Column(db.String(36), nullable=False)  # Driver.id
+    lat = db.Column(db.Float, nullable=False)
+    lng = db.Column(db.Float, nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_driver_location_history_driver_time', 'driver_id', 'recorded_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'driver_id': self.driver_id,
+            'lat': self.lat,
+            'lng': self.lng,
+            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None
+        }
@@ -0,0 +1,14 @@
+from src.models.user import db
+from datetime import datetime
+
+class IdSequence(db.Model):
+    """Counter behind one family of business IDs, e.g. 'IMC-2026'"""
+    __tablename__ = 'id_sequences'
+
+    name = db.Column(db.String(40), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)  # First number not yet handed to any process
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<IdSequence {self.name} next={self.next_value}>'
@@ -36,6 +36,10 @@ class ServiceNotification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_service_notifications_subscription_send_time', 'subscription_id', 'scheduled_send_time'),
+    )
+    
     @staticmethod
     def generate_notification_id():
         return f"NOT_{datetime.now().strftime('%Y%m%d')}_{str(uuid.uuid4())[:8].upper()}"
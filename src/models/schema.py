@@ -0,0 +1,53 @@
+import logging
+
+from sqlalchemy import inspect, text
+
+from src.models.user import db
+
+logger = logging.getLogger(__name__)
+
+
+def _default_clause(column):
+    default = column.default
+    if default is None or not default.is_scalar:
+        return ''
+    value = default.arg
+    if isinstance(value, bool):
+        return f" DEFAULT {1 if value else 0}"
+    if isinstance(value, (int, float)):
+        return f" DEFAULT {value}"
+    if isinstance(value, str):
+        return " DEFAULT '{}'".format(value.replace("'", "''"))
+    return ''
+
+
+def upgrade_schema():
+    """Add model columns and indexes that db.create_all() doesn't add to existing tables.
+
+    Only additive changes: new nullable (or defaulted) columns and missing indexes.
+    Call after db.create_all() inside an app context.
+    """
+    inspector = inspect(db.engine)
+    added = []
+
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}{_default_clause(column)}'
+                ))
+                added.append(f"{table.name}.{column.name}")
+
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+    if added:
+        logger.info(f"Schema upgraded, added columns: {', '.join(added)}")
+    return added
@@ -0,0 +1,30 @@
+from src.models.user import db
+from datetime import datetime
+
+class StripeCustomer(db.Model):
+    __tablename__ = 'stripe_customers'
+
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), unique=True, nullable=False)  # Stored lower-cased
+    stripe_customer_id = db.Column(db.String(255), unique=True, nullable=False)
+    name = db.Column(db.String(100))
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @staticmethod
+    def normalize_email(email):
+        return (email or '').strip().lower()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'email': self.email,
+            'stripe_customer_id': self.stripe_customer_id,
+            'name': self.name,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<StripeCustomer {self.email} ({self.stripe_customer_id})>'
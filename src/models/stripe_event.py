@@ -0,0 +1,39 @@
+from src.models.user import db
+from datetime import datetime
+
+class StripeWebhookEvent(db.Model):
+    __tablename__ = 'stripe_webhook_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(255), unique=True, nullable=False)  # Stripe event id - deduplication key
+    event_type = db.Column(db.String(100), nullable=False)
+    ordering_key = db.Column(db.String(255), index=True)  # Stripe customer id - events are processed in order per key
+    payload = db.Column(db.Text, nullable=False)  # Verified event JSON
+
+    # Processing state
+    status = db.Column(db.String(20), default='pending', index=True)  # 'pending', 'processing', 'processed', 'failed'
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+
+    # Timestamps
+    stripe_created = db.Column(db.Integer)  # Event creation time reported by Stripe (unix)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_id': self.event_id,
+            'event_type': self.event_type,
+            'ordering_key': self.ordering_key,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'stripe_created': self.stripe_created,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
+
+    def __repr__(self):
+        return f'<StripeWebhookEvent {self.event_id} ({self.event_type}) - {self.status}>'
@@ -29,67 +29,8 @@ class SubscriptionPlan(db.Model):
     
     def calculate_subscription_price(self, frequency, vehicle_type):
         """Calculate monthly subscription price based on frequency and vehicle type"""
-        base = self.base_price
-        
-        # Vehicle type multipliers - Updated for Home Base pricing structure
-        if self.service_type == 'mini_valet':
-            vehicle_multipliers = {
-                'small_car': 1.0,      # £35 base
-                'medium_car': 1.43,    # £50 (50/35)
-                'large_car': 1.71,     # £60 (60/35)
-                'van': 2.14            # £75 (75/35)
-            }
-        elif self.service_type == 'full_valet':
-            vehicle_multipliers = {
-                'small_car': 1.0,      # £80 base
-                'medium_car': 1.25,    # £100 (100/80)
-                'large_car': 1.56,     # £125 (125/80)
-                'van': 1.75            # £140 (140/80)
-            }
-        elif self.service_type == 'interior_detailing':
-            vehicle_multipliers = {
-                'small_car': 1.0,      # £140 base (same for all)
-                'medium_car': 1.0,
-                'large_car': 1.0,
-                'van': 1.0
-            }
-        elif self.service_type == 'stage1_polishing':
-            vehicle_multipliers = {
-                'small_car': 1.0,      # £450 base (same for all)
-                'medium_car': 1.0,
-                'large_car': 1.0,
-                'van': 1.0
-            }
-        elif self.service_type == 'stage2_polishing':
-            vehicle_multipliers = {
-                'small_car': 1.0,      # £650 base (same for all)
-                'medium_car': 1.0,
-                'large_car': 1.0,
-                'van': 1.0
-            }
-        else:
-            # Default multipliers for other services
-            vehicle_multipliers = {
-                'small_car': 1.0,
-                'medium_car': 1.0,
-                'large_car': 1.0,
-                'van': 1.0
-            }
-        
-        # Frequency multipliers (monthly base)
-        frequency_multipliers = {
-            'weekly': 4.0,      # 4 services per month
-            'bi_weekly': 2.0,   # 2 services per month  
-            'monthly': 1.0      # 1 service per month
-        }
-        
-        vehicle_mult = vehicle_multipliers.get(vehicle_type, 1.0)
-        freq_mult = frequency_multipliers.get(frequency, 1.0)
-        
-        # Apply discount for higher frequency
-        discount = 0.85 if frequency == 'weekly' else 0.9 if frequency == 'bi_weekly' else 1.0
-        
-        return round(base * vehicle_mult * freq_mult * discount, 2)
+        from src.services.pricing_engine import pricing_engine
+        return pricing_engine.quote(self.service_type, vehicle_type, frequency, base_price=self.base_price) / 100
     
     def to_dict(self):
         return {
@@ -143,6 +84,22 @@ class CustomerSubscription(db.Model):
     next_service_date = db.Column(db.Date)
     last_service_date = db.Column(db.Date)
     
+    # Stripe mirror - maintained from webhooks, see src/services/subscription_mirror.py
+    stripe_subscription_id = db.Column(db.String(255), unique=True, index=True)
+    stripe_checkout_session_id = db.Column(db.String(255), index=True)  # Checkout that created the row
+    stripe_status = db.Column(db.String(30))  # Raw Stripe status: 'active', 'past_due', 'canceled', ...
+    current_period_start = db.Column(db.DateTime)
+    current_period_end = db.Column(db.DateTime)
+    cancel_at_period_end = db.Column(db.Boolean, default=False)
+    canceled_at = db.Column(db.DateTime)
+    last_invoice_id = db.Column(db.String(255))
+    last_invoice_status = db.Column(db.String(30))  # 'paid', 'open', 'payment_failed', ...
+    last_invoice_amount = db.Column(db.Float)
+    last_invoice_at = db.Column(db.DateTime)
+    stripe_event_created = db.Column(db.Integer)  # Created time of the newest subscription event applied (unix)
+    last_invoice_event_created = db.Column(db.Integer)  # Created time of the newest invoice event applied (unix)
+    stripe_synced_at = db.Column(db.DateTime)
+    
     # Special requests
     special_requests = db.Column(db.Text)
     
@@ -165,19 +122,12 @@ class CustomerSubscription(db.Model):
     
     def calculate_next_service_date(self):
         """Calculate the next service date based on frequency"""
-        from datetime import timedelta
+        from src.services.visit_schedule import next_series_date
         
         if not self.last_service_date:
             return self.start_date
         
-        if self.frequency == 'weekly':
-            return self.last_service_date + timedelta(weeks=1)
-        elif self.frequency == 'bi_weekly':
-            return self.last_service_date + timedelta(weeks=2)
-        elif self.frequency == 'monthly':
-            return self.last_service_date + timedelta(days=30)
-        else:
-            return self.last_service_date + timedelta(weeks=1)
+        return next_series_date(self.frequency, self.preferred_day, self.start_date, after=self.last_service_date)
     
     def to_dict(self):
         return {
@@ -206,6 +156,10 @@ class CustomerSubscription(db.Model):
             'notification_email': self.notification_email,
             'notification_sms': self.notification_sms,
             'notification_days_ahead': self.notification_days_ahead,
+            'stripe_subscription_id': self.stripe_subscription_id,
+            'stripe_status': self.stripe_status,
+            'current_period_end': self.current_period_end.isoformat() if self.current_period_end else None,
+            'cancel_at_period_end': self.cancel_at_period_end,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
@@ -235,6 +189,10 @@ class SubscriptionService(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_subscription_services_subscription_date', 'subscription_id', 'scheduled_date'),
+    )
+    
     @staticmethod
     def generate_service_id():
         return f"SRV_{datetime.now().strftime('%Y%m%d')}_{str(uuid.uuid4())[:6].upper()}"
@@ -5,6 +5,8 @@ from src.models.booking import Booking
 from src.models.customer import Customer
 from src.models.driver import Driver
 from src.routes.auth import require_admin_auth
+from src.services.data_export import booking_query, customer_query
+from src.services.loyalty_engine import loyalty_engine
 from datetime import datetime, date
 import json
 
@@ -72,28 +74,11 @@ def get_dashboard_stats():
 def get_all_bookings():
     """Get all bookings with optional filtering"""
     try:
-        # Get query parameters
-        status = request.args.get('status')
-        date_filter = request.args.get('date')
-        driver_id = request.args.get('driver_id')
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
         
-        # Build query
-        query = Booking.query
-        
-        if status:
-            query = query.filter(Booking.status == status)
-        
-        if date_filter:
-            filter_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
-            query = query.filter(Booking.service_date == filter_date)
-        
-        if driver_id:
-            query = query.filter(Booking.assigned_driver_id == driver_id)
-        
-        # Order by creation date (newest first)
-        query = query.order_by(Booking.created_at.desc())
+        # Filter by status, date and driver_id, newest first
+        query = booking_query(request.args)
         
         # Paginate
         bookings = query.paginate(page=page, per_page=per_page, error_out=False)
@@ -168,6 +153,100 @@ def assign_driver_to_booking(booking_id):
             'message': f'Error assigning driver: {str(e)}'
         }), 500
 
+@admin_bp.route('/bookings/<booking_id>/driver-suggestions', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def get_driver_suggestions(booking_id):
+    """Rank drivers for a booking with a per-component score breakdown"""
+    try:
+        from src.services.driver_assignment import driver_assignment
+
+        booking = Booking.query.filter_by(booking_id=booking_id).first()
+        if not booking:
+            return jsonify({
+                'success': False,
+                'message': 'Booking not found'
+            }), 404
+
+        result = driver_assignment.suggest(booking)
+        if not result['success']:
+            return jsonify({
+                'success': False,
+                'message': result['error']
+            }), 400
+
+        return jsonify(result), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error ranking drivers: {str(e)}'
+        }), 500
+
+@admin_bp.route('/bookings/<booking_id>/auto-assign', methods=['POST'])
+@cross_origin()
+@require_admin_auth
+def auto_assign_driver(booking_id):
+    """Assign the best available driver to a booking"""
+    try:
+        from src.services.driver_assignment import driver_assignment
+
+        booking = Booking.query.filter_by(booking_id=booking_id).first()
+        if not booking:
+            return jsonify({
+                'success': False,
+                'message': 'Booking not found'
+            }), 404
+
+        result = driver_assignment.assign(booking)
+        if not result['success']:
+            return jsonify({
+                'success': False,
+                'message': result['error'],
+                'candidates': result.get('candidates', [])
+            }), 409
+
+        return jsonify({
+            'success': True,
+            'message': f"Driver {result['assignment']['name']} assigned to booking {booking_id}",
+            'assignment': result['assignment'],
+            'booking': booking.to_dict()
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Error assigning driver: {str(e)}'
+        }), 500
+
+@admin_bp.route('/bookings/auto-assign', methods=['POST'])
+@cross_origin()
+@require_admin_auth
+def auto_assign_day():
+    """Assign drivers to all unassigned bookings on a date"""
+    try:
+        from src.services.driver_assignment import driver_assignment
+
+        data = request.get_json() or {}
+        try:
+            service_date = datetime.strptime(data.get('date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'date is required (YYYY-MM-DD)'
+            }), 400
+
+        result = driver_assignment.assign_day(service_date, dry_run=bool(data.get('dry_run')))
+        return jsonify(result), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Error auto-assigning drivers: {str(e)}'
+        }), 500
+
 @admin_bp.route('/bookings/<booking_id>/update-status', methods=['POST'])
 @cross_origin()
 @require_admin_auth
@@ -203,26 +282,19 @@ def update_booking_status(booking_id):
         booking.status = new_status
         booking.updated_at = datetime.utcnow()
         
-        # If marking as completed, update completion date and check for loyalty rewards
+        # If marking as completed, update completion date and count it towards loyalty rewards
+        new_rewards = []
         if new_status == 'completed' and old_status != 'completed':
             booking.completed_at = datetime.utcnow()
-            
-            # Update customer loyalty
-            customer = Customer.query.filter_by(email=booking.customer_email).first()
-            if customer:
-                customer.completed_bookings += 1
-                customer.loyalty_points += booking.loyalty_points_earned
-                customer.last_booking_date = datetime.utcnow()
-                
-                # Check for new rewards
-                new_rewards = customer.check_loyalty_rewards()
-                
-                # Send reward notifications if any new rewards earned
-                if new_rewards:
-                    send_loyalty_reward_notification(customer, new_rewards)
+            new_rewards = loyalty_engine.record_completion(
+                booking.customer_email, points=booking.loyalty_points_earned, completed_at=booking.completed_at
+            )
         
         db.session.commit()
         
+        # Reward emails go out in the background once the completion is saved
+        loyalty_engine.notify(booking.customer_email, new_rewards)
+        
         return jsonify({
             'success': True,
             'message': f'Booking status updated to {new_status}',
@@ -244,22 +316,9 @@ def get_all_customers():
     try:
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
-        search = request.args.get('search', '')
-        
-        # Build query
-        query = Customer.query
-        
-        if search:
-            query = query.filter(
-                db.or_(
-                    Customer.name.ilike(f'%{search}%'),
-                    Customer.email.ilike(f'%{search}%'),
-                    Customer.phone.ilike(f'%{search}%')
-                )
-            )
         
-        # Order by last booking date (most recent first)
-        query = query.order_by(Customer.last_booking_date.desc().nullslast())
+        # Search by name, email or phone, most recent booking first
+        query = customer_query(request.args)
         
         # Paginate
         customers = query.paginate(page=page, per_page=per_page, error_out=False)
@@ -310,32 +369,155 @@ def get_customer_rewards(customer_id):
             'message': f'Error fetching customer rewards: {str(e)}'
         }), 500
 
-def send_loyalty_reward_notification(customer, rewards):
-    """Send notification to customer about new loyalty rewards"""
+@admin_bp.route('/email/rate-limits', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def get_email_rate_limits():
+    """Get outbound email rate limiter metrics (queue depth, wait times)"""
     try:
-        from src.services.email_service import email_service
-        
-        # Prepare reward notification data
-        reward_data = {
-            'customer_name': customer.name,
-            'customer_email': customer.email,
-            'rewards_earned': rewards,
-            'total_bookings': customer.completed_bookings,
-            'available_rewards': customer.get_available_rewards()
-        }
-        
-        # Send email notification
-        email_result = email_service.send_loyalty_reward_notification(reward_data)
-        
-        # TODO: Add SMS notification here if needed
-        # sms_result = sms_service.send_loyalty_reward_notification(reward_data)
-        
-        print(f"LOYALTY REWARD NOTIFICATION SENT TO: {customer.email}")
-        print(f"REWARDS EARNED: {rewards}")
-        
-        return email_result
-        
+        from src.services.rate_limiter import rate_limiters
+        from src.services.email_queue import email_queue
+
+        return jsonify({
+            'success': True,
+            'rate_limits': rate_limiters.get_metrics(),
+            'background_queue_depth': email_queue.depth
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching email rate limits: {str(e)}'
+        }), 500
+
+@admin_bp.route('/stripe/http-metrics', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def get_stripe_http_metrics():
+    """Get per-endpoint Stripe API latency histograms and error counts"""
+    try:
+        from src.services.stripe_client import stripe_http_client
+
+        return jsonify({
+            'success': True,
+            'endpoints': stripe_http_client.get_metrics()
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching Stripe HTTP metrics: {str(e)}'
+        }), 500
+
+@admin_bp.route('/stripe/reconcile', methods=['POST'])
+@cross_origin()
+@require_admin_auth
+def run_stripe_reconciliation():
+    """Start a Stripe reconciliation in the background (?repair=0 for a report-only run)"""
+    try:
+        import threading
+        from flask import current_app
+        from src.services.stripe_reconciliation import stripe_reconciler
+
+        if stripe_reconciler.running:
+            return jsonify({
+                'success': False,
+                'message': 'Reconciliation already running'
+            }), 409
+
+        repair = request.args.get('repair', '1') not in ('0', 'false')
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                stripe_reconciler.run(repair=repair)
+
+        threading.Thread(target=run, daemon=True).start()
+
+        return jsonify({
+            'success': True,
+            'message': 'Reconciliation started',
+            'repair': repair
+        }), 202
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error starting reconciliation: {str(e)}'
+        }), 500
+
+@admin_bp.route('/stripe/reconcile', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def get_stripe_reconciliation_report():
+    """Get the drift report from the last Stripe reconciliation"""
+    try:
+        from src.services.stripe_reconciliation import stripe_reconciler
+
+        return jsonify({
+            'success': True,
+            'running': stripe_reconciler.running,
+            'report': stripe_reconciler.last_report
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching reconciliation report: {str(e)}'
+        }), 500
+
+@admin_bp.route('/subscriptions/materialize-visits', methods=['POST'])
+@cross_origin()
+@require_admin_auth
+def materialize_subscription_visits():
+    """Create any missing subscription visits over the next horizon_weeks (default VISIT_HORIZON_WEEKS)"""
+    try:
+        from src.services.visit_schedule import visit_materializer
+
+        data = request.get_json(silent=True) or {}
+        horizon_weeks = data.get('horizon_weeks')
+        if horizon_weeks is not None:
+            try:
+                horizon_weeks = int(horizon_weeks)
+            except (TypeError, ValueError):
+                horizon_weeks = 0
+            if not 1 <= horizon_weeks <= 52:
+                return jsonify({
+                    'success': False,
+                    'message': 'horizon_weeks must be between 1 and 52'
+                }), 400
+
+        result = visit_materializer.materialize(horizon_days=horizon_weeks * 7 if horizon_weeks else None)
+        if not result['success']:
+            return jsonify({
+                'success': False,
+                'message': result['error']
+            }), 409 if 'already running' in result['error'] else 500
+
+        return jsonify(result), 200
+
     except Exception as e:
-        print(f"Error sending loyalty reward notification: {str(e)}")
-        return False
+        return jsonify({
+            'success': False,
+            'message': f'Error materialising subscription visits: {str(e)}'
+        }), 500
 
+@admin_bp.route('/loyalty/recompute', methods=['POST'])
+@cross_origin()
+@require_admin_auth
+def recompute_loyalty_rewards():
+    """Re-apply the loyalty reward rules to every customer (e.g. after changing thresholds)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        report = loyalty_engine.recompute(
+            revoke=bool(data.get('revoke', False)),
+            dry_run=bool(data.get('dry_run', False))
+        )
+        return jsonify(report), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Error recomputing loyalty rewards: {str(e)}'
+        }), 500
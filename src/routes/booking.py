@@ -4,7 +4,8 @@ import uuid
 from datetime import datetime
 from src.models.user import db
 from src.models.booking import Booking
-from src.models.customer import Customer
+from src.services.customer_repository import customer_repository
+from src.services.availability import availability_engine
 
 booking_bp = Blueprint('booking', __name__)
 
@@ -34,28 +35,18 @@ def create_booking():
         # Parse date
         service_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         
+        # Refuse slots that are already fully booked
+        if availability_engine.is_available(service_date, time, service) is False:
+            return jsonify({
+                'success': False,
+                'message': 'That time slot is no longer available. Please choose another time.'
+            }), 409
+        
         # Calculate remaining balance
         remaining_balance = total_price - deposit_amount
         
-        # Create or update customer record
-        customer = Customer.query.filter_by(email=customer_email).first()
-        if not customer:
-            customer = Customer(
-                customer_id=Customer.generate_customer_id(),
-                name=customer_name,
-                email=customer_email,
-                phone=customer_phone,
-                first_booking_date=datetime.utcnow()
-            )
-            db.session.add(customer)
-        else:
-            # Update customer info if changed
-            customer.name = customer_name
-            customer.phone = customer_phone
-        
-        # Update customer booking stats
-        customer.total_bookings += 1
-        customer.last_booking_date = datetime.utcnow()
+        # Create or update the customer and count the booking in one statement
+        customer_repository.record_booking(customer_email, customer_name, customer_phone)
         
         # Create booking record
         booking = Booking(
@@ -66,6 +57,7 @@ def create_booking():
             vehicle_type=vehicle_type,
             service_type=service,
             service_location=service_location,
+            address=address,
             service_date=service_date,
             service_time=time,
             total_price=total_price,
@@ -151,19 +143,44 @@ def send_confirmation_email(email, name, booking_id, vehicle_type, service, serv
 @booking_bp.route('/time-slots', methods=['GET'])
 @cross_origin()
 def get_time_slots():
-    """Get available time slots for booking"""
+    """Get available time slots for booking.
+
+    With ?date=YYYY-MM-DD only slots with free capacity are returned; pass
+    service_type to make sure the whole service fits.
+    """
     try:
-        # Generate time slots from 8 AM to 6 PM
-        time_slots = []
-        for hour in range(8, 19):  # 8 AM to 6 PM (18:00)
-            time_str = f"{hour:02d}:00"
-            time_slots.append({
-                'value': time_str,
-                'label': f"{hour:02d}:00"
-            })
-        
+        date_str = request.args.get('date')
+        if not date_str:
+            # Generate time slots from 8 AM to 6 PM
+            time_slots = []
+            for hour in range(8, 19):  # 8 AM to 6 PM (18:00)
+                time_str = f"{hour:02d}:00"
+                time_slots.append({
+                    'value': time_str,
+                    'label': f"{hour:02d}:00"
+                })
+
+            return jsonify({
+                'success': True,
+                'time_slots': time_slots
+            }), 200
+
+        try:
+            service_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid date, expected YYYY-MM-DD'
+            }), 400
+
+        service_type = request.args.get('service_type') or request.args.get('service')
+        time_slots, duration = availability_engine.time_slots(service_date, service_type)
+
         return jsonify({
             'success': True,
+            'date': service_date.isoformat(),
+            'service_type': service_type,
+            'duration_minutes': duration,
             'time_slots': time_slots
         }), 200
         
@@ -174,3 +191,35 @@ def get_time_slots():
             'message': 'Failed to get time slots'
         }), 500
 
+@booking_bp.route('/service-area', methods=['GET'])
+@cross_origin()
+def check_service_area():
+    """Check whether a postcode (or address) is inside the area we cover"""
+    try:
+        from src.services.postcode_index import postcode_index
+
+        postcode = request.args.get('postcode') or request.args.get('address')
+        if not postcode:
+            return jsonify({
+                'success': False,
+                'message': 'postcode is required'
+            }), 400
+
+        result = postcode_index.service_area(postcode)
+        if result['postcode'] is None:
+            return jsonify({
+                'success': False,
+                'message': 'Please enter a valid UK postcode'
+            }), 400
+
+        return jsonify({
+            'success': True,
+            **result
+        }), 200
+
+    except Exception as e:
+        print(f"Error checking service area: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to check service area'
+        }), 500
@@ -1,8 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_cors import cross_origin
 from src.models.driver import Driver, db
 from src.routes.auth import require_admin_auth
+from src.services.location_store import location_store
+from src.services.location_stream import location_stream
+import os
 import json
+import time
 from datetime import datetime
 
 driver_bp = Blueprint('driver', __name__)
@@ -45,6 +49,120 @@ def get_all_drivers():
             'message': f'Error fetching drivers: {str(e)}'
         }), 500
 
+@driver_bp.route('/drivers/nearby', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def get_nearby_drivers():
+    """Find the nearest drivers to a point (lat/lng or postcode), or all within radius_km"""
+    try:
+        from src.services.driver_index import driver_index
+        from src.services.postcode_index import postcode_index
+
+        lat = request.args.get('lat', type=float)
+        lng = request.args.get('lng', type=float)
+        postcode = request.args.get('postcode')
+        if (lat is None or lng is None) and postcode:
+            located = postcode_index.geocode(postcode)
+            if located:
+                lat, lng = located['lat'], located['lng']
+        
+        if lat is None or lng is None:
+            return jsonify({
+                'success': False,
+                'message': 'lat and lng (or a known postcode) are required'
+            }), 400
+        
+        status = request.args.get('status')
+        radius_km = request.args.get('radius_km', type=float)
+        if radius_km is not None:
+            drivers = driver_index.within(lat, lng, radius_km, status=status)
+        else:
+            drivers = driver_index.nearest(lat, lng, k=max(1, request.args.get('k', 5, type=int)), status=status)
+        
+        return jsonify({
+            'success': True,
+            'point': {'lat': lat, 'lng': lng},
+            'drivers': drivers,
+            'total': len(drivers)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error finding nearby drivers: {str(e)}'
+        }), 500
+
+@driver_bp.route('/drivers/locations/updates', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def get_driver_location_updates():
+    """Long-poll for driver moves since ``cursor``.
+
+    Each update is ``[id, lat, lng]``; null lat/lng means the driver was
+    deactivated and should be taken off the map. Without a cursor the last known position
+    of every moving driver is returned; ``reset`` means the cursor is too old
+    and the client should refetch /api/drivers before continuing.
+    """
+    try:
+        cursor = request.args.get('cursor', type=int)
+        if cursor is None:
+            updates, cursor = location_stream.snapshot()
+            reset = False
+        else:
+            timeout = min(max(request.args.get('timeout', 25, type=float), 0), 55)
+            updates, cursor, reset = location_stream.updates(cursor, timeout=timeout)
+        
+        return jsonify({
+            'success': True,
+            'cursor': cursor,
+            'reset': reset,
+            'updates': updates
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching location updates: {str(e)}'
+        }), 500
+
+@driver_bp.route('/drivers/locations/stream', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def stream_driver_locations():
+    """Server-sent events with driver moves.
+
+    Every event's data is a list of ``[id, lat, lng]`` and its id is the
+    cursor, so EventSource resumes from Last-Event-ID on reconnect. The
+    connection is closed after LOCATION_STREAM_MAX_SECONDS to free the worker
+    thread; the browser reconnects on its own.
+    """
+    cursor = request.headers.get('Last-Event-ID', request.args.get('cursor'))
+    try:
+        cursor = int(cursor) if cursor is not None else None
+    except ValueError:
+        cursor = None
+    max_seconds = float(os.getenv('LOCATION_STREAM_MAX_SECONDS', '300'))
+    heartbeat = float(os.getenv('LOCATION_STREAM_HEARTBEAT_SECONDS', '15'))
+
+    def events(cursor):
+        yield 'retry: 3000\n\n'
+        if cursor is None:
+            updates, cursor = location_stream.snapshot()
+            yield f"event: snapshot\nid: {cursor}\ndata: {json.dumps(updates, separators=(',', ':'))}\n\n"
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            updates, cursor, reset = location_stream.updates(cursor, timeout=min(heartbeat, max(deadline - time.monotonic(), 0)))
+            if reset:
+                updates, cursor = location_stream.snapshot()
+                yield f"event: reset\nid: {cursor}\ndata: {json.dumps(updates, separators=(',', ':'))}\n\n"
+            elif updates:
+                yield f"id: {cursor}\ndata: {json.dumps(updates, separators=(',', ':'))}\n\n"
+            else:
+                yield ': keep-alive\n\n'
+
+    return Response(stream_with_context(events(cursor)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @driver_bp.route('/drivers/<driver_id>', methods=['GET'])
 @cross_origin()
 @require_admin_auth
@@ -97,8 +215,6 @@ def create_driver():
         
         # Generate unique driver ID
         driver_id = Driver.generate_driver_id()
-        while Driver.query.filter_by(driver_id=driver_id).first():
-            driver_id = Driver.generate_driver_id()
         
         # Create new driver
         new_driver = Driver(
@@ -180,6 +296,13 @@ def update_driver(driver_id):
         driver.updated_at = datetime.utcnow()
         db.session.commit()
         
+        # Keep the buffered GPS position from overriding a location set here
+        if 'current_location_lat' in data or 'current_location_lng' in data:
+            location_store.record(driver.id, driver.current_location_lat, driver.current_location_lng,
+                                  driver.current_location_address)
+        if driver.status == 'inactive':
+            location_store.forget(driver.id)
+        
         return jsonify({
             'success': True,
             'message': 'Driver updated successfully',
@@ -212,6 +335,9 @@ def delete_driver(driver_id):
         driver.updated_at = datetime.utcnow()
         db.session.commit()
         
+        # Off the map, and further pings are refused
+        location_store.forget(driver.id)
+        
         return jsonify({
             'success': True,
             'message': 'Driver deactivated successfully'
@@ -228,42 +354,80 @@ def delete_driver(driver_id):
 @cross_origin()
 @require_admin_auth
 def update_driver_location(driver_id):
-    """Update driver's current location"""
+    """Update driver's current location.
+
+    Pings are buffered in memory and written to the database in batches by
+    the location store, so this never takes the SQLite write lock.
+    """
     try:
-        driver = Driver.query.filter_by(id=driver_id).first()
-        
-        if not driver:
+        if not location_store.is_known(driver_id):
             return jsonify({
                 'success': False,
                 'message': 'Driver not found'
             }), 404
         
-        data = request.get_json()
+        data = request.get_json() or {}
         
-        driver.current_location_lat = data.get('lat')
-        driver.current_location_lng = data.get('lng')
-        driver.current_location_address = data.get('address')
-        driver.updated_at = datetime.utcnow()
+        try:
+            lat = float(data['lat'])
+            lng = float(data['lng'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'lat and lng are required'
+            }), 400
         
-        db.session.commit()
+        location = location_store.record(driver_id, lat, lng, data.get('address'))
         
         return jsonify({
             'success': True,
             'message': 'Driver location updated successfully',
             'location': {
-                'lat': driver.current_location_lat,
-                'lng': driver.current_location_lng,
-                'address': driver.current_location_address
+                'lat': location['lat'],
+                'lng': location['lng'],
+                'address': location['address']
             }
         }), 200
         
     except Exception as e:
-        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Error updating location: {str(e)}'
         }), 500
 
+@driver_bp.route('/drivers/<driver_id>/location-history', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def get_driver_location_history(driver_id):
+    """Get a driver's downsampled location trail, newest first"""
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        try:
+            since = datetime.fromisoformat(since) if since else None
+            until = datetime.fromisoformat(until) if until else None
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'since/until must be ISO timestamps'
+            }), 400
+        
+        limit = min(max(request.args.get('limit', 1000, type=int), 1), 10000)
+        points = location_store.history(driver_id, since=since, until=until, limit=limit)
+        
+        return jsonify({
+            'success': True,
+            'driver_id': driver_id,
+            'points': [point.to_dict() for point in points],
+            'total': len(points)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching location history: {str(e)}'
+        }), 500
+
 @driver_bp.route('/drivers/<driver_id>/status', methods=['PUT'])
 @cross_origin()
 @require_admin_auth
@@ -292,6 +456,9 @@ def update_driver_status(driver_id):
         
         db.session.commit()
         
+        if status == 'inactive':
+            location_store.forget(driver.id)
+        
         return jsonify({
             'success': True,
             'message': f'Driver status updated to {status}',
@@ -305,6 +472,42 @@ def update_driver_status(driver_id):
             'message': f'Error updating status: {str(e)}'
         }), 500
 
+@driver_bp.route('/drivers/<driver_id>/route', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def get_driver_route(driver_id):
+    """Get a driver's jobs for a date in visiting order, with ETAs"""
+    try:
+        from src.services.route_planner import route_planner
+
+        driver = Driver.query.filter_by(id=driver_id).first()
+        
+        if not driver:
+            return jsonify({
+                'success': False,
+                'message': 'Driver not found'
+            }), 404
+        
+        date_str = request.args.get('date')
+        try:
+            route_date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else datetime.now().date()
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid date, expected YYYY-MM-DD'
+            }), 400
+        
+        route = route_planner.plan(driver, route_date)
+        route['driver'] = {'id': driver.id, 'driver_id': driver.driver_id, 'name': driver.name}
+        
+        return jsonify(route), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error planning route: {str(e)}'
+        }), 500
+
 @driver_bp.route('/drivers/stats', methods=['GET'])
 @cross_origin()
 @require_admin_auth
@@ -331,7 +534,8 @@ def get_driver_stats():
                 'inactive_drivers': inactive_drivers,
                 'average_rating': round(avg_rating, 2),
                 'total_services_completed': total_services
-            }
+            },
+            'location_updates': location_store.get_stats()
         }), 200
         
     except Exception as e:
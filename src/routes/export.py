@@ -0,0 +1,72 @@
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_cors import cross_origin
+from src.models.booking import Booking
+from src.models.customer import Customer
+from src.models.subscription_plan import CustomerSubscription
+from src.routes.auth import require_admin_auth
+from src.services.data_export import (
+    data_exporter, booking_query, customer_query, subscription_query, EXPORT_FORMATS
+)
+from datetime import datetime
+
+export_bp = Blueprint('export', __name__)
+
+EXPORTS = {
+    'bookings': (Booking, booking_query),
+    'customers': (Customer, customer_query),
+    'subscriptions': (CustomerSubscription, subscription_query),
+}
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+@export_bp.route('/export/<dataset>', methods=['GET'])
+@cross_origin()
+@require_admin_auth
+def export_dataset(dataset):
+    """Stream bookings, customers or subscriptions as CSV or NDJSON.
+
+    Takes the same filters as the matching list endpoint, e.g.
+    /api/export/bookings?format=csv&status=completed&date=2025-01-31
+    """
+    try:
+        if dataset not in EXPORTS:
+            return jsonify({
+                'success': False,
+                'message': f"Unknown export '{dataset}'. Use one of: {', '.join(EXPORTS)}"
+            }), 404
+
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'message': f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+            }), 400
+
+        model, build_query = EXPORTS[dataset]
+        try:
+            query = build_query(request.args)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid date format. Use YYYY-MM-DD'
+            }), 400
+
+        filename = f"{dataset}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+        return Response(
+            stream_with_context(data_exporter.stream(query, model, export_format)),
+            mimetype=MIMETYPES[export_format],
+            headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error exporting {dataset}: {str(e)}'
+        }), 500
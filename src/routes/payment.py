@@ -5,11 +5,12 @@ import os
 import json
 from datetime import datetime
 from src.services.email_service import email_service
+from src.services.stripe_client import configure_stripe, idempotency_key
 
 payment_bp = Blueprint('payment', __name__)
 
-# Stripe configuration - these will need to be set with actual keys
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY', 'sk_test_...')  # Replace with actual secret key
+# Stripe configuration - API key and the shared pooled HTTP client come from the environment
+configure_stripe()
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', 'pk_test_...')  # Replace with actual publishable key
 
 @payment_bp.route('/create-payment-intent', methods=['POST'])
@@ -36,8 +37,15 @@ def create_payment_intent():
                 'message': 'Invalid amount'
             }), 400
         
-        # Create payment intent
+        # Create payment intent - keyed on the booking so a double submit returns the same intent
+        idempotency_kwargs = {}
+        if booking_data.get('booking_id'):
+            idempotency_kwargs['idempotency_key'] = idempotency_key(
+                'payment_intent', booking_data['booking_id'], int(amount), currency
+            )
+        
         intent = stripe.PaymentIntent.create(
+            **idempotency_kwargs,
             amount=int(amount),
             currency=currency,
             metadata={
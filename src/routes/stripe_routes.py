@@ -4,10 +4,15 @@ import json
 import logging
 from datetime import datetime
 from src.services.stripe_service import stripe_service
-from src.models.subscription_plan import SubscriptionPlan
+from src.services.stripe_catalog import stripe_catalog
+from src.services.plan_registry import plan_registry
+from src.services.checkout_session_cache import checkout_session_cache
+from src.services.subscription_mirror import subscription_mirror
+from src.models.user import db
 from src.services.subscription_service import subscription_service
 from src.services.sendgrid_email_service import sendgrid_email_service
 from src.services.discord_webhook_service import discord_service
+from src.services.webhook_processor import webhook_processor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -43,41 +48,12 @@ def create_checkout_session():
                 'error': 'Missing required fields: plan_id, customer_info (email, name), vehicle_type, frequency'
             }), 400
         
-        # Get subscription plan - try multiple lookup methods
-        logger.info(f"Looking for plan_id: {plan_id}")
-        
-        # First try exact plan_id match
-        plan = SubscriptionPlan.query.filter_by(plan_id=plan_id, is_active=True).first()
-        
-        # If not found, try to match by service type (fallback)
-        if not plan:
-            # Extract service type from plan_id (e.g., "PLAN_MINI_VALET_HOME" -> "mini_valet")
-            if plan_id.startswith("PLAN_") and plan_id.endswith("_HOME"):
-                service_type = plan_id.replace("PLAN_", "").replace("_HOME", "").lower()
-                plan = SubscriptionPlan.query.filter_by(service_type=service_type, is_active=True).first()
-                logger.info(f"Fallback lookup by service_type '{service_type}': {plan}")
-        
-        # If still not found, try by name matching
-        if not plan:
-            plan_name_map = {
-                "PLAN_MINI_VALET_HOME": "Mini Valet Subscription",
-                "PLAN_FULL_VALET_HOME": "Full Valet Subscription", 
-                "PLAN_INTERIOR_DETAILING_HOME": "Interior Detailing Subscription",
-                "PLAN_EXTERIOR_DETAILING_HOME": "Exterior Detailing Subscription",
-                "PLAN_FULL_DETAILING_HOME": "Full Detailing Subscription",
-                "PLAN_STAGE1_POLISHING_HOME": "Stage 1 Polishing Subscription",
-                "PLAN_STAGE2_POLISHING_HOME": "Stage 2 Polishing Subscription"
-            }
-            if plan_id in plan_name_map:
-                plan = SubscriptionPlan.query.filter_by(name=plan_name_map[plan_id], is_active=True).first()
-                logger.info(f"Name-based lookup for '{plan_name_map[plan_id]}': {plan}")
+        # Resolve the plan by plan_id, PLAN_<SERVICE>_HOME alias or name - in memory, no DB queries
+        plan = plan_registry.resolve(plan_id)
         
         if not plan:
-            # Log all available plans for debugging
-            all_plans = SubscriptionPlan.query.all()
-            logger.error(f"Plan not found! Available plans:")
-            for p in all_plans:
-                logger.error(f"  - ID: {p.id}, Plan ID: {p.plan_id}, Name: {p.name}, Service: {p.service_type}, Active: {p.is_active}")
+            logger.error(f"Plan not found for plan_id: {plan_id}. Available plans: "
+                         f"{[p.plan_id for p in plan_registry.active_plans()]}")
             
             return jsonify({
                 'success': False,
@@ -86,8 +62,8 @@ def create_checkout_session():
         
         logger.info(f"Successfully found plan: {plan.name} (ID: {plan.id})")
         
-        # Create or get Stripe customer
-        customer_result = stripe_service.create_customer(
+        # Reuse the Stripe customer for this email if we have seen it before
+        customer_result = stripe_catalog.get_or_create_customer(
             email=customer_info['email'],
             name=customer_info['name'],
             phone=customer_info.get('phone'),
@@ -102,35 +78,23 @@ def create_checkout_session():
         
         customer_id = customer_result['customer_id']
         
-        # Create or get Stripe product
-        product_result = stripe_service.create_subscription_product(
-            plan_name=f"{plan.name} - {vehicle_type.replace('_', ' ').title()}",
-            description=f"{plan.description} for {vehicle_type.replace('_', ' ')} - {frequency} service"
-        )
-        
-        if not product_result['success']:
-            return jsonify({
-                'success': False,
-                'error': f"Failed to create product: {product_result['error']}"
-            }), 400
-        
-        product_id = product_result['product_id']
-        
         # Calculate subscription amount
         amount = stripe_service.calculate_subscription_amount(
             base_price=plan.base_price,
             frequency=frequency,
-            vehicle_type=vehicle_type
+            vehicle_type=vehicle_type,
+            service_type=plan.service_type
         )
         
         # Get Stripe interval
         interval, interval_count = stripe_service.get_stripe_interval(frequency)
         
-        # Create Stripe price
-        price_result = stripe_service.create_price(
-            product_id=product_id,
+        # Look up the catalog price for this quote (created once, then reused via lookup_key)
+        price_result = stripe_catalog.get_price_id(
+            plan=plan,
+            vehicle_type=vehicle_type,
+            frequency=frequency,
             amount=amount,
-            currency='gbp',
             interval=interval,
             interval_count=interval_count
         )
@@ -166,6 +130,28 @@ def create_checkout_session():
             metadata=metadata
         )
         
+        # A cached price archived in Stripe since it was cached - drop it and look it up again once
+        if not session_result['success'] and (session_result.get('param') or '').startswith('line_items') \
+                and price_result.get('cached'):
+            stripe_catalog.discard_price(price_result['lookup_key'], price_id)
+            price_result = stripe_catalog.get_price_id(
+                plan=plan,
+                vehicle_type=vehicle_type,
+                frequency=frequency,
+                amount=amount,
+                interval=interval,
+                interval_count=interval_count
+            )
+            if price_result['success']:
+                price_id = price_result['price_id']
+                session_result = stripe_service.create_checkout_session(
+                    customer_id=customer_id,
+                    price_id=price_id,
+                    success_url=success_url,
+                    cancel_url=cancel_url,
+                    metadata=metadata
+                )
+        
         if not session_result['success']:
             return jsonify({
                 'success': False,
@@ -192,7 +178,11 @@ def create_checkout_session():
 
 @stripe_bp.route('/webhook', methods=['POST'])
 def stripe_webhook():
-    """Handle Stripe webhook events"""
+    """Receive Stripe webhook events.
+
+    Verified events are stored in the webhook inbox and acknowledged
+    immediately; the handlers below run on the background webhook processor.
+    """
     try:
         payload = request.get_data()
         signature = request.headers.get('Stripe-Signature')
@@ -209,21 +199,12 @@ def stripe_webhook():
             return jsonify({'error': 'Invalid signature'}), 400
         
         event = verification_result['event']
-        logger.info(f"Received Stripe webhook: {event['type']}")
-        
-        # Handle different event types
-        if event['type'] == 'checkout.session.completed':
-            handle_checkout_completed(event['data']['object'])
-        elif event['type'] == 'invoice.payment_succeeded':
-            handle_payment_succeeded(event['data']['object'])
-        elif event['type'] == 'invoice.payment_failed':
-            handle_payment_failed(event['data']['object'])
-        elif event['type'] == 'customer.subscription.deleted':
-            handle_subscription_cancelled(event['data']['object'])
-        else:
-            logger.info(f"Unhandled event type: {event['type']}")
+        logger.info(f"Received Stripe webhook: {event['type']} ({event['id']})")
+        
+        # Persist and queue for background processing - duplicates are acknowledged as well
+        queued = webhook_processor.ingest(event)
         
-        return jsonify({'success': True}), 200
+        return jsonify({'success': True, 'duplicate': not queued}), 200
         
     except Exception as e:
         logger.error(f"Error handling webhook: {str(e)}")
@@ -234,6 +215,9 @@ def handle_checkout_completed(session):
     try:
         logger.info(f"Checkout completed for session: {session['id']}")
         
+        # Pre-warm the success page cache so it doesn't have to call Stripe
+        checkout_session_cache.prime(session)
+        
         # Extract metadata
         metadata = session.get('metadata', {})
         customer_email = metadata.get('customer_email')
@@ -255,31 +239,49 @@ def handle_checkout_completed(session):
             'frequency': frequency,
             'stripe_customer_id': session['customer'],
             'stripe_subscription_id': session['subscription'],
+            'stripe_checkout_session_id': session['id'],
             'status': 'active'
         }
         
+        # A retried event must not create the subscription (or send emails) twice
+        existing = subscription_mirror.find_subscription(session['subscription']) if session.get('subscription') else None
+        if existing and subscription_mirror.created_by_checkout(existing, session):
+            logger.info(f"Subscription {session['subscription']} already recorded for this checkout, skipping")
+            return
+        if existing:
+            # Some other row was linked to this subscription - the row for this checkout owns it
+            logger.warning(f"Unlinking {session['subscription']} from {existing.subscription_id}, "
+                           f"it belongs to checkout {session['id']}")
+            existing.stripe_subscription_id = None
+            db.session.commit()
+        
         # Save to database using subscription service
         result = subscription_service.create_subscription(subscription_data)
         
         if result['success']:
             logger.info(f"Subscription created in database: {result['subscription_id']}")
             
+            # Seed the Stripe mirror with the billing period and first invoice; webhooks keep it
+            # current from here (the first invoice's own event usually arrives before this row exists)
+            stripe_result = stripe_service.get_subscription(session['subscription'], expand=['latest_invoice'])
+            if stripe_result['success']:
+                stripe_subscription = stripe_result['subscription']
+                subscription_mirror.apply_subscription(stripe_subscription, subscription=result['subscription'])
+                if isinstance(stripe_subscription.get('latest_invoice'), dict):
+                    subscription_mirror.apply_invoice(stripe_subscription['latest_invoice'], subscription=result['subscription'])
+                db.session.commit()
+            
             # Get plan details for email
-            plan = SubscriptionPlan.query.filter_by(plan_id=plan_id, is_active=True).first()
+            plan = plan_registry.resolve(plan_id)
             
-            # If plan not found by plan_id, try to find by name or fallback to first active plan
+            # If plan not found, fall back to mini valet for valet ids or the first active plan
             if not plan:
                 logger.warning(f"Plan not found for plan_id: {plan_id}. Trying fallback lookup.")
-                # Try to find by service type or name
-                if 'mini' in plan_id.lower() or 'valet' in plan_id.lower():
-                    plan = SubscriptionPlan.query.filter(
-                        SubscriptionPlan.name.ilike('%mini%'),
-                        SubscriptionPlan.is_active == True
-                    ).first()
+                if plan_id and ('mini' in plan_id.lower() or 'valet' in plan_id.lower()):
+                    plan = plan_registry.get_by_service_type('mini_valet')
                 
-                # If still not found, get the first active plan as fallback
                 if not plan:
-                    plan = SubscriptionPlan.query.filter_by(is_active=True).first()
+                    plan = plan_registry.first_active()
                     logger.warning(f"Using fallback plan: {plan.name if plan else 'None'}")
             
             if plan:
@@ -287,7 +289,8 @@ def handle_checkout_completed(session):
                 amount = stripe_service.calculate_subscription_amount(
                     base_price=plan.base_price,
                     frequency=frequency,
-                    vehicle_type=vehicle_type
+                    vehicle_type=vehicle_type,
+                    service_type=plan.service_type
                 )
                 
                 # Prepare email data
@@ -362,46 +365,98 @@ def handle_checkout_completed(session):
             else:
                 logger.error(f"Plan not found for plan_id: {plan_id}. Cannot send emails.")
         else:
+            # Nothing has been sent yet, so let the webhook processor retry the event
             logger.error(f"Failed to create subscription in database: {result['error']}")
+            raise RuntimeError(f"Failed to create subscription: {result['error']}")
         
+    except RuntimeError:
+        raise
     except Exception as e:
         logger.error(f"Error handling checkout completion: {str(e)}")
 
-def handle_payment_succeeded(invoice):
+def handle_payment_succeeded(invoice, event):
     """Handle successful payment"""
     try:
         logger.info(f"Payment succeeded for invoice: {invoice['id']}")
         
-        # TODO: Update subscription status, send receipt email
+        subscription_mirror.apply_invoice(invoice, event_created=event.get('created'))
+        db.session.commit()
         
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error handling payment success: {str(e)}")
+        raise
 
-def handle_payment_failed(invoice):
+def handle_payment_failed(invoice, event):
     """Handle failed payment"""
     try:
         logger.info(f"Payment failed for invoice: {invoice['id']}")
         
-        # TODO: Update subscription status, send payment failure notification
+        subscription_mirror.apply_invoice(invoice, event_created=event.get('created'))
+        db.session.commit()
+        
+        # TODO: Send payment failure notification
         
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error handling payment failure: {str(e)}")
+        raise
+
+def handle_subscription_updated(subscription, event):
+    """Handle subscription creation, renewal and plan/status changes"""
+    try:
+        logger.info(f"Subscription updated: {subscription['id']} ({subscription.get('status')})")
+        
+        subscription_mirror.apply_subscription(subscription, event_created=event.get('created'))
+        db.session.commit()
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error handling subscription update: {str(e)}")
+        raise
 
-def handle_subscription_cancelled(subscription):
+def handle_subscription_cancelled(subscription, event):
     """Handle subscription cancellation"""
     try:
         logger.info(f"Subscription cancelled: {subscription['id']}")
         
-        # TODO: Update subscription status in database, send cancellation email
+        subscription_mirror.apply_subscription(subscription, event_created=event.get('created'))
+        db.session.commit()
+        
+        # TODO: Send cancellation email
         
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error handling subscription cancellation: {str(e)}")
+        raise
+
+# Event handlers run on the background webhook processor
+webhook_processor.register('checkout.session.completed', handle_checkout_completed)
+webhook_processor.register('invoice.payment_succeeded', handle_payment_succeeded, with_event=True)
+webhook_processor.register('invoice.payment_failed', handle_payment_failed, with_event=True)
+webhook_processor.register('customer.subscription.created', handle_subscription_updated, with_event=True)
+webhook_processor.register('customer.subscription.updated', handle_subscription_updated, with_event=True)
+webhook_processor.register('customer.subscription.deleted', handle_subscription_cancelled, with_event=True)
 
 @stripe_bp.route('/subscription-status/<subscription_id>', methods=['GET'])
 @cross_origin()
 def get_subscription_status(subscription_id):
-    """Get Stripe subscription status"""
+    """Get Stripe subscription status.
+
+    Served from the local mirror kept current by webhooks; ``?refresh=1`` fetches
+    live from Stripe (and updates the mirror).
+    """
     try:
+        refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+        local_subscription = subscription_mirror.find_subscription(subscription_id)
+        
+        if local_subscription and local_subscription.stripe_status and not refresh:
+            return jsonify({
+                'success': True,
+                'source': 'mirror',
+                'subscription': subscription_mirror.to_status_dict(local_subscription)
+            }), 200
+        
         result = stripe_service.get_subscription(subscription_id)
         
         if not result['success']:
@@ -412,8 +467,13 @@ def get_subscription_status(subscription_id):
         
         subscription = result['subscription']
         
+        if local_subscription:
+            subscription_mirror.apply_subscription(subscription, subscription=local_subscription)
+            db.session.commit()
+        
         return jsonify({
             'success': True,
+            'source': 'stripe',
             'subscription': {
                 'id': subscription.id,
                 'status': subscription.status,
@@ -424,6 +484,7 @@ def get_subscription_status(subscription_id):
         }), 200
         
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error getting subscription status: {str(e)}")
         return jsonify({
             'success': False,
@@ -452,6 +513,14 @@ def cancel_subscription():
                 'error': result['error']
             }), 400
         
+        # Reflect the cancellation locally straight away rather than waiting for the webhook
+        try:
+            subscription_mirror.apply_subscription(result['subscription'])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error updating subscription mirror after cancel: {str(e)}")
+        
         return jsonify({
             'success': True,
             'message': 'Subscription cancelled successfully'
@@ -1,14 +1,25 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin
 from datetime import datetime, date, timedelta
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased
 from src.models.user import db
 from src.models.subscription_plan import SubscriptionPlan, CustomerSubscription, SubscriptionService
 from src.models.notification import ServiceNotification, LiveNotification
-from src.models.customer import Customer
+from src.services.customer_repository import customer_repository
+from src.services.plan_registry import plan_registry
+from src.services.pricing_engine import pricing_engine
+from src.services.pagination import keyset_page
 import json
 
 subscription_v2_bp = Blueprint('subscription_v2', __name__)
 
+# Embedded history sections of the subscription detail view: model and newest-first sort column
+HISTORY_SECTIONS = {
+    'service_history': (SubscriptionService, SubscriptionService.scheduled_date),
+    'notifications': (ServiceNotification, ServiceNotification.scheduled_send_time),
+}
+
 @subscription_v2_bp.route('/force-reinitialize-plans', methods=['POST'])
 @cross_origin()
 def force_reinitialize_plans():
@@ -34,244 +45,20 @@ def force_reinitialize_plans():
 def get_subscription_plans():
     """Get all available subscription plans with updated Home Base pricing"""
     try:
-        # Return hardcoded updated pricing to ensure customers see correct Home Base rates
-        # Car Wash subscription is removed as requested
-        
-        plans_data = [
-            # Mini Valet Subscription - Updated Home Base pricing
-            {
-                'id': 2,
-                'plan_id': 'PLAN_MINI_VALET_HOME',
-                'name': 'Mini Valet Subscription',
-                'description': 'Comprehensive exterior and interior cleaning service',
-                'service_type': 'mini_valet',
-                'base_price': 35.0,  # Home Base Small Car price
-                'duration_minutes': 90,
-                'is_premium': False,
-                'is_active': True,
-                'features': [
-                    'Full exterior wash',
-                    'Interior vacuuming', 
-                    'Dashboard cleaning',
-                    'Window cleaning (interior & exterior)',
-                    'Wheel and tire cleaning'
-                ],
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'frequency_options': ['weekly', 'bi_weekly', 'monthly'],
-                'created_at': '2025-10-01T00:00:00.000000',
-                'pricing_examples': {
-                    'small_car': {
-                        'weekly': 119.0,
-                        'bi_weekly': 63.0,
-                        'monthly': 35.0
-                    },
-                    'medium_car': {
-                        'weekly': 170.0,
-                        'bi_weekly': 90.0,
-                        'monthly': 50.0
-                    },
-                    'large_car': {
-                        'weekly': 204.0,
-                        'bi_weekly': 108.0,
-                        'monthly': 60.0
-                    },
-                    'van': {
-                        'weekly': 255.0,
-                        'bi_weekly': 135.0,
-                        'monthly': 75.0
-                    }
-                }
-            },
-            # Full Valet Subscription - Updated Home Base pricing
-            {
-                'id': 3,
-                'plan_id': 'PLAN_FULL_VALET_HOME',
-                'name': 'Full Valet Subscription',
-                'description': 'Complete premium cleaning service inside and out',
-                'service_type': 'full_valet',
-                'base_price': 80.0,  # Home Base Small Car price
-                'duration_minutes': 120,
-                'is_premium': False,
-                'is_active': True,
-                'features': [
-                    'Complete exterior wash and wax',
-                    'Full interior deep clean',
-                    'Leather/fabric treatment',
-                    'Dashboard and trim detailing',
-                    'All windows cleaned',
-                    'Wheel and tire shine',
-                    'Air freshener'
-                ],
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'frequency_options': ['bi_weekly', 'monthly'],
-                'created_at': '2025-10-01T00:00:00.000000',
-                'pricing_examples': {
-                    'small_car': {
-                        'bi_weekly': 144.0,
-                        'monthly': 80.0
-                    },
-                    'medium_car': {
-                        'bi_weekly': 180.0,
-                        'monthly': 100.0
-                    },
-                    'large_car': {
-                        'bi_weekly': 225.0,
-                        'monthly': 125.0
-                    },
-                    'van': {
-                        'bi_weekly': 252.0,
-                        'monthly': 140.0
-                    }
-                }
-            },
-            # Premium Services with updated Home Base pricing
-            {
-                'id': 4,
-                'plan_id': 'PLAN_INTERIOR_DETAILING_HOME',
-                'name': 'Interior Detailing Subscription',
-                'description': 'Professional interior deep cleaning and protection service',
-                'service_type': 'interior_detailing',
-                'base_price': 140.0,  # Updated Home Base price
-                'duration_minutes': 180,
-                'is_premium': True,
-                'is_active': True,
-                'features': [
-                    'Deep interior cleaning',
-                    'Leather conditioning',
-                    'Fabric protection',
-                    'Steam cleaning',
-                    'Odor elimination',
-                    'UV protection treatment'
-                ],
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'frequency_options': ['monthly'],
-                'created_at': '2025-10-01T00:00:00.000000',
-                'pricing_examples': {
-                    'small_car': {'monthly': 140.0},
-                    'medium_car': {'monthly': 140.0},
-                    'large_car': {'monthly': 140.0},
-                    'van': {'monthly': 140.0}
-                }
-            },
-            {
-                'id': 5,
-                'plan_id': 'PLAN_EXTERIOR_DETAILING_HOME',
-                'name': 'Exterior Detailing Subscription',
-                'description': 'Professional exterior paint correction and protection',
-                'service_type': 'exterior_detailing',
-                'base_price': 260.0,
-                'duration_minutes': 300,
-                'is_premium': True,
-                'is_active': True,
-                'features': [
-                    'Paint correction',
-                    'Ceramic coating application',
-                    'Chrome polishing',
-                    'Headlight restoration',
-                    'Tire and wheel detailing',
-                    'Paint protection'
-                ],
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'frequency_options': ['monthly'],
-                'created_at': '2025-10-01T00:00:00.000000',
-                'pricing_examples': {
-                    'small_car': {'monthly': 260.0},
-                    'medium_car': {'monthly': 260.0},
-                    'large_car': {'monthly': 260.0},
-                    'van': {'monthly': 260.0}
-                }
-            },
-            {
-                'id': 6,
-                'plan_id': 'PLAN_FULL_DETAILING_HOME',
-                'name': 'Full Detailing Subscription',
-                'description': 'Complete professional detailing service - interior and exterior',
-                'service_type': 'full_detailing',
-                'base_price': 360.0,
-                'duration_minutes': 480,
-                'is_premium': True,
-                'is_active': True,
-                'features': [
-                    'Complete paint correction',
-                    'Ceramic coating',
-                    'Full interior detailing',
-                    'Leather restoration',
-                    'Engine bay cleaning',
-                    'Headlight restoration',
-                    'Tire and wheel detailing',
-                    'Paint and fabric protection'
-                ],
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'frequency_options': ['monthly'],
-                'created_at': '2025-10-01T00:00:00.000000',
-                'pricing_examples': {
-                    'small_car': {'monthly': 360.0},
-                    'medium_car': {'monthly': 360.0},
-                    'large_car': {'monthly': 360.0},
-                    'van': {'monthly': 360.0}
-                }
-            },
-            {
-                'id': 7,
-                'plan_id': 'PLAN_STAGE1_POLISHING_HOME',
-                'name': 'Stage 1 Polishing Subscription',
-                'description': 'Single-stage machine polishing for paint enhancement',
-                'service_type': 'stage1_polishing',
-                'base_price': 450.0,  # Updated Home Base price
-                'duration_minutes': 240,
-                'is_premium': True,
-                'is_active': True,
-                'features': [
-                    'Single-stage machine polish',
-                    'Paint enhancement',
-                    'Swirl mark removal',
-                    'Protective wax application',
-                    'Chrome and trim polishing'
-                ],
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'frequency_options': ['yearly'],
-                'created_at': '2025-10-01T00:00:00.000000',
-                'pricing_examples': {
-                    'small_car': {'yearly': 450.0},
-                    'medium_car': {'yearly': 450.0},
-                    'large_car': {'yearly': 450.0},
-                    'van': {'yearly': 450.0}
-                }
-            },
-            {
-                'id': 8,
-                'plan_id': 'PLAN_STAGE2_POLISHING_HOME',
-                'name': 'Stage 2 Polishing Subscription',
-                'description': 'Two-stage machine polishing for maximum paint correction',
-                'service_type': 'stage2_polishing',
-                'base_price': 650.0,  # Updated Home Base price
-                'duration_minutes': 360,
-                'is_premium': True,
-                'is_active': True,
-                'features': [
-                    'Two-stage machine polish',
-                    'Complete paint correction',
-                    'Scratch and swirl removal',
-                    'High-grade protective coating',
-                    'Chrome and trim restoration',
-                    'Paint depth enhancement'
-                ],
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'frequency_options': ['yearly'],
-                'created_at': '2025-10-01T00:00:00.000000',
-                'pricing_examples': {
-                    'small_car': {'yearly': 650.0},
-                    'medium_car': {'yearly': 650.0},
-                    'large_car': {'yearly': 650.0},
-                    'van': {'yearly': 650.0}
-                }
-            }
-        ]
+        # Plans come from the registry and prices from the shared price matrix,
+        # so the published prices always match what checkout charges
+        plans_data = []
+        for plan in plan_registry.active_plans():
+            plan_data = plan.to_dict()
+            plan_data['plan_id'] = plan.home_alias
+            plan_data['pricing_examples'] = pricing_engine.pricing_examples(plan)
+            plans_data.append(plan_data)
         
         return jsonify({
             'success': True,
             'plans': plans_data,
-            'count': len(plans_data)
+            'count': len(plans_data),
+            'price_version': pricing_engine.version
         }), 200
         
     except Exception as e:
@@ -310,7 +97,7 @@ def create_subscription():
             }), 400
         
         # Get subscription plan
-        plan = SubscriptionPlan.query.filter_by(plan_id=data['plan_id']).first()
+        plan = plan_registry.resolve(data['plan_id'])
         if not plan:
             return jsonify({
                 'success': False,
@@ -322,32 +109,20 @@ def create_subscription():
         
         # Generate IDs
         subscription_id = CustomerSubscription.generate_subscription_id()
-        customer_id = Customer.generate_customer_id()
         
         # Parse start date
         start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
         
-        # Create or update customer record
-        customer = Customer.query.filter_by(email=data['customer_email']).first()
-        if not customer:
-            customer = Customer(
-                customer_id=customer_id,
-                name=data['customer_name'],
-                email=data['customer_email'],
-                phone=data['customer_phone'],
-                first_booking_date=datetime.utcnow()
-            )
-            db.session.add(customer)
-        else:
-            customer.name = data['customer_name']
-            customer.phone = data['customer_phone']
-            customer_id = customer.customer_id
+        # Create or update the customer and count the booking in one statement
+        _, customer_id = customer_repository.record_booking(
+            data['customer_email'], data['customer_name'], data['customer_phone']
+        )
         
         # Create subscription
         subscription = CustomerSubscription(
             subscription_id=subscription_id,
             customer_id=customer_id,
-            plan_id=data['plan_id'],
+            plan_id=plan.plan_id,
             customer_name=data['customer_name'],
             customer_email=data['customer_email'],
             customer_phone=data['customer_phone'],
@@ -421,10 +196,6 @@ def create_subscription():
             
             db.session.add(reminder_notification)
         
-        # Update customer stats
-        customer.total_bookings += 1
-        customer.last_booking_date = datetime.utcnow()
-        
         db.session.commit()
         
         print(f"=== SUBSCRIPTION CREATED ===")
@@ -460,8 +231,23 @@ def create_subscription():
 @subscription_v2_bp.route('/subscription/<subscription_id>', methods=['GET'])
 @cross_origin()
 def get_subscription(subscription_id):
-    """Get subscription details"""
+    """Get subscription details.
+
+    ``include`` picks the embedded sections (service_history, notifications;
+    default both). Each section is a newest-first page of ``<section>_limit``
+    rows (default 10, max 100); pass its ``next_cursor`` back as
+    ``<section>_cursor`` for the next page.
+    """
     try:
+        include = request.args.get('include', ','.join(HISTORY_SECTIONS))
+        sections = set(filter(None, (part.strip() for part in include.split(','))))
+        unknown = sections - set(HISTORY_SECTIONS)
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown include section(s): {', '.join(sorted(unknown))}. Use: {', '.join(HISTORY_SECTIONS)}"
+            }), 400
+        
         subscription = CustomerSubscription.query.filter_by(subscription_id=subscription_id).first()
         
         if not subscription:
@@ -471,18 +257,33 @@ def get_subscription(subscription_id):
             }), 404
         
         # Get plan details
-        plan = SubscriptionPlan.query.filter_by(plan_id=subscription.plan_id).first()
-        
-        # Get service history
-        services = SubscriptionService.query.filter_by(subscription_id=subscription_id).order_by(SubscriptionService.scheduled_date.desc()).all()
-        
-        # Get notifications
-        notifications = ServiceNotification.query.filter_by(subscription_id=subscription_id).order_by(ServiceNotification.scheduled_send_time.desc()).all()
+        plan = plan_registry.get(subscription.plan_id)
         
         subscription_data = subscription.to_dict()
         subscription_data['plan_details'] = plan.to_dict() if plan else None
-        subscription_data['service_history'] = [service.to_dict() for service in services]
-        subscription_data['notifications'] = [notification.to_dict() for notification in notifications]
+        subscription_data['pagination'] = {}
+        
+        for section in HISTORY_SECTIONS:
+            if section not in sections:
+                continue
+            model, sort_column = HISTORY_SECTIONS[section]
+            limit = min(max(request.args.get(f'{section}_limit', 10, type=int), 1), 100)
+            try:
+                rows, next_cursor = keyset_page(
+                    model.query.filter_by(subscription_id=subscription_id), sort_column, model.id,
+                    cursor=request.args.get(f'{section}_cursor'), limit=limit
+                )
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid {section}_cursor'
+                }), 400
+            subscription_data[section] = [row.to_dict() for row in rows]
+            subscription_data['pagination'][section] = {
+                'limit': limit,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
         
         return jsonify({
             'success': True,
@@ -501,22 +302,37 @@ def get_subscription(subscription_id):
 def get_customer_subscriptions(customer_email):
     """Get all subscriptions for a customer"""
     try:
-        subscriptions = CustomerSubscription.query.filter_by(customer_email=customer_email).all()
+        # Earliest scheduled service per subscription, ranked in SQL so the whole
+        # list is one query however many subscriptions the customer has
+        customer_subscription_ids = select(CustomerSubscription.subscription_id).where(
+            CustomerSubscription.customer_email == customer_email
+        )
+        ranked = select(
+            SubscriptionService,
+            func.row_number().over(
+                partition_by=SubscriptionService.subscription_id,
+                order_by=(SubscriptionService.scheduled_date.asc(), SubscriptionService.id.asc())
+            ).label('position')
+        ).where(
+            SubscriptionService.status == 'scheduled',
+            SubscriptionService.subscription_id.in_(customer_subscription_ids)
+        ).subquery()
+        next_service_alias = aliased(SubscriptionService, ranked)
+        
+        rows = db.session.query(CustomerSubscription, next_service_alias).outerjoin(
+            next_service_alias,
+            and_(next_service_alias.subscription_id == CustomerSubscription.subscription_id, ranked.c.position == 1)
+        ).filter(
+            CustomerSubscription.customer_email == customer_email
+        ).order_by(CustomerSubscription.id.asc()).all()
         
         subscriptions_data = []
-        for subscription in subscriptions:
+        for subscription, next_service in rows:
             sub_data = subscription.to_dict()
             
-            # Get plan details
-            plan = SubscriptionPlan.query.filter_by(plan_id=subscription.plan_id).first()
+            # Plan details come from the in-memory plan registry
+            plan = plan_registry.get(subscription.plan_id)
             sub_data['plan_details'] = plan.to_dict() if plan else None
-            
-            # Get next service
-            next_service = SubscriptionService.query.filter_by(
-                subscription_id=subscription.subscription_id,
-                status='scheduled'
-            ).order_by(SubscriptionService.scheduled_date.asc()).first()
-            
             sub_data['next_service'] = next_service.to_dict() if next_service else None
             
             subscriptions_data.append(sub_data)
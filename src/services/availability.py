@@ -0,0 +1,301 @@
+import os
+import re
+import logging
+from datetime import datetime, date
+
+import numpy as np
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from src.models.user import db
+from src.models.booking import Booking
+from src.models.driver import Driver
+from src.models.subscription_plan import CustomerSubscription, SubscriptionService
+from src.services.plan_registry import plan_registry
+from src.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+# Bookable start times offered to customers
+SLOT_FIRST = '08:00'
+SLOT_LAST = '18:00'
+SLOT_INTERVAL_MINUTES = 60
+
+# Statuses that no longer occupy a van
+INACTIVE_BOOKING_STATUSES = ('cancelled', 'completed')
+ACTIVE_VISIT_STATUSES = ('scheduled', 'rescheduled', 'in_progress')
+
+
+def time_to_minutes(value):
+    """'HH:MM' -> minutes after midnight, None if it can't be parsed"""
+    match = re.match(r'^\s*(\d{1,2}):(\d{2})', value or '')
+    if not match:
+        return None
+    minutes = int(match.group(1)) * 60 + int(match.group(2))
+    return minutes if 0 <= minutes < MINUTES_PER_DAY else None
+
+
+def minutes_to_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _compact(value):
+    return re.sub(r'[^a-z0-9]', '', (value or '').lower())
+
+
+class DayAvailability:
+    """Free van capacity for one date, minute by minute.
+
+    ``capacity`` counts drivers working each minute and ``occupied`` counts jobs
+    running each minute; both are built by a sweep over interval start/end
+    points (a difference array and a cumulative sum).
+    """
+
+    def __init__(self, day, capacity, occupied, jobs):
+        self.date = day
+        self.capacity = capacity
+        self.occupied = occupied
+        self.free = capacity - occupied
+        self.jobs = jobs
+        self.computed_at = datetime.utcnow()
+
+    def free_for(self, start, duration):
+        """Vans free for the whole of [start, start + duration)"""
+        end = start + duration
+        if start < 0 or end > MINUTES_PER_DAY:
+            return 0
+        return max(int(self.free[start:end].min()), 0)
+
+    def slots(self, duration, starts):
+        """Minimum free capacity over each job window starting at ``starts``"""
+        if duration > MINUTES_PER_DAY:
+            return np.zeros(len(starts), dtype=np.int32)
+        windows = np.lib.stride_tricks.sliding_window_view(self.free, duration).min(axis=1)
+        starts = np.asarray(starts)
+        result = np.zeros(len(starts), dtype=np.int32)
+        valid = starts + duration <= MINUTES_PER_DAY
+        result[valid] = np.maximum(windows[starts[valid]], 0)
+        return result
+
+
+class AvailabilityEngine:
+    """Bookable time slots per date, taking into account bookings, subscription
+    visits, service durations and driver working hours.
+
+    Day profiles are cached per date and dropped when a commit touches a
+    booking, subscription visit or driver for that date.
+    """
+
+    def __init__(self):
+        self.default_capacity = int(os.getenv('AVAILABILITY_DEFAULT_CAPACITY', '1'))
+        self.default_duration = int(os.getenv('AVAILABILITY_DEFAULT_DURATION_MINUTES', '120'))
+        self.default_start = time_to_minutes(os.getenv('AVAILABILITY_DEFAULT_START', '08:00'))
+        self.default_end = time_to_minutes(os.getenv('AVAILABILITY_DEFAULT_END', '18:00'))
+        self.cache = TTLCache(
+            maxsize=int(os.getenv('AVAILABILITY_CACHE_SIZE', '366')),
+            ttl=float(os.getenv('AVAILABILITY_CACHE_TTL', '300'))
+        )
+        self.slot_starts = np.arange(time_to_minutes(SLOT_FIRST), time_to_minutes(SLOT_LAST) + 1, SLOT_INTERVAL_MINUTES)
+        self._durations = None
+        # Bumped on every invalidation so a profile computed across a write isn't cached
+        self._generation = 0
+
+    # -- durations ---------------------------------------------------------
+
+    def _duration_index(self):
+        snapshot = plan_registry.snapshot()
+        if self._durations is None or self._durations[0] is not snapshot:
+            index = {}
+            for record in snapshot.active:
+                if record.duration_minutes:
+                    index.setdefault(_compact(record.service_type), record.duration_minutes)
+                    index.setdefault(_compact(record.name.replace('Subscription', '')), record.duration_minutes)
+            self._durations = (snapshot, index)
+        return self._durations[1]
+
+    def duration_for(self, service_type):
+        """Service length in minutes for a service type or display name"""
+        return self._duration_index().get(_compact(service_type), self.default_duration)
+
+    def _plan_duration(self, plan_id):
+        record = plan_registry.get(plan_id)
+        return record.duration_minutes if record and record.duration_minutes else self.default_duration
+
+    # -- day profiles ------------------------------------------------------
+
+    def _driver_windows(self, day):
+        weekday = str(day.isoweekday())
+        rows = db.session.query(
+            Driver.availability_start, Driver.availability_end, Driver.working_days
+        ).filter(Driver.status != 'inactive').all()
+
+        windows = []
+        for start, end, working_days in rows:
+            if weekday not in (working_days or '1,2,3,4,5,6,7').split(','):
+                continue
+            start, end = time_to_minutes(start or '08:00'), time_to_minutes(end or '18:00')
+            if start is not None and end is not None and end > start:
+                windows.append((start, end))
+        return windows, bool(rows)
+
+    def _jobs(self, day):
+        """(start minute, duration) for everything booked on ``day``"""
+        jobs = []
+
+        bookings = db.session.query(Booking.service_time, Booking.service_type).filter(
+            Booking.service_date == day,
+            Booking.status.notin_(INACTIVE_BOOKING_STATUSES)
+        ).all()
+        for service_time, service_type in bookings:
+            start = time_to_minutes(service_time)
+            if start is not None:
+                jobs.append((start, self.duration_for(service_type)))
+
+        visits = db.session.query(
+            SubscriptionService.subscription_id, SubscriptionService.scheduled_time, CustomerSubscription.plan_id
+        ).join(
+            CustomerSubscription, CustomerSubscription.subscription_id == SubscriptionService.subscription_id
+        ).filter(
+            SubscriptionService.scheduled_date == day,
+            SubscriptionService.status.in_(ACTIVE_VISIT_STATUSES)
+        ).all()
+        visiting = set()
+        for subscription_id, scheduled_time, plan_id in visits:
+            visiting.add(subscription_id)
+            start = time_to_minutes(scheduled_time)
+            if start is not None:
+                jobs.append((start, self._plan_duration(plan_id)))
+
+        # Active subscriptions due that day whose visit hasn't been created yet
+        due = db.session.query(
+            CustomerSubscription.subscription_id, CustomerSubscription.preferred_time, CustomerSubscription.plan_id
+        ).filter(
+            CustomerSubscription.next_service_date == day,
+            CustomerSubscription.status == 'active'
+        ).all()
+        for subscription_id, preferred_time, plan_id in due:
+            start = time_to_minutes(preferred_time)
+            if subscription_id not in visiting and start is not None:
+                jobs.append((start, self._plan_duration(plan_id)))
+
+        return jobs
+
+    @staticmethod
+    def _sweep(intervals):
+        """Number of intervals covering each minute of the day"""
+        delta = np.zeros(MINUTES_PER_DAY + 1, dtype=np.int32)
+        if intervals:
+            bounds = np.asarray(intervals, dtype=np.int64)
+            starts = np.clip(bounds[:, 0], 0, MINUTES_PER_DAY)
+            ends = np.clip(bounds[:, 0] + bounds[:, 1], 0, MINUTES_PER_DAY)
+            np.add.at(delta, starts, 1)
+            np.add.at(delta, ends, -1)
+        return np.cumsum(delta[:-1], dtype=np.int32)
+
+    def _compute(self, day):
+        windows, has_drivers = self._driver_windows(day)
+        if not has_drivers:
+            # No drivers on record yet - fall back to a fixed crew over default hours
+            windows = [(self.default_start, self.default_end)] * self.default_capacity
+        capacity = self._sweep([(start, end - start) for start, end in windows])
+
+        jobs = self._jobs(day)
+        occupied = self._sweep(jobs)
+        return DayAvailability(day, capacity, occupied, len(jobs))
+
+    def day(self, day):
+        def load():
+            generation = self._generation
+            profile = self._compute(day)
+            return profile, self.cache.ttl if generation == self._generation else None
+
+        return self.cache.get_or_load(day.isoformat(), load)
+
+    # -- public API --------------------------------------------------------
+
+    def time_slots(self, day, service_type=None):
+        """Bookable start times on ``day`` for a service, with remaining capacity"""
+        profile = self.day(day)
+        duration = self.duration_for(service_type) if service_type else SLOT_INTERVAL_MINUTES
+        remaining = profile.slots(duration, self.slot_starts)
+
+        if day == date.today():
+            now = datetime.now()
+            not_started = self.slot_starts > now.hour * 60 + now.minute
+        elif day < date.today():
+            not_started = np.zeros(len(self.slot_starts), dtype=bool)
+        else:
+            not_started = np.ones(len(self.slot_starts), dtype=bool)
+
+        return [
+            {'value': minutes_to_time(start), 'label': minutes_to_time(start), 'remaining': int(free)}
+            for start, free, open_slot in zip(self.slot_starts.tolist(), remaining.tolist(), not_started.tolist())
+            if free > 0 and open_slot
+        ], duration
+
+    def is_available(self, day, time_str, service_type=None):
+        """Whether a job can start at ``time_str``; None when the time can't be parsed"""
+        start = time_to_minutes(time_str)
+        if start is None:
+            return None
+        duration = self.duration_for(service_type) if service_type else SLOT_INTERVAL_MINUTES
+        return self.day(day).free_for(start, duration) > 0
+
+    def invalidate(self, day=None):
+        self._generation += 1
+        if day is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(day.isoformat())
+
+
+# Global instance
+availability_engine = AvailabilityEngine()
+
+
+def _changed_dates(obj, attribute):
+    """Current and previous values of a date attribute on a pending object"""
+    state = inspect(obj)
+    history = state.attrs[attribute].history
+    values = set(history.added or ()) | set(history.deleted or ())
+    values.add(getattr(obj, attribute))
+    return {value for value in values if isinstance(value, date)}
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_availability_changes(session, flush_context, instances):
+    dates = session.info.setdefault('availability_dates', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Booking):
+            dates.update(_changed_dates(obj, 'service_date'))
+        elif isinstance(obj, SubscriptionService):
+            dates.update(_changed_dates(obj, 'scheduled_date'))
+        elif isinstance(obj, CustomerSubscription):
+            dates.update(_changed_dates(obj, 'next_service_date'))
+        elif isinstance(obj, Driver):
+            session.info['availability_all'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_availability(session):
+    dates = session.info.pop('availability_dates', None)
+    if session.info.pop('availability_all', False):
+        availability_engine.invalidate()
+        return
+    for day in dates or ():
+        availability_engine.invalidate(day)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _track_bulk_availability_changes(delete_context):
+    if delete_context.mapper.class_ in (Booking, SubscriptionService, CustomerSubscription, Driver):
+        delete_context.session.info['availability_all'] = True
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_availability_changes(session):
+    session.info.pop('availability_dates', None)
+    session.info.pop('availability_all', None)
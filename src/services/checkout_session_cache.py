@@ -0,0 +1,87 @@
+import os
+import logging
+from typing import Dict, Any
+
+from src.services.stripe_service import stripe_service
+from src.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Sessions still awaiting payment can change, so the frontend's polling only gets a short cache
+FINAL_PAYMENT_STATUSES = ('paid', 'no_payment_required')
+
+
+def _get(obj, key):
+    if obj is None:
+        return None
+    return obj.get(key) if hasattr(obj, 'get') else getattr(obj, key, None)
+
+
+def shape_checkout_session(session) -> Dict[str, Any]:
+    """Payload the success page needs from a Stripe checkout session (API object or webhook data)"""
+    customer_details = _get(session, 'customer_details')
+    metadata = _get(session, 'metadata')
+    amount_total = _get(session, 'amount_total')
+    currency = _get(session, 'currency')
+
+    return {
+        'session_id': _get(session, 'id'),
+        'payment_status': _get(session, 'payment_status'),
+        'customer_email': _get(customer_details, 'email') if customer_details else None,
+        'customer_name': _get(customer_details, 'name') if customer_details else None,
+        'amount': amount_total / 100 if amount_total else None,  # Convert from pence
+        'currency': currency.upper() if currency else 'GBP',
+        'service_name': metadata.get('plan_id', '').replace('PLAN_', '').replace('_HOME', '').replace('_', ' ').title() + ' Subscription' if metadata else None,
+        'frequency': metadata.get('frequency', '').title() if metadata else None,
+        'vehicle_type': metadata.get('vehicle_type', '').replace('_', ' ').title() if metadata else None,
+        'created': _get(session, 'created')
+    }
+
+
+class CheckoutSessionCache:
+    """TTL cache of shaped checkout sessions for the payment success page.
+
+    Filled on the first fetch and pre-warmed by the checkout.session.completed
+    webhook, so page refreshes and frontend polling don't each call Stripe.
+    """
+
+    def __init__(self):
+        self.final_ttl = int(os.getenv('CHECKOUT_SESSION_CACHE_TTL', '3600'))
+        self.pending_ttl = int(os.getenv('CHECKOUT_SESSION_PENDING_TTL', '5'))
+        self.cache = TTLCache(
+            maxsize=int(os.getenv('CHECKOUT_SESSION_CACHE_SIZE', '2048')),
+            ttl=self.final_ttl
+        )
+
+    def _ttl_for(self, session_data):
+        if session_data.get('payment_status') in FINAL_PAYMENT_STATUSES:
+            return self.final_ttl
+        return self.pending_ttl
+
+    def prime(self, session):
+        """Store a session received from a webhook"""
+        session_data = shape_checkout_session(session)
+        if session_data['session_id']:
+            self.cache.set(session_data['session_id'], session_data, self._ttl_for(session_data))
+        return session_data
+
+    def get(self, session_id) -> Dict[str, Any]:
+        def load():
+            session_result = stripe_service.get_checkout_session(session_id)
+            if not session_result['success']:
+                # Errors are returned to the caller but never cached
+                return session_result, None
+            session_data = shape_checkout_session(session_result['session'])
+            return session_data, self._ttl_for(session_data)
+
+        result = self.cache.get_or_load(session_id, load)
+        if 'success' in result:
+            return result
+        return {'success': True, 'session': result}
+
+    def stats(self):
+        return self.cache.stats()
+
+
+# Global instance
+checkout_session_cache = CheckoutSessionCache()
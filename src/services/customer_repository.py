@@ -0,0 +1,81 @@
+import uuid
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.models.user import db
+from src.models.customer import Customer
+
+logger = logging.getLogger(__name__)
+
+
+class CustomerRepository:
+    """Customer writes that stay correct under concurrent requests.
+
+    Customers are keyed by email. Instead of loading the row, changing it in
+    Python and flushing it back, counters are incremented in SQL: an UPDATE
+    for a known email, otherwise INSERT ... ON CONFLICT DO UPDATE, so two
+    bookings for the same email can neither lose an increment nor trip the
+    unique constraint.
+    """
+
+    def _insert(self):
+        dialect = db.session.get_bind().dialect.name
+        return (postgresql if dialect == 'postgresql' else sqlite).insert(Customer.__table__)
+
+    @staticmethod
+    def _booking_update(table, name, phone, booked_at):
+        """Column changes for a repeat booking by an existing customer."""
+        return {
+            'name': name,
+            'phone': phone,
+            'total_bookings': func.coalesce(table.c.total_bookings, 0) + 1,
+            'first_booking_date': func.coalesce(table.c.first_booking_date, booked_at),
+            'last_booking_date': booked_at,
+            'updated_at': booked_at
+        }
+
+    def record_booking(self, email, name, phone, booked_at=None):
+        """Create or update the customer for a new booking or subscription.
+
+        Runs in the caller's transaction; returns the row's (id, customer_id).
+        """
+        table = Customer.__table__
+        booked_at = booked_at or datetime.utcnow()
+        changes = self._booking_update(table, name, phone, booked_at)
+
+        # Known emails are updated in place so repeat bookings don't use up
+        # customer IDs. The check is a plain read because IDs are reserved on a
+        # separate connection, before this transaction writes anything.
+        if db.session.execute(select(table.c.id).where(table.c.email == email)).first():
+            row = db.session.execute(
+                table.update().where(table.c.email == email).values(changes)
+                .returning(table.c.id, table.c.customer_id)
+            ).one()
+            return row.id, row.customer_id
+
+        # If a concurrent first booking for the same email wins, this takes the
+        # update path and the reserved customer ID is skipped
+        statement = self._insert().values(
+            id=str(uuid.uuid4()),
+            customer_id=Customer.generate_customer_id(),
+            name=name,
+            email=email,
+            phone=phone,
+            total_bookings=1,
+            first_booking_date=booked_at,
+            last_booking_date=booked_at,
+            created_at=booked_at,
+            updated_at=booked_at
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.email], set_=changes
+        ).returning(table.c.id, table.c.customer_id)
+        row = db.session.execute(statement).one()
+        return row.id, row.customer_id
+
+
+# Global instance
+customer_repository = CustomerRepository()
@@ -0,0 +1,114 @@
+import io
+import os
+import csv
+import json
+from datetime import date, datetime
+
+from src.models.user import db
+from src.models.booking import Booking
+from src.models.customer import Customer
+from src.models.subscription_plan import CustomerSubscription
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+# Spreadsheet apps run cells starting with these as formulas
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def booking_query(args):
+    """Bookings filtered like GET /api/bookings (status, date, driver_id), newest first"""
+    query = Booking.query
+    if args.get('status'):
+        query = query.filter(Booking.status == args['status'])
+    if args.get('date'):
+        query = query.filter(Booking.service_date == datetime.strptime(args['date'], '%Y-%m-%d').date())
+    if args.get('driver_id'):
+        query = query.filter(Booking.assigned_driver_id == args['driver_id'])
+    return query.order_by(Booking.created_at.desc())
+
+
+def customer_query(args):
+    """Customers filtered like GET /api/customers (search), most recent booking first"""
+    query = Customer.query
+    search = args.get('search')
+    if search:
+        query = query.filter(
+            db.or_(
+                Customer.name.ilike(f'%{search}%'),
+                Customer.email.ilike(f'%{search}%'),
+                Customer.phone.ilike(f'%{search}%')
+            )
+        )
+    return query.order_by(Customer.last_booking_date.desc().nullslast())
+
+
+def subscription_query(args):
+    """Customer subscriptions filtered by status, plan_id, frequency and customer_email"""
+    query = CustomerSubscription.query
+    for field in ('status', 'plan_id', 'frequency', 'customer_email'):
+        if args.get(field):
+            query = query.filter(getattr(CustomerSubscription, field) == args[field])
+    return query.order_by(CustomerSubscription.created_at.desc())
+
+
+class DataExporter:
+    """Streams query results as CSV or NDJSON.
+
+    Only the table columns are selected, so rows come back as plain tuples
+    instead of ORM objects, and ``yield_per`` fetches them from the cursor in
+    batches. Output is yielded every batch, so memory stays flat however
+    many rows the export has.
+    """
+
+    def __init__(self):
+        self.batch_size = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def _cell(value):
+        if value is None:
+            return ''
+        if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+            return "'" + value
+        return value
+
+    def _rows(self, query, model):
+        columns = list(model.__table__.columns)
+        rows = query.with_entities(*columns).yield_per(self.batch_size)
+        return [column.name for column in columns], rows
+
+    def csv(self, query, model):
+        names, rows = self._rows(query, model)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        for count, row in enumerate(rows, 1):
+            writer.writerow([self._cell(self._value(value)) for value in row])
+            if count % self.batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def ndjson(self, query, model):
+        names, rows = self._rows(query, model)
+        chunk = []
+        for row in rows:
+            chunk.append(json.dumps(dict(zip(names, map(self._value, row))), separators=(',', ':')))
+            if len(chunk) == self.batch_size:
+                yield '\n'.join(chunk) + '\n'
+                chunk = []
+        if chunk:
+            yield '\n'.join(chunk) + '\n'
+
+    def stream(self, query, model, export_format):
+        return self.csv(query, model) if export_format == 'csv' else self.ndjson(query, model)
+
+
+# Global instance
+data_exporter = DataExporter()
@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from src.models.user import db
+from src.models.booking import Booking
+from src.models.driver import Driver
+from src.services.availability import (
+    availability_engine, time_to_minutes, MINUTES_PER_DAY, INACTIVE_BOOKING_STATUSES
+)
+from src.services.geo import haversine_km, locate_booking
+
+logger = logging.getLogger(__name__)
+
+# How much each component counts towards a driver's score (components are 0..1)
+SCORE_WEIGHTS = {
+    'distance': 0.4,
+    'specialization': 0.3,
+    'load': 0.3,
+}
+UNKNOWN_SCORE = 0.5  # unknown location, or a driver with no listed specializations
+
+
+def _compact(value):
+    return re.sub(r'[^a-z0-9]', '', (value or '').lower())
+
+
+def _specializations(raw):
+    if not raw:
+        return []
+    try:
+        values = json.loads(raw)
+    except (TypeError, ValueError):
+        values = raw.split(',')
+    if isinstance(values, str):
+        values = [values]
+    return [_compact(value) for value in values if _compact(value)]
+
+
+class DayPlan:
+    """Drivers working a date as parallel arrays, plus what they already have booked.
+
+    ``busy`` is a (drivers, minutes) occupancy grid; ``positions`` starts at each
+    driver's current location and moves to each job assigned in a batch.
+    """
+
+    def __init__(self, day, drivers, distance_scale_km):
+        self.day = day
+        self.drivers = drivers
+        self.distance_scale_km = distance_scale_km
+        count = len(drivers)
+        weekday = str(day.isoweekday())
+
+        self.positions = np.array(
+            [(d.current_location_lat if d.current_location_lat is not None else np.nan,
+              d.current_location_lng if d.current_location_lng is not None else np.nan) for d in drivers],
+            dtype=float
+        ).reshape(count, 2)
+        self.window_start = np.array([time_to_minutes(d.availability_start or '08:00') or 0 for d in drivers], dtype=np.int32)
+        self.window_end = np.array([time_to_minutes(d.availability_end or '18:00') or 0 for d in drivers], dtype=np.int32)
+        self.works_today = np.array(
+            [weekday in (d.working_days or '1,2,3,4,5,6,7').split(',') for d in drivers], dtype=bool
+        )
+        self.specializations = [_specializations(d.specializations) for d in drivers]
+        self.busy = np.zeros((count, MINUTES_PER_DAY), dtype=bool)
+        self.load_minutes = np.zeros(count, dtype=np.int32)
+        self.index = {d.id: i for i, d in enumerate(drivers)}
+
+    def book(self, driver_index, start, duration, location=None):
+        end = min(start + duration, MINUTES_PER_DAY)
+        self.busy[driver_index, start:end] = True
+        self.load_minutes[driver_index] += end - start
+        if location is not None:
+            self.positions[driver_index] = location
+
+    def score(self, start, duration, service_type, location):
+        """Score every driver for one job. Returns arrays keyed by component."""
+        count = len(self.drivers)
+        end = start + duration
+
+        if location is not None:
+            distance_km = haversine_km(self.positions[:, 0], self.positions[:, 1], location[0], location[1])
+        else:
+            distance_km = np.full(count, np.nan)
+        distance = np.where(np.isnan(distance_km), UNKNOWN_SCORE, np.exp(-distance_km / self.distance_scale_km))
+
+        service = _compact(service_type)
+        specialization = np.array([
+            UNKNOWN_SCORE if not specs else float(any(spec in service or service in spec for spec in specs))
+            for specs in self.specializations
+        ])
+
+        window_minutes = np.maximum(self.window_end - self.window_start, 1)
+        load = np.clip(1.0 - self.load_minutes / window_minutes, 0.0, 1.0)
+
+        in_window = self.works_today & (start >= self.window_start) & (end <= self.window_end)
+        clash = self.busy[:, start:min(end, MINUTES_PER_DAY)].any(axis=1)
+        feasible = in_window & ~clash
+
+        total = (SCORE_WEIGHTS['distance'] * distance
+                 + SCORE_WEIGHTS['specialization'] * specialization
+                 + SCORE_WEIGHTS['load'] * load)
+        return {
+            'total': np.where(feasible, total, -np.inf),
+            'distance_km': distance_km,
+            'distance': distance,
+            'specialization': specialization,
+            'load': load,
+            'works_today': self.works_today,
+            'in_window': in_window,
+            'clash': clash,
+            'feasible': feasible,
+        }
+
+    def explain(self, scores, index):
+        driver = self.drivers[index]
+        reasons = []
+        if not scores['works_today'][index]:
+            reasons.append('not working that day')
+        elif not scores['in_window'][index]:
+            reasons.append(f"outside availability {driver.availability_start}-{driver.availability_end}")
+        if scores['clash'][index]:
+            reasons.append('already booked at that time')
+        distance_km = scores['distance_km'][index]
+        return {
+            'driver_id': driver.id,
+            'driver_code': driver.driver_id,
+            'name': driver.name,
+            'feasible': bool(scores['feasible'][index]),
+            'score': round(float(scores['total'][index]), 4) if scores['feasible'][index] else None,
+            'components': {
+                'distance_km': None if np.isnan(distance_km) else round(float(distance_km), 2),
+                'distance': round(float(scores['distance'][index]), 4),
+                'specialization': round(float(scores['specialization'][index]), 4),
+                'load': round(float(scores['load'][index]), 4),
+            },
+            'reasons': reasons
+        }
+
+
+class DriverAssignmentService:
+    """Picks drivers for bookings by scoring every driver at once.
+
+    Availability (working day, hours, no overlapping job) is a hard constraint;
+    distance, specialization match and how full the driver's day already is
+    are weighted into the score (see SCORE_WEIGHTS).
+    """
+
+    def __init__(self):
+        self.distance_scale_km = float(os.getenv('ASSIGNMENT_DISTANCE_SCALE_KM', '15'))
+
+    def _plan(self, day, exclude_booking_ids=()):
+        drivers = Driver.query.filter(Driver.status != 'inactive').order_by(Driver.created_at).all()
+        plan = DayPlan(day, drivers, self.distance_scale_km)
+
+        assigned = Booking.query.filter(
+            Booking.service_date == day,
+            Booking.assigned_driver_id.isnot(None),
+            Booking.status.notin_(INACTIVE_BOOKING_STATUSES)
+        ).order_by(Booking.service_time).all()
+        for booking in assigned:
+            index = plan.index.get(booking.assigned_driver_id)
+            start = time_to_minutes(booking.service_time)
+            if index is None or start is None or booking.booking_id in exclude_booking_ids:
+                continue
+            plan.book(index, start, availability_engine.duration_for(booking.service_type))
+        return plan
+
+    @staticmethod
+    def _job(booking):
+        start = time_to_minutes(booking.service_time)
+        duration = availability_engine.duration_for(booking.service_type)
+        return start, duration, locate_booking(booking)
+
+    def suggest(self, booking):
+        """All drivers ranked for a booking, best first, with score breakdowns"""
+        start, duration, location = self._job(booking)
+        if start is None:
+            return {'success': False, 'error': f"Booking has no usable time: {booking.service_time!r}"}
+
+        plan = self._plan(booking.service_date, exclude_booking_ids={booking.booking_id})
+        if not plan.drivers:
+            return {'success': True, 'candidates': []}
+
+        scores = plan.score(start, duration, booking.service_type, location)
+        order = np.argsort(-scores['total'], kind='stable')
+        return {
+            'success': True,
+            'duration_minutes': duration,
+            'located': location is not None,
+            'candidates': [plan.explain(scores, int(index)) for index in order]
+        }
+
+    def assign(self, booking, commit=True):
+        """Assign the best feasible driver to one booking"""
+        result = self.suggest(booking)
+        if not result['success']:
+            return result
+        best = next((candidate for candidate in result['candidates'] if candidate['feasible']), None)
+        if best is None:
+            return {'success': False, 'error': 'No driver is available for this booking', 'candidates': result['candidates']}
+
+        booking.assigned_driver_id = best['driver_id']
+        booking.status = 'confirmed'
+        booking.updated_at = datetime.utcnow()
+        if commit:
+            db.session.commit()
+        return {'success': True, 'assignment': best}
+
+    def assign_day(self, day, dry_run=False):
+        """Assign every unassigned booking on a date in one pass, earliest first"""
+        plan = self._plan(day)
+        bookings = Booking.query.filter(
+            Booking.service_date == day,
+            Booking.assigned_driver_id.is_(None),
+            Booking.status.notin_(INACTIVE_BOOKING_STATUSES)
+        ).all()
+
+        jobs = []
+        unassigned = []
+        for booking in bookings:
+            start, duration, location = self._job(booking)
+            if start is None:
+                unassigned.append({'booking_id': booking.booking_id, 'reason': 'no usable service time'})
+            else:
+                jobs.append((start, duration, location, booking))
+        jobs.sort(key=lambda job: job[0])
+
+        assignments = []
+        for start, duration, location, booking in jobs:
+            if not plan.drivers:
+                unassigned.append({'booking_id': booking.booking_id, 'reason': 'no drivers'})
+                continue
+            scores = plan.score(start, duration, booking.service_type, location)
+            index = int(np.argmax(scores['total']))
+            if not scores['feasible'][index]:
+                unassigned.append({'booking_id': booking.booking_id, 'reason': 'no driver available'})
+                continue
+
+            plan.book(index, start, duration, location)
+            assignments.append({'booking_id': booking.booking_id, 'service_time': booking.service_time,
+                                **plan.explain(scores, index)})
+            if not dry_run:
+                booking.assigned_driver_id = plan.drivers[index].id
+                booking.status = 'confirmed'
+                booking.updated_at = datetime.utcnow()
+
+        if not dry_run and assignments:
+            db.session.commit()
+
+        logger.info(f"Auto-assigned {len(assignments)} of {len(bookings)} bookings for {day}"
+                    f"{' (dry run)' if dry_run else ''}")
+        return {
+            'success': True,
+            'date': day.isoformat(),
+            'dry_run': dry_run,
+            'assigned': assignments,
+            'unassigned': unassigned
+        }
+
+
+# Global instance
+driver_assignment = DriverAssignmentService()
@@ -0,0 +1,228 @@
+import os
+import math
+import threading
+import logging
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.models.user import db
+from src.models.driver import Driver
+from src.services.geo import haversine_km
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE_LAT = 111.32
+
+
+class DriverSpatialIndex:
+    """In-memory grid over active drivers' current locations.
+
+    Drivers are bucketed into square-ish cells of ``cell_km``. Nearest and
+    radius queries only measure drivers in the cells around the point, in
+    rings of growing size, instead of every driver row. Updates move one
+    driver between cells; the index loads itself from the database on first
+    use and is kept current by the Driver session events below.
+    """
+
+    def __init__(self):
+        self.cell_km = float(os.getenv('DRIVER_INDEX_CELL_KM', '2'))
+        self.cell_lat = self.cell_km / KM_PER_DEGREE_LAT
+        # Longitude cells are sized for the service area's latitude (about 53N)
+        self.cell_lng = self.cell_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(float(os.getenv('DRIVER_INDEX_LATITUDE', '53')))))
+        self._cells = {}      # (row, col) -> set of driver ids
+        self._drivers = {}    # driver id -> {'lat', 'lng', 'cell', 'driver_id', 'name', 'status'}
+        self._details = {}    # every known driver id -> {'driver_id', 'name', 'status'}, placed or not
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_lat)), int(math.floor(lng / self.cell_lng))
+
+    def load(self):
+        """Rebuild from the Driver table. Needs an app context."""
+        from src.services.location_store import location_store
+
+        rows = db.session.query(
+            Driver.id, Driver.driver_id, Driver.name, Driver.status,
+            Driver.current_location_lat, Driver.current_location_lng
+        ).all()
+        with self._lock:
+            self._cells.clear()
+            self._drivers.clear()
+            self._details.clear()
+            for row in rows:
+                # Buffered GPS pings are newer than the row until the location store flushes
+                latest = location_store.get(row.id)
+                lat, lng = (latest['lat'], latest['lng']) if latest else (row.current_location_lat, row.current_location_lng)
+                self._upsert(row.id, lat, lng, driver_id=row.driver_id, name=row.name, status=row.status)
+            self._loaded = True
+        logger.info(f"Driver spatial index loaded {len(self._drivers)} drivers")
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _upsert(self, id, lat, lng, **details):
+        details = self._details[id] = {**self._details.get(id, {}), **details}
+
+        self._remove(id)
+        if lat is None or lng is None or details.get('status') == 'inactive':
+            return
+        cell = self._cell(lat, lng)
+        self._drivers[id] = {'lat': lat, 'lng': lng, 'cell': cell, **details}
+        self._cells.setdefault(cell, set()).add(id)
+
+    def _remove(self, id):
+        current = self._drivers.pop(id, None)
+        if current:
+            members = self._cells.get(current['cell'])
+            members.discard(id)
+            if not members:
+                del self._cells[current['cell']]
+
+    def update(self, id, lat=None, lng=None, **details):
+        """Move or add one driver; no location (or an inactive status) drops it"""
+        with self._lock:
+            if self._loaded:
+                self._upsert(id, lat, lng, **details)
+
+    def move(self, id, lat, lng):
+        """Move a known driver to a new location"""
+        with self._lock:
+            if self._loaded and id in self._details:
+                self._upsert(id, lat, lng)
+
+    def remove(self, id):
+        with self._lock:
+            self._remove(id)
+            self._details.pop(id, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def _ring(self, center, radius):
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, col - radius
+            yield r, col + radius
+
+    def _measure(self, ids, lat, lng):
+        """Distances from a point to the given drivers, nearest first"""
+        if not ids:
+            return []
+        ids = list(ids)
+        lats = np.fromiter((self._drivers[i]['lat'] for i in ids), dtype=float, count=len(ids))
+        lngs = np.fromiter((self._drivers[i]['lng'] for i in ids), dtype=float, count=len(ids))
+        distances = haversine_km(lat, lng, lats, lngs)
+        order = np.argsort(distances, kind='stable')
+        return [(ids[i], float(distances[i])) for i in order]
+
+    def _result(self, id, distance):
+        driver = self._drivers[id]
+        return {
+            'id': id,
+            'driver_id': driver['driver_id'],
+            'name': driver['name'],
+            'status': driver['status'],
+            'lat': driver['lat'],
+            'lng': driver['lng'],
+            'distance_km': round(distance, 3)
+        }
+
+    def nearest(self, lat, lng, k=5, status=None):
+        """The ``k`` closest drivers to a point"""
+        self._ensure_loaded()
+        with self._lock:
+            candidates = [id for id, d in self._drivers.items() if status is None or d['status'] == status]
+            if len(candidates) <= k:
+                return [self._result(id, distance) for id, distance in self._measure(candidates, lat, lng)]
+
+            center = self._cell(lat, lng)
+            found = set()
+            radius = 0
+            while True:
+                for cell in self._ring(center, radius):
+                    for id in self._cells.get(cell, ()):
+                        if status is None or self._drivers[id]['status'] == status:
+                            found.add(id)
+                # Anything outside the searched rings is at least this far away
+                searched_km = radius * self.cell_km
+                measured = self._measure(found, lat, lng)
+                if len(measured) >= k and measured[k - 1][1] <= searched_km:
+                    return [self._result(id, distance) for id, distance in measured[:k]]
+                if len(found) == len(candidates):
+                    return [self._result(id, distance) for id, distance in measured[:k]]
+                radius += 1
+
+    def within(self, lat, lng, radius_km, status=None):
+        """All drivers within ``radius_km`` of a point, nearest first"""
+        self._ensure_loaded()
+        with self._lock:
+            center = self._cell(lat, lng)
+            rings = int(math.ceil(radius_km / self.cell_km)) + 1
+            found = set()
+            for radius in range(rings + 1):
+                for cell in self._ring(center, radius):
+                    for id in self._cells.get(cell, ()):
+                        if status is None or self._drivers[id]['status'] == status:
+                            found.add(id)
+            return [self._result(id, distance) for id, distance in self._measure(found, lat, lng)
+                    if distance <= radius_km]
+
+    def stats(self):
+        with self._lock:
+            return {'drivers': len(self._drivers), 'cells': len(self._cells), 'cell_km': self.cell_km,
+                    'loaded': self._loaded}
+
+
+# Global instance
+driver_index = DriverSpatialIndex()
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_driver_changes(session, flush_context):
+    changes = session.info.setdefault('driver_index_changes', {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Driver):
+            changes[obj.id] = (obj.current_location_lat, obj.current_location_lng,
+                               {'driver_id': obj.driver_id, 'name': obj.name, 'status': obj.status})
+    for obj in session.deleted:
+        if isinstance(obj, Driver):
+            changes[obj.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_driver_changes(session):
+    from src.services.location_store import location_store
+
+    for id, change in (session.info.pop('driver_index_changes', None) or {}).items():
+        if change is None:
+            driver_index.remove(id)
+            continue
+        lat, lng, details = change
+        # The row may lag behind GPS pings that haven't been flushed yet
+        latest = location_store.get(id)
+        if latest:
+            lat, lng = latest['lat'], latest['lng']
+        driver_index.update(id, lat, lng, **details)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _track_bulk_driver_changes(delete_context):
+    if delete_context.mapper.class_ is Driver:
+        driver_index.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_driver_changes(session):
+    session.info.pop('driver_index_changes', None)
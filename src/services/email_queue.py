@@ -0,0 +1,54 @@
+import os
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EmailQueue:
+    """Background delivery for emails a request couldn't send straight away.
+
+    Request handlers only wait briefly for a rate-limiter token; when the
+    limiter is backed up the send is handed to this worker, which waits as
+    long as the limiter needs without holding a request thread.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=int(os.getenv('EMAIL_QUEUE_SIZE', '1000')))
+        self._lock = threading.Lock()
+        self.thread = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def submit(self, send, *args, **kwargs):
+        """Queue ``send(*args, **kwargs)``; returns False when the queue is full"""
+        try:
+            self._queue.put_nowait((send, args, kwargs))
+        except queue.Full:
+            return False
+        self._ensure_worker()
+        return True
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            send, args, kwargs = self._queue.get()
+            try:
+                if not send(*args, **kwargs):
+                    logger.error(f"Queued email to {args[0] if args else '?'} was not sent")
+            except Exception as e:
+                logger.error(f"Error sending queued email: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+
+# Global instance
+email_queue = EmailQueue()
@@ -1,10 +1,12 @@
 import os
-import os
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 import logging
+from flask import has_request_context
+from src.services.rate_limiter import rate_limiters, is_throttling_error
+from src.services.email_queue import email_queue
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,55 +20,87 @@ class EmailService:
         self.email_address = os.getenv('EMAIL_ADDRESS', 'opemipo.osekita@infinitemobilecarwashdetailing.co.uk')
         self.email_password = os.getenv('EMAIL_PASSWORD', 'Cocomelone22*')
         self.company_email = 'opemipo.osekita@infinitemobilecarwashdetailing.co.uk'
+
+        # Outbound pacing - IONOS enforces a per-minute send limit
+        self.rate_limiter = rate_limiters.get('ionos_smtp')
+        self.max_send_attempts = int(os.getenv('SMTP_MAX_SEND_ATTEMPTS', '3'))
+        # Longest a request handler waits for a send slot before handing the email to the background queue
+        self.request_send_timeout = float(os.getenv('EMAIL_REQUEST_SEND_TIMEOUT', '2'))
+
+    def send_email(self, to_email, subject, html_content, cc_email=None, timeout=None):
+        """Send email using SMTP, paced by the IONOS rate limiter.
+
+        Throttling responses (SMTP 4xx) back the limiter off and retry instead of
+        being reported as a failed send. Inside a request the wait for the limiter
+        is capped at ``request_send_timeout`` and slower sends are queued for
+        background delivery (returning True once queued).
+        """
+        if timeout is None and has_request_context():
+            timeout = self.request_send_timeout
         
-    def send_email(self, to_email, subject, html_content, cc_email=None):
-        """Send email using SMTP"""
-        try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = self.email_address
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
+        for attempt in range(1, self.max_send_attempts + 1):
+            if not self.rate_limiter.acquire(timeout=timeout):
+                if timeout is not None and email_queue.submit(self.send_email, to_email, subject, html_content, cc_email):
+                    logger.info(f"Email limiter busy - queued email to {to_email} for background delivery")
+                    return True
+                logger.error(f"Email queue full ({self.rate_limiter.queue_depth} waiting) - not sending to {to_email}")
+                return False
+
+            try:
+                return self._send_email_once(to_email, subject, html_content, cc_email)
+            except Exception as e:
+                if is_throttling_error(e) and attempt < self.max_send_attempts:
+                    logger.warning(f"SMTP throttled sending to {to_email} (attempt {attempt}): {str(e)}")
+                    self.rate_limiter.penalize()
+                    continue
+                logger.error(f"Error sending email: {str(e)}")
+                return False
+
+        return False
+
+    def _send_email_once(self, to_email, subject, html_content, cc_email=None):
+        """Deliver a single message over SMTP; raises on SMTP errors"""
+        # Create message
+        msg = MIMEMultipart('alternative')
+        msg['From'] = self.email_address
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        if cc_email:
+            msg['Cc'] = cc_email
+        
+        # Add HTML content
+        html_part = MIMEText(html_content, 'html')
+        msg.attach(html_part)
+        
+        # Connect to server and send email
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        server.starttls()
+        
+        if self.email_password:
+            server.login(self.email_address, self.email_password)
+            text = msg.as_string()
+            recipients = [to_email]
             if cc_email:
-                msg['Cc'] = cc_email
-            
-            # Add HTML content
-            html_part = MIMEText(html_content, 'html')
-            msg.attach(html_part)
-            
-            # Connect to server and send email
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            
-            if self.email_password:
-                server.login(self.email_address, self.email_password)
-                text = msg.as_string()
-                recipients = [to_email]
-                if cc_email:
-                    recipients.append(cc_email)
-                server.sendmail(self.email_address, recipients, text)
-                server.quit()
-                
-                logger.info(f"EMAIL SUCCESSFULLY SENT TO: {to_email}")
-                if cc_email:
-                    logger.info(f"CC: {cc_email}")
-                logger.info(f"SUBJECT: {subject}")
-            else:
-                logger.error("CRITICAL: No email password configured - logging email instead of sending")
-                logger.info(f"EMAIL WOULD BE SENT TO: {to_email}")
-                logger.info(f"SUBJECT: {subject}")
-                if cc_email:
-                    logger.info(f"CC: {cc_email}")
-                logger.info("EMAIL CONTENT:")
-                logger.info(html_content)
-                logger.info("=" * 80)
+                recipients.append(cc_email)
+            server.sendmail(self.email_address, recipients, text)
+            server.quit()
             
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error sending email: {str(e)}")
-            return False
+            logger.info(f"EMAIL SUCCESSFULLY SENT TO: {to_email}")
+            if cc_email:
+                logger.info(f"CC: {cc_email}")
+            logger.info(f"SUBJECT: {subject}")
+        else:
+            logger.error("CRITICAL: No email password configured - logging email instead of sending")
+            logger.info(f"EMAIL WOULD BE SENT TO: {to_email}")
+            logger.info(f"SUBJECT: {subject}")
+            if cc_email:
+                logger.info(f"CC: {cc_email}")
+            logger.info("EMAIL CONTENT:")
+            logger.info(html_content)
+            logger.info("=" * 80)
+        
+        return True
     
     def send_booking_confirmation(self, booking_data):
         """Send booking confirmation email to customer and company"""
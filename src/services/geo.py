@@ -0,0 +1,46 @@
+import re
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+_COORDINATES = re.compile(r'(-?\d{1,2}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)')
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km. Arguments broadcast like NumPy arrays."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=float)) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix_km(points_a, points_b=None):
+    """Pairwise distances between (n, 2) and (m, 2) arrays of lat/lng -> (n, m)"""
+    points_a = np.asarray(points_a, dtype=float).reshape(-1, 2)
+    points_b = points_a if points_b is None else np.asarray(points_b, dtype=float).reshape(-1, 2)
+    return haversine_km(points_a[:, None, 0], points_a[:, None, 1], points_b[None, :, 0], points_b[None, :, 1])
+
+
+def locate_address(text):
+    """(lat, lng) for a free-text location, or None when it can't be placed.
+
+    Explicit "lat, lng" coordinates win; otherwise the UK postcode in the text
+    is looked up in the offline postcode index.
+    """
+    match = _COORDINATES.search(text or '')
+    if match:
+        lat, lng = float(match.group(1)), float(match.group(2))
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+
+    from src.services.postcode_index import postcode_index
+    located = postcode_index.geocode(text)
+    return (located['lat'], located['lng']) if located else None
+
+
+def locate_booking(booking):
+    return locate_address(' '.join(filter(None, (booking.address, booking.service_location))))
+
+
+def locate_subscription(subscription):
+    return locate_address(' '.join(filter(None, (subscription.address, subscription.postcode))))
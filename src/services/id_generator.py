@@ -0,0 +1,84 @@
+import os
+import threading
+import logging
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.id_sequence import IdSequence
+
+logger = logging.getLogger(__name__)
+
+# Crockford base32: no I, L, O or U, and in ASCII order so fixed-width codes sort numerically
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+# Legacy random IDs used 3 (bookings) or 4 (customers, drivers) characters, so
+# five-character sequence codes can never collide with them
+ID_WIDTH = 5
+
+
+def encode_base32(value, width=ID_WIDTH):
+    digits = []
+    while value:
+        value, remainder = divmod(value, 32)
+        digits.append(CROCKFORD_ALPHABET[remainder])
+    return ''.join(reversed(digits)).rjust(width, '0')
+
+
+class IdGenerator:
+    """Short, sortable, collision-free business IDs such as IMC-2026-0004K.
+
+    Numbers come from a per-prefix, per-year counter in ``id_sequences``.
+    Each process reserves ID_BLOCK_SIZE numbers at a time in its own short
+    transaction and hands them out from memory, so an ID normally costs no
+    database roundtrip. Numbers left unused when a process exits are skipped,
+    never reused.
+    """
+
+    def __init__(self):
+        self.block_size = int(os.getenv('ID_BLOCK_SIZE', '100'))
+        self._blocks = {}  # sequence name -> [next number, end of block)
+        self._lock = threading.Lock()
+
+    def _reserve(self, name):
+        """Claim the next block of numbers for a sequence. Needs an app context."""
+        table = IdSequence.__table__
+        for _ in range(3):
+            try:
+                # Own connection and transaction: the block stays claimed even if
+                # the caller's session rolls back
+                with db.engine.begin() as connection:
+                    claimed = connection.execute(
+                        table.update().where(table.c.name == name).values(
+                            next_value=table.c.next_value + self.block_size,
+                            updated_at=datetime.utcnow()
+                        )
+                    ).rowcount
+                    if not claimed:
+                        connection.execute(table.insert().values(
+                            name=name, next_value=1 + self.block_size, updated_at=datetime.utcnow()
+                        ))
+                        return [1, 1 + self.block_size]
+                    end = connection.execute(select(table.c.next_value).where(table.c.name == name)).scalar_one()
+                    return [end - self.block_size, end]
+            except IntegrityError:
+                # Another process created the sequence first; claim from its row
+                continue
+        raise RuntimeError(f"Could not reserve IDs for {name}")
+
+    def next_id(self, prefix, year=None):
+        name = f"{prefix}-{year or datetime.now().year}"
+        with self._lock:
+            block = self._blocks.get(name)
+            if block is None or block[0] >= block[1]:
+                block = self._blocks[name] = self._reserve(name)
+                logger.info(f"Reserved IDs {block[0]}-{block[1] - 1} for {name}")
+            number = block[0]
+            block[0] += 1
+        return f"{name}-{encode_base32(number)}"
+
+
+# Global instance
+id_generator = IdGenerator()
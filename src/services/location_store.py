@@ -0,0 +1,198 @@
+import os
+import math
+import atexit
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, insert
+
+from src.models.user import db
+from src.models.driver import Driver, DriverLocationHistory
+from src.services.driver_index import driver_index
+from src.services.location_stream import location_stream
+
+logger = logging.getLogger(__name__)
+
+
+def _metres(lat1, lng1, lat2, lng2):
+    # Equirectangular approximation - plenty for "has the van moved 50m"
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000.0 * math.hypot(x, y)
+
+
+class DriverLocationStore:
+    """Write-behind store for driver GPS pings.
+
+    ``record`` updates the latest position in memory and returns straight
+    away; readers see it immediately. A background thread flushes the
+    coalesced latest positions to ``drivers`` every LOCATION_FLUSH_INTERVAL
+    seconds in one transaction, together with a downsampled history (a point
+    is kept when the van moved LOCATION_HISTORY_MIN_METRES or
+    LOCATION_HISTORY_MIN_SECONDS passed since the last kept point).
+    """
+
+    def __init__(self):
+        self.flush_interval = float(os.getenv('LOCATION_FLUSH_INTERVAL', '5'))
+        self.history_min_metres = float(os.getenv('LOCATION_HISTORY_MIN_METRES', '50'))
+        self.history_min_seconds = float(os.getenv('LOCATION_HISTORY_MIN_SECONDS', '60'))
+        self.history_retention_days = int(os.getenv('LOCATION_HISTORY_RETENTION_DAYS', '30'))
+        self.app = None
+        self.running = False
+        self.thread = None
+        self._latest = {}          # driver id -> {'lat', 'lng', 'address', 'recorded_at'}
+        self._dirty = {}           # driver id -> latest entry not yet written to drivers
+        self._history = []         # history rows not yet written
+        self._last_kept = {}       # driver id -> (lat, lng, monotonic time) of the last history point
+        self._known = set()        # driver ids known to exist
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_purge = 0.0
+        self.stats = {'recorded': 0, 'flushes': 0, 'rows_written': 0, 'history_written': 0}
+
+    def start(self, app):
+        if self.running:
+            return
+        self.app = app
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        logger.info("Driver location store started")
+
+    def stop(self):
+        """Stop the flush thread and write out whatever is pending"""
+        if not self.running:
+            return
+        self.running = False
+        with self.app.app_context():
+            self.flush()
+
+    def is_known(self, driver_id):
+        """Cheap check that an active driver exists, so pings don't load the Driver row"""
+        if driver_id in self._known:
+            return True
+        if db.session.query(Driver.id).filter(Driver.id == driver_id, Driver.status != 'inactive').first():
+            self._known.add(driver_id)
+            return True
+        return False
+
+    def record(self, driver_id, lat, lng, address=None, recorded_at=None):
+        """Accept a GPS ping. Returns the stored entry."""
+        now = time.monotonic()
+        entry = {'lat': lat, 'lng': lng, 'address': address, 'recorded_at': recorded_at or datetime.utcnow()}
+        with self._lock:
+            self._latest[driver_id] = entry
+            self._dirty[driver_id] = entry
+            self.stats['recorded'] += 1
+
+            last = self._last_kept.get(driver_id)
+            if lat is not None and lng is not None and (
+                last is None
+                or now - last[2] >= self.history_min_seconds
+                or _metres(last[0], last[1], lat, lng) >= self.history_min_metres
+            ):
+                self._last_kept[driver_id] = (lat, lng, now)
+                self._history.append({'driver_id': driver_id, 'lat': lat, 'lng': lng,
+                                      'recorded_at': entry['recorded_at']})
+
+        driver_index.move(driver_id, lat, lng)
+        location_stream.publish(driver_id, lat, lng)
+        return entry
+
+    def get(self, driver_id):
+        return self._latest.get(driver_id)
+
+    def forget(self, driver_id):
+        """Drop a deactivated driver: its buffered position, the map and further pings"""
+        with self._lock:
+            self._latest.pop(driver_id, None)
+            self._dirty.pop(driver_id, None)
+            self._last_kept.pop(driver_id, None)
+            self._known.discard(driver_id)
+        driver_index.remove(driver_id)
+        location_stream.remove(driver_id)
+
+    def flush(self):
+        """Write pending latest positions and history rows. Needs an app context."""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                history, self._history = self._history, []
+            if not dirty and not history:
+                return 0
+
+            drivers = Driver.__table__
+            try:
+                if dirty:
+                    # One executemany UPDATE for every driver that moved since the last flush
+                    db.session.execute(
+                        drivers.update().where(drivers.c.id == bindparam('_id')).values(
+                            current_location_lat=bindparam('_lat'),
+                            current_location_lng=bindparam('_lng'),
+                            current_location_address=bindparam('_address'),
+                            updated_at=bindparam('_updated_at')
+                        ),
+                        [{'_id': driver_id, '_lat': entry['lat'], '_lng': entry['lng'],
+                          '_address': entry['address'], '_updated_at': entry['recorded_at']}
+                         for driver_id, entry in dirty.items()]
+                    )
+                if history:
+                    db.session.execute(insert(DriverLocationHistory.__table__), history)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                # Put the updates back unless newer pings arrived in the meantime
+                with self._lock:
+                    for driver_id, entry in dirty.items():
+                        self._dirty.setdefault(driver_id, entry)
+                    self._history[:0] = history
+                logger.error(f"Driver location flush failed: {str(e)}")
+                return 0
+
+            self.stats['flushes'] += 1
+            self.stats['rows_written'] += len(dirty)
+            self.stats['history_written'] += len(history)
+            return len(dirty)
+
+    def purge_history(self):
+        """Drop history points older than the retention period"""
+        cutoff = datetime.utcnow() - timedelta(days=self.history_retention_days)
+        deleted = db.session.execute(
+            DriverLocationHistory.__table__.delete().where(DriverLocationHistory.__table__.c.recorded_at < cutoff)
+        ).rowcount
+        db.session.commit()
+        if deleted:
+            logger.info(f"Purged {deleted} driver location history points")
+        return deleted
+
+    def history(self, driver_id, since=None, until=None, limit=1000):
+        query = DriverLocationHistory.query.filter(DriverLocationHistory.driver_id == driver_id)
+        if since:
+            query = query.filter(DriverLocationHistory.recorded_at >= since)
+        if until:
+            query = query.filter(DriverLocationHistory.recorded_at <= until)
+        return query.order_by(DriverLocationHistory.recorded_at.desc()).limit(limit).all()
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'pending': len(self._dirty), 'pending_history': len(self._history),
+                    'tracked_drivers': len(self._latest)}
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.flush_interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+                    if time.monotonic() - self._last_purge > 3600:
+                        self._last_purge = time.monotonic()
+                        self.purge_history()
+            except Exception as e:
+                logger.error(f"Driver location store error: {str(e)}")
+
+
+# Global instance
+location_store = DriverLocationStore()
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class LocationStream:
+    """Sequence-numbered feed of driver location changes for the admin map.
+
+    Each accepted ping becomes a ``[driver_id, lat, lng]`` delta with a
+    sequence number, kept in a bounded ring buffer. Clients pass the last
+    sequence they saw as a cursor and receive only newer deltas; a cursor
+    that has fallen out of the buffer gets ``reset`` so the client refetches
+    the full driver list.
+
+    Pings are throttled per driver: at most one delta per
+    LOCATION_STREAM_MIN_SECONDS, and moves under LOCATION_STREAM_MIN_DEGREES
+    are dropped. A throttled ping is held back and published once the
+    interval has passed, so the map always ends on the latest position.
+    A driver taken off the map gets a ``[driver_id, None, None]`` delta.
+    """
+
+    def __init__(self):
+        self.min_interval = float(os.getenv('LOCATION_STREAM_MIN_SECONDS', '2'))
+        self.min_degrees = float(os.getenv('LOCATION_STREAM_MIN_DEGREES', '0.00005'))  # about 5m
+        self.buffer = deque(maxlen=int(os.getenv('LOCATION_STREAM_BUFFER', '5000')))
+        self.seq = 0
+        self._published = {}  # driver id -> (lat, lng, monotonic time) last sent
+        self._held = {}       # driver id -> (lat, lng) throttled, not sent yet
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def _delta(driver_id, lat, lng):
+        return [driver_id, round(lat, 5), round(lng, 5)]
+
+    def _append(self, driver_id, lat, lng, now):
+        self.seq += 1
+        self.buffer.append((self.seq, self._delta(driver_id, lat, lng)))
+        self._published[driver_id] = (lat, lng, now)
+
+    def publish(self, driver_id, lat, lng):
+        if lat is None or lng is None:
+            return
+        now = time.monotonic()
+        with self._condition:
+            last = self._published.get(driver_id)
+            if last and abs(lat - last[0]) < self.min_degrees and abs(lng - last[1]) < self.min_degrees:
+                self._held.pop(driver_id, None)
+                return
+            if last and now - last[2] < self.min_interval:
+                self._held[driver_id] = (lat, lng)
+            else:
+                self._held.pop(driver_id, None)
+                self._append(driver_id, lat, lng, now)
+            # Waiters also need to know about held pings to wake up when they are due
+            self._condition.notify_all()
+
+    def remove(self, driver_id):
+        """Drop a driver from the feed, telling clients to remove its marker"""
+        with self._condition:
+            self._held.pop(driver_id, None)
+            if self._published.pop(driver_id, None) is None:
+                return
+            self.seq += 1
+            self.buffer.append((self.seq, [driver_id, None, None]))
+            self._condition.notify_all()
+
+    def _release_held(self):
+        """Publish held-back pings whose throttle interval is over. Caller holds the lock."""
+        if not self._held:
+            return
+        now = time.monotonic()
+        for driver_id, (lat, lng) in list(self._held.items()):
+            if now - self._published[driver_id][2] >= self.min_interval:
+                del self._held[driver_id]
+                self._append(driver_id, lat, lng, now)
+
+    def _since(self, cursor):
+        if not self.buffer or cursor >= self.seq:
+            return [], False
+        oldest = self.buffer[0][0]
+        if cursor < oldest - 1:
+            return [], True
+        # Sequence numbers are contiguous, so the start position is just an offset
+        start = cursor - oldest + 1
+        # A client that fell behind only needs each driver's latest move
+        latest = {}
+        for i in range(start, len(self.buffer)):
+            delta = self.buffer[i][1]
+            latest.pop(delta[0], None)
+            latest[delta[0]] = delta
+        return list(latest.values()), False
+
+    def updates(self, cursor, timeout=0.0):
+        """(deltas, new cursor, reset) newer than ``cursor``, waiting up to ``timeout`` seconds"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._release_held()
+                if cursor is None or cursor > self.seq:
+                    return [], self.seq, cursor is not None
+                deltas, reset = self._since(cursor)
+                if deltas or reset:
+                    return deltas, self.seq, reset
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], self.seq, False
+                # Wake up for new pings, or in time to release held ones
+                self._condition.wait(min(remaining, self.min_interval if self._held else remaining))
+
+    def snapshot(self):
+        """Last published position of every driver, plus the cursor to continue from"""
+        with self._condition:
+            self._release_held()
+            return [self._delta(driver_id, lat, lng) for driver_id, (lat, lng, _) in self._published.items()], self.seq
+
+
+# Global instance
+location_stream = LocationStream()
@@ -0,0 +1,216 @@
+import os
+import queue
+import threading
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import bindparam, case, func, select
+
+from src.models.user import db
+from src.models.customer import Customer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RewardRule:
+    reward: str         # reward type used in emails and the rewards API
+    every: int          # completed bookings per reward earned
+    earned_column: str
+    used_column: str
+    label: str
+    plural_suffix: str
+
+
+LOYALTY_RULES = (
+    RewardRule('free_wash', int(os.getenv('LOYALTY_FREE_WASH_EVERY', '5')),
+               'free_washes_earned', 'free_washes_used', 'Free Wash', 'es'),
+    RewardRule('15_percent_discount', int(os.getenv('LOYALTY_DISCOUNT_15_EVERY', '10')),
+               'discount_15_earned', 'discount_15_used', '15% Discount', 's'),
+)
+
+
+def earned_rewards(completed_bookings, earned):
+    """Rewards newly due for a completed-bookings count, given what was already earned.
+
+    ``earned`` maps earned column -> count. Returns a list of (rule, new total).
+    """
+    due = []
+    for rule in LOYALTY_RULES:
+        target = (completed_bookings or 0) // rule.every
+        if target > (earned.get(rule.earned_column) or 0):
+            due.append((rule, target))
+    return due
+
+
+def available_rewards(customer):
+    """Unused rewards of a customer, as shown in the rewards API and emails"""
+    rewards = []
+    for rule in LOYALTY_RULES:
+        count = (getattr(customer, rule.earned_column) or 0) - (getattr(customer, rule.used_column) or 0)
+        if count > 0:
+            rewards.append({
+                'type': rule.reward,
+                'count': count,
+                'description': f'{count} {rule.label}{rule.plural_suffix if count > 1 else ""} Available'
+            })
+    return rewards
+
+
+class LoyaltyEngine:
+    """Loyalty counters and rewards driven by ``LOYALTY_RULES``.
+
+    A completed booking is counted with one UPDATE that increments in SQL;
+    the returned count is checked against the rules and only rewards that
+    became due are written. ``recompute`` re-applies the rules to every
+    customer at once with NumPy, for when the thresholds change. Reward
+    emails are sent from a background thread so status updates don't wait
+    on SMTP.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.running = False
+        self.thread = None
+        self._emails = queue.Queue(maxsize=int(os.getenv('LOYALTY_EMAIL_QUEUE_SIZE', '1000')))
+
+    def start(self, app):
+        if self.running:
+            return
+        self.app = app
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info("Loyalty reward emails worker started")
+
+    # -- incremental ----------------------------------------------------------
+
+    def record_completion(self, email, points=1, completed_at=None):
+        """Count one completed booking for the customer with this email.
+
+        Runs in the caller's transaction. Returns the reward types newly
+        earned (empty when none, or when no customer has this email).
+        """
+        table = Customer.__table__
+        earned_columns = [table.c[rule.earned_column] for rule in LOYALTY_RULES]
+        row = db.session.execute(
+            table.update().where(table.c.email == email).values(
+                completed_bookings=func.coalesce(table.c.completed_bookings, 0) + 1,
+                loyalty_points=func.coalesce(table.c.loyalty_points, 0) + (points or 0),
+                last_booking_date=completed_at or datetime.utcnow(),
+                updated_at=datetime.utcnow()
+            ).returning(table.c.id, table.c.completed_bookings, *earned_columns)
+        ).first()
+        if row is None:
+            return []
+
+        # The update holds the row lock, so the earned counts read back are current
+        due = earned_rewards(row.completed_bookings, row._mapping)
+        if due:
+            db.session.execute(
+                table.update().where(table.c.id == row.id).values({
+                    rule.earned_column: case(
+                        (func.coalesce(table.c[rule.earned_column], 0) < target, target),
+                        else_=table.c[rule.earned_column]
+                    )
+                    for rule, target in due
+                })
+            )
+        return [rule.reward for rule, _ in due]
+
+    # -- batch ----------------------------------------------------------------
+
+    def recompute(self, revoke=False, dry_run=False):
+        """Re-apply the rules to every customer.
+
+        Earned counts are raised to what the completed bookings are worth. With
+        ``revoke`` they are also lowered to it, but never below what was used.
+        """
+        table = Customer.__table__
+        columns = [func.coalesce(table.c.completed_bookings, 0)]
+        for rule in LOYALTY_RULES:
+            columns.append(func.coalesce(table.c[rule.earned_column], 0))
+            columns.append(func.coalesce(table.c[rule.used_column], 0))
+        rows = db.session.execute(select(table.c.id, *columns)).all()
+
+        report = {'success': True, 'customers': len(rows), 'changed': 0, 'dry_run': dry_run,
+                  'rules': {rule.reward: rule.every for rule in LOYALTY_RULES},
+                  'granted': {}, 'revoked': {}}
+        if not rows:
+            return report
+
+        ids = [row[0] for row in rows]
+        values = np.array([row[1:] for row in rows], dtype=np.int64)
+        completed = values[:, 0]
+        changed = np.zeros(len(rows), dtype=bool)
+        updates = {}
+        for position, rule in enumerate(LOYALTY_RULES):
+            earned = values[:, 1 + 2 * position]
+            used = values[:, 2 + 2 * position]
+            target = completed // rule.every
+            new_earned = np.maximum(target, used) if revoke else np.maximum(target, earned)
+            report['granted'][rule.reward] = int(np.clip(new_earned - earned, 0, None).sum())
+            report['revoked'][rule.reward] = int(np.clip(earned - new_earned, 0, None).sum())
+            changed |= new_earned != earned
+            updates[rule.earned_column] = new_earned
+
+        indices = np.flatnonzero(changed)
+        report['changed'] = int(len(indices))
+        if dry_run or not len(indices):
+            return report
+
+        statement = table.update().where(table.c.id == bindparam('_id')).values(
+            {rule.earned_column: bindparam(f'_{rule.earned_column}') for rule in LOYALTY_RULES}
+        )
+        parameters = [
+            {'_id': ids[i], **{f'_{column}': int(counts[i]) for column, counts in updates.items()}}
+            for i in indices.tolist()
+        ]
+        db.session.execute(statement, parameters)
+        db.session.commit()
+        logger.info(f"Loyalty recompute updated {report['changed']} of {report['customers']} customers")
+        return report
+
+    # -- emails ---------------------------------------------------------------
+
+    def notify(self, email, rewards):
+        """Queue a reward email; call after the completion is committed"""
+        if not rewards:
+            return
+        try:
+            self._emails.put_nowait((email, list(rewards)))
+        except queue.Full:
+            logger.error(f"Loyalty email queue full - not notifying {email} of {rewards}")
+
+    def _send(self, email, rewards):
+        from src.services.email_service import email_service
+
+        customer = Customer.query.filter_by(email=email).first()
+        if not customer:
+            return False
+        sent = email_service.send_loyalty_reward_email({
+            'customer_name': customer.name,
+            'customer_email': customer.email,
+            'rewards_earned': rewards,
+            'total_bookings': customer.completed_bookings,
+            'available_rewards': available_rewards(customer)
+        })
+        logger.info(f"Loyalty reward email for {email} ({', '.join(rewards)}): {'sent' if sent else 'failed'}")
+        return sent
+
+    def _run(self):
+        while self.running:
+            email, rewards = self._emails.get()
+            try:
+                with self.app.app_context():
+                    self._send(email, rewards)
+            except Exception as e:
+                logger.error(f"Error sending loyalty reward email: {str(e)}")
+            finally:
+                self._emails.task_done()
+
+
+# Global instance
+loyalty_engine = LoyaltyEngine()
@@ -8,10 +8,14 @@ from src.models.user import db
 from src.models.subscription_plan import CustomerSubscription, SubscriptionService
 from src.models.notification import ServiceNotification, LiveNotification
 from src.services.subscription_service import SubscriptionService as SubService
+from src.services.rate_limiter import rate_limiters, is_throttling_error, RateLimitExceeded
+from src.services.stripe_reconciliation import stripe_reconciler
+from src.services.visit_schedule import visit_materializer
 import os
 
 class NotificationScheduler:
     def __init__(self):
+        self.app = None
         self.running = False
         self.thread = None
         
@@ -22,9 +26,22 @@ class NotificationScheduler:
         self.email_password = os.getenv('EMAIL_PASSWORD', 'your-app-password')
         self.company_email = 'infinitemobilecarwashdetailing@gmail.com'
         
-    def start(self):
+        # Gmail enforces per-minute send limits - pace sends and apply backpressure
+        self.email_limiter = rate_limiters.get('gmail_smtp')
+        self.batch_size = int(os.getenv('NOTIFICATION_BATCH_SIZE', '100'))
+        self.max_email_wait = float(os.getenv('NOTIFICATION_MAX_EMAIL_WAIT', '60'))
+        
+        # Nightly Stripe reconciliation
+        self.reconcile_hour = int(os.getenv('STRIPE_RECONCILE_HOUR', '3'))
+        self.last_reconciled = None
+        
+        # Subscription visits are materialised over the horizon once a day
+        self.last_materialized = None
+        
+    def start(self, app):
         """Start the notification scheduler"""
         if not self.running:
+            self.app = app
             self.running = True
             self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
             self.thread.start()
@@ -41,15 +58,22 @@ class NotificationScheduler:
         """Main scheduler loop"""
         while self.running:
             try:
-                # Process pending notifications every 5 minutes
-                self._process_pending_notifications()
-                
-                # Schedule new notifications every hour
-                self._schedule_upcoming_notifications()
-                
-                # Clean up old notifications daily
-                if datetime.now().hour == 2:  # Run at 2 AM
-                    self._cleanup_old_notifications()
+                with self.app.app_context():
+                    # Create upcoming subscription visits first so reminders see them
+                    self._materialize_visits()
+                    
+                    # Process pending notifications every 5 minutes
+                    self._process_pending_notifications()
+                    
+                    # Schedule new notifications every hour
+                    self._schedule_upcoming_notifications()
+                    
+                    # Clean up old notifications daily
+                    if datetime.now().hour == 2:  # Run at 2 AM
+                        self._cleanup_old_notifications()
+                    
+                    # Reconcile the subscription mirror with Stripe once a night
+                    self._reconcile_stripe()
                 
                 # Sleep for 5 minutes
                 time.sleep(300)
@@ -58,19 +82,57 @@ class NotificationScheduler:
                 print(f"Error in notification scheduler: {str(e)}")
                 time.sleep(60)  # Wait 1 minute before retrying
     
+    def _reconcile_stripe(self):
+        """Run the Stripe reconciliation once during STRIPE_RECONCILE_HOUR each day"""
+        now = datetime.now()
+        if now.hour != self.reconcile_hour or self.last_reconciled == now.date():
+            return
+        self.last_reconciled = now.date()
+        try:
+            stripe_reconciler.run()
+        except Exception as e:
+            print(f"Error reconciling Stripe subscriptions: {str(e)}")
+    
+    def _materialize_visits(self):
+        """Fill the subscription visit horizon once a day"""
+        today = date.today()
+        if self.last_materialized == today:
+            return
+        result = visit_materializer.materialize()
+        if result['success']:
+            self.last_materialized = today
+        else:
+            print(f"Error materialising subscription visits: {result['error']}")
+    
     def _process_pending_notifications(self):
-        """Process and send pending notifications"""
+        """Process and send pending notifications.
+
+        Sends are paced by the Gmail rate limiter. When the limiter falls too far
+        behind, or Gmail throttles us, the rest of the batch is left pending for
+        the next run instead of being marked as failed.
+        """
         try:
             current_time = datetime.utcnow()
             
-            # Get notifications that should be sent now
+            # Get notifications that should be sent now, oldest first
             pending_notifications = ServiceNotification.query.filter(
                 ServiceNotification.status == 'pending',
                 ServiceNotification.scheduled_send_time <= current_time
-            ).all()
+            ).order_by(ServiceNotification.scheduled_send_time.asc()).limit(self.batch_size).all()
             
             for notification in pending_notifications:
-                success = self._send_notification(notification)
+                if notification.send_email and self.email_limiter.estimated_wait() > self.max_email_wait:
+                    print(f"Email backpressure: deferring remaining notifications "
+                          f"(queue depth {self.email_limiter.queue_depth})")
+                    break
+                
+                try:
+                    success = self._send_notification(notification)
+                except RateLimitExceeded:
+                    # Leave the notification pending; it is retried on the next run
+                    db.session.rollback()
+                    print(f"Notification deferred (throttled): {notification.notification_id}")
+                    break
                 
                 if success:
                     notification.status = 'sent'
@@ -164,6 +226,8 @@ class NotificationScheduler:
             
             return success
             
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error sending notification: {str(e)}")
             return False
@@ -227,6 +291,9 @@ class NotificationScheduler:
             html_part = MIMEText(html_body, 'html')
             msg.attach(html_part)
             
+            if not self.email_limiter.acquire(timeout=self.max_email_wait):
+                raise RateLimitExceeded(f"Gmail send queue is full for {subscription.customer_email}")
+            
             with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
                 server.starttls()
                 server.login(self.email_user, self.email_password)
@@ -235,7 +302,12 @@ class NotificationScheduler:
             print(f"Email sent to {subscription.customer_email}")
             return True
             
+        except RateLimitExceeded:
+            raise
         except Exception as e:
+            if is_throttling_error(e):
+                self.email_limiter.penalize()
+                raise RateLimitExceeded(str(e))
             print(f"Error sending email: {str(e)}")
             return False
     
@@ -0,0 +1,57 @@
+import json
+import base64
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe cursor for the sort key of the last row on a page"""
+    values = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Sort key values from a cursor, typed like ``columns``. Raises ValueError if malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+
+    typed = []
+    for value, column in zip(values, columns):
+        python_type = column.type.python_type
+        try:
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            elif value is not None:
+                value = python_type(value)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        typed.append(value)
+    return typed
+
+
+def keyset_page(query, sort_column, id_column, cursor=None, limit=20):
+    """One page of ``query`` in (sort_column, id_column) descending order.
+
+    Rows are found by seeking past the cursor rather than with OFFSET, so a
+    page costs the same however deep it is. Returns (rows, next_cursor);
+    next_cursor is None on the last page.
+    """
+    if cursor:
+        sort_value, id_value = decode_cursor(cursor, (sort_column, id_column))
+        query = query.filter(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, id_column < id_value)
+        ))
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor((getattr(last, sort_column.key), getattr(last, id_column.key)))
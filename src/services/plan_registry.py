@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from src.models.user import db
+from src.models.subscription_plan import SubscriptionPlan
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PlanRecord:
+    """Read-only copy of a subscription plan row, safe to share between threads"""
+    id: int
+    plan_id: str
+    name: str
+    description: Optional[str]
+    service_type: str
+    vehicle_types: Tuple[str, ...]
+    base_price: float
+    frequency_options: Tuple[str, ...]
+    duration_minutes: Optional[int]
+    features: Tuple[str, ...]
+    is_premium: bool
+    is_active: bool
+    created_at: Optional[object]
+
+    @property
+    def home_alias(self):
+        """Plan id used by the website, e.g. PLAN_MINI_VALET_HOME"""
+        return f"PLAN_{self.service_type.upper()}_HOME"
+
+    def calculate_subscription_price(self, frequency, vehicle_type):
+        return SubscriptionPlan.calculate_subscription_price(self, frequency, vehicle_type)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'plan_id': self.plan_id,
+            'name': self.name,
+            'description': self.description,
+            'service_type': self.service_type,
+            'vehicle_types': list(self.vehicle_types),
+            'base_price': self.base_price,
+            'frequency_options': list(self.frequency_options),
+            'duration_minutes': self.duration_minutes,
+            'features': list(self.features),
+            'is_premium': self.is_premium,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class PlanSnapshot:
+    """Immutable set of plans with lookup indexes built once per refresh"""
+
+    def __init__(self, records):
+        self.records = tuple(records)
+        self.loaded_at = time.monotonic()
+
+        by_plan_id = {}
+        by_service_type = {}
+        by_name = {}
+        by_alias = {}
+        for record in self.records:
+            by_plan_id[record.plan_id] = record
+            if record.is_active:
+                # First active plan wins, matching the old query(...).first() lookups
+                by_service_type.setdefault(record.service_type, record)
+                by_name.setdefault(record.name.lower(), record)
+                by_alias.setdefault(record.home_alias, record)
+
+        self.by_plan_id = MappingProxyType(by_plan_id)
+        self.by_service_type = MappingProxyType(by_service_type)
+        self.by_name = MappingProxyType(by_name)
+        self.by_alias = MappingProxyType(by_alias)
+        self.active = tuple(record for record in self.records if record.is_active)
+
+
+class PlanRegistry:
+    """Process-wide in-memory index of subscription plans.
+
+    Readers grab the current snapshot without locking; a refresh builds a new
+    snapshot and swaps the reference. Commits that touch ``SubscriptionPlan``
+    mark the registry stale so the next lookup reloads it, and
+    ``PLAN_REGISTRY_TTL_SECONDS`` bounds staleness across worker processes.
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv('PLAN_REGISTRY_TTL_SECONDS', '300'))
+        self._snapshot = None
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Reload all plans from the database and atomically publish the new snapshot"""
+        with self._lock:
+            # Own connection so a reload never flushes or joins the caller's session
+            with db.engine.connect() as connection:
+                rows = connection.execute(
+                    select(SubscriptionPlan.__table__).order_by(SubscriptionPlan.__table__.c.id)
+                ).mappings().all()
+
+            snapshot = PlanSnapshot(self._to_record(row) for row in rows)
+            self._snapshot = snapshot
+            self._stale = False
+
+        logger.info(f"Plan registry loaded {len(snapshot.records)} plans")
+        return snapshot
+
+    def invalidate(self):
+        self._stale = True
+
+    @staticmethod
+    def _to_record(row):
+        return PlanRecord(
+            id=row['id'],
+            plan_id=row['plan_id'],
+            name=row['name'],
+            description=row['description'],
+            service_type=row['service_type'],
+            vehicle_types=tuple(row['vehicle_types'] or ()),
+            base_price=row['base_price'],
+            frequency_options=tuple(row['frequency_options'] or ()),
+            duration_minutes=row['duration_minutes'],
+            features=tuple(row['features'] or ()),
+            is_premium=bool(row['is_premium']),
+            is_active=bool(row['is_active']) if row['is_active'] is not None else True,
+            created_at=row['created_at']
+        )
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None or self._stale or time.monotonic() - snapshot.loaded_at > self.ttl:
+            snapshot = self.refresh()
+        return snapshot
+
+    def get(self, plan_id, active_only=False):
+        """Exact plan_id lookup"""
+        record = self.snapshot().by_plan_id.get(plan_id)
+        if record and active_only and not record.is_active:
+            return None
+        return record
+
+    def get_by_service_type(self, service_type):
+        return self.snapshot().by_service_type.get(service_type)
+
+    def get_by_name(self, name):
+        return self.snapshot().by_name.get((name or '').lower())
+
+    def resolve(self, plan_id):
+        """Resolve an active plan from a plan_id, a PLAN_<SERVICE>_HOME alias or a plan name"""
+        if not plan_id:
+            return None
+        snapshot = self.snapshot()
+        record = snapshot.by_plan_id.get(plan_id)
+        if record and record.is_active:
+            return record
+        return snapshot.by_alias.get(plan_id) or snapshot.by_name.get(plan_id.lower())
+
+    def active_plans(self):
+        return self.snapshot().active
+
+    def first_active(self):
+        active = self.snapshot().active
+        return active[0] if active else None
+
+
+# Global instance
+plan_registry = PlanRegistry()
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_plan_changes(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SubscriptionPlan):
+            session.info['plans_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_plan_registry(session):
+    if session.info.pop('plans_changed', False):
+        plan_registry.invalidate()
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+@event.listens_for(Session, 'after_bulk_update')
+def _track_bulk_plan_changes(delete_context):
+    if delete_context.mapper.class_ is SubscriptionPlan:
+        delete_context.session.info['plans_changed'] = True
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_plan_changes(session):
+    session.info.pop('plans_changed', None)
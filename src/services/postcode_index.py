@@ -0,0 +1,211 @@
+"""
+Offline UK postcode geocoding.
+
+Postcode centroids are kept as three sorted, memory-mapped NumPy arrays
+(keys, latitudes, longitudes) and looked up with a binary search, so a lookup
+costs a few microseconds and never touches the network.
+
+The bundled table (src/data/postcode_districts.csv) has approximate centroids
+of the postcode districts around Derby. A full table, e.g. the ONS Postcode
+Directory or Code-Point Open exported as postcode,latitude,longitude, can be
+added with POSTCODE_CSV or built ahead of time:
+
+    python -m src.services.postcode_index build path/to/postcodes.csv
+
+Lookups fall back from the full postcode to its sector (DE1 1), district
+(DE1) and area (DE), so a district-only table still places every address.
+"""
+
+import os
+import re
+import csv
+import sys
+import threading
+import logging
+
+import numpy as np
+
+from src.services.geo import haversine_km
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+BUNDLED_CSV = os.path.join(DATA_DIR, 'postcode_districts.csv')
+KEY_DTYPE = 'S8'  # longest key is a full postcode with its space, e.g. 'DE21 7AB'
+
+# Outward code + optional inward code, e.g. 'DE1 1AA', 'de11aa', 'DE21'
+_POSTCODE = re.compile(r'\b([A-Z]{1,2}[0-9][A-Z0-9]?)\s*([0-9][A-Z]{2})?\b')
+
+PRECISIONS = ('postcode', 'sector', 'district', 'area')
+
+
+def normalise_postcode(text):
+    """UK postcode in ``text`` as 'DE1 1AA' (or an outward code 'DE1'), else None.
+
+    A full postcode anywhere in the text wins; otherwise the last outward-code
+    looking token is used, since addresses end with the postcode.
+    """
+    matches = _POSTCODE.findall((text or '').upper())
+    if not matches:
+        return None
+    full = [(outward, inward) for outward, inward in matches if inward]
+    outward, inward = full[0] if full else matches[-1]
+    return f"{outward} {inward}" if inward else outward
+
+
+def lookup_keys(postcode):
+    """Keys to try for a normalised postcode, most precise first"""
+    outward, _, inward = postcode.partition(' ')
+    keys = []
+    if inward:
+        keys.append(('postcode', postcode))
+        keys.append(('sector', f"{outward} {inward[0]}"))
+    keys.append(('district', outward))
+    keys.append(('area', re.match(r'[A-Z]+', outward).group(0)))
+    return keys
+
+
+def build_index(csv_paths, out_dir):
+    """Build the sorted key/lat/lng arrays from CSVs of postcode,latitude,longitude.
+
+    Sector, district and area centroids are derived as the mean of the rows
+    under them unless the CSV lists them itself.
+    """
+    points = {}
+    for path in csv_paths:
+        with open(path, newline='') as handle:
+            for row in csv.DictReader(handle):
+                postcode = normalise_postcode(row.get('postcode') or row.get('pcds') or row.get('pcd'))
+                try:
+                    lat, lng = float(row.get('latitude') or row.get('lat')), float(row.get('longitude') or row.get('long') or row.get('lng'))
+                except (TypeError, ValueError):
+                    continue
+                if postcode and -90 <= lat <= 90 and -180 <= lng <= 180:
+                    points[postcode] = (lat, lng)
+
+    derived = {}
+    for postcode, (lat, lng) in points.items():
+        for _, key in lookup_keys(postcode)[1:]:
+            if key not in points:
+                total = derived.setdefault(key, [0.0, 0.0, 0])
+                total[0] += lat
+                total[1] += lng
+                total[2] += 1
+    for key, (lat_sum, lng_sum, count) in derived.items():
+        points[key] = (lat_sum / count, lng_sum / count)
+
+    keys = np.array(sorted(points), dtype=KEY_DTYPE)
+    lat = np.array([points[key.decode()][0] for key in keys], dtype=np.float64)
+    lng = np.array([points[key.decode()][1] for key in keys], dtype=np.float64)
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, array in (('keys', keys), ('lat', lat), ('lng', lng)):
+        tmp_path = os.path.join(out_dir, f"{name}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(out_dir, f"{name}.npy"))
+    logger.info(f"Built postcode index with {len(keys)} keys in {out_dir}")
+    return len(keys)
+
+
+class PostcodeIndex:
+    """Memory-mapped postcode centroid table with binary-search lookups"""
+
+    def __init__(self):
+        self.index_dir = os.getenv('POSTCODE_INDEX_DIR', os.path.join(DATA_DIR, 'postcode_index'))
+        extra = os.getenv('POSTCODE_CSV')
+        self.csv_paths = [BUNDLED_CSV] + ([extra] if extra else [])
+        self.service_center = tuple(float(value) for value in os.getenv('SERVICE_AREA_CENTER', '52.9225,-1.4746').split(','))
+        self.service_radius_km = float(os.getenv('SERVICE_AREA_RADIUS_KM', '25'))
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def _is_stale(self):
+        keys_path = os.path.join(self.index_dir, 'keys.npy')
+        if not os.path.exists(keys_path):
+            return True
+        built = os.path.getmtime(keys_path)
+        return any(os.path.exists(path) and os.path.getmtime(path) > built for path in self.csv_paths)
+
+    def _load(self):
+        arrays = self._arrays
+        if arrays is None:
+            with self._lock:
+                if self._arrays is None:
+                    if self._is_stale():
+                        build_index([path for path in self.csv_paths if os.path.exists(path)], self.index_dir)
+                    self._arrays = tuple(
+                        np.load(os.path.join(self.index_dir, f"{name}.npy"), mmap_mode='r')
+                        for name in ('keys', 'lat', 'lng')
+                    )
+                arrays = self._arrays
+        return arrays
+
+    def reload(self):
+        with self._lock:
+            self._arrays = None
+
+    def _find(self, key):
+        keys, lat, lng = self._load()
+        needle = np.array(key, dtype=KEY_DTYPE)
+        position = int(np.searchsorted(keys, needle))
+        if position < len(keys) and keys[position] == needle:
+            return float(lat[position]), float(lng[position])
+        return None
+
+    def geocode(self, text):
+        """{'postcode', 'lat', 'lng', 'precision'} for the postcode in ``text``, or None"""
+        postcode = normalise_postcode(text)
+        if not postcode:
+            return None
+        for precision, key in lookup_keys(postcode):
+            found = self._find(key)
+            if found:
+                return {'postcode': postcode, 'lat': found[0], 'lng': found[1], 'precision': precision}
+        return None
+
+    def geocode_many(self, texts):
+        """(lat, lng) arrays for many addresses at once; NaN where nothing matched"""
+        keys, lat, lng = self._load()
+        result_lat = np.full(len(texts), np.nan)
+        result_lng = np.full(len(texts), np.nan)
+        if not len(keys):
+            return result_lat, result_lng
+        candidates = [lookup_keys(postcode) if postcode else [] for postcode in map(normalise_postcode, texts)]
+
+        for level in range(len(PRECISIONS)):
+            pending = [i for i, keys_for in enumerate(candidates) if np.isnan(result_lat[i]) and level < len(keys_for)]
+            if not pending:
+                continue
+            needles = np.array([candidates[i][level][1] for i in pending], dtype=KEY_DTYPE)
+            positions = np.minimum(np.searchsorted(keys, needles), len(keys) - 1)
+            matched = keys[positions] == needles
+            rows = np.asarray(pending)[matched]
+            result_lat[rows] = lat[positions[matched]]
+            result_lng[rows] = lng[positions[matched]]
+        return result_lat, result_lng
+
+    def service_area(self, text):
+        """Whether an address is inside the service radius"""
+        located = self.geocode(text)
+        if not located:
+            return {'covered': None, 'postcode': normalise_postcode(text), 'distance_km': None, 'precision': None}
+        distance = float(haversine_km(self.service_center[0], self.service_center[1], located['lat'], located['lng']))
+        return {
+            'covered': distance <= self.service_radius_km,
+            'postcode': located['postcode'],
+            'distance_km': round(distance, 1),
+            'precision': located['precision'],
+            'radius_km': self.service_radius_km
+        }
+
+
+# Global instance
+postcode_index = PostcodeIndex()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'build':
+        print("Usage: python -m src.services.postcode_index build postcodes.csv [more.csv ...]")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    build_index([BUNDLED_CSV] + sys.argv[2:], postcode_index.index_dir)
@@ -0,0 +1,146 @@
+import hashlib
+import threading
+import logging
+
+import numpy as np
+
+from src.services.plan_registry import plan_registry
+
+logger = logging.getLogger(__name__)
+
+VEHICLE_TYPES = ('small_car', 'medium_car', 'large_car', 'van')
+FREQUENCIES = ('weekly', 'bi_weekly', 'monthly', 'yearly')
+
+# Home Base price points per vehicle; services not listed charge base_price for every vehicle
+VEHICLE_PRICE_POINTS = {
+    'mini_valet': (35.0, 50.0, 60.0, 75.0),
+    'full_valet': (80.0, 100.0, 125.0, 140.0),
+}
+
+# Per frequency: visits included in the published price, and the per-visit discount
+VISITS_PER_QUOTE = np.array([4, 2, 1, 1], dtype=np.int64)
+FREQUENCY_DISCOUNTS = np.array([0.85, 0.9, 1.0, 1.0])
+
+_VEHICLE_INDEX = {vehicle_type: index for index, vehicle_type in enumerate(VEHICLE_TYPES)}
+_FREQUENCY_INDEX = {frequency: index for index, frequency in enumerate(FREQUENCIES)}
+
+
+def _vehicle_ratios(service_type):
+    points = VEHICLE_PRICE_POINTS.get(service_type)
+    if not points:
+        return np.ones(len(VEHICLE_TYPES))
+    return np.asarray(points) / points[0]
+
+
+def _vehicle_index(vehicle_type):
+    # Unknown vehicles price as a small car, as the old multiplier tables did
+    return _VEHICLE_INDEX.get(vehicle_type, 0)
+
+
+def _frequency_index(frequency):
+    return _FREQUENCY_INDEX.get(frequency, _FREQUENCY_INDEX['monthly'])
+
+
+class PriceMatrix:
+    """Prices for every plan x vehicle_type x frequency, in integer pence.
+
+    ``interval_pence`` is what Stripe charges per billing interval (one visit);
+    ``quote_pence`` is the published price (weekly = 4 visits, bi-weekly = 2).
+    """
+
+    def __init__(self, plans):
+        self.service_types = tuple(plan.service_type for plan in plans)
+        self.index = {}
+        for active in (True, False):
+            for i, plan in enumerate(plans):
+                if bool(plan.is_active) == active:
+                    self.index.setdefault(plan.service_type, i)
+        self.base_prices = np.array([plan.base_price for plan in plans], dtype=np.float64)
+        ratios = np.array([_vehicle_ratios(plan.service_type) for plan in plans]).reshape(
+            len(plans), len(VEHICLE_TYPES))
+
+        base_pence = self.base_prices * 100
+        self.interval_pence = np.rint(
+            base_pence[:, None, None] * ratios[:, :, None] * FREQUENCY_DISCOUNTS[None, None, :]
+        ).astype(np.int64)
+        self.quote_pence = self.interval_pence * VISITS_PER_QUOTE[None, None, :]
+
+        digest = hashlib.sha1()
+        digest.update(repr(self.service_types).encode())
+        digest.update(self.base_prices.tobytes())
+        digest.update(ratios.tobytes())
+        digest.update(FREQUENCY_DISCOUNTS.tobytes())
+        self.version = digest.hexdigest()[:12]
+
+    def lookup(self, matrix, service_type, vehicle_type, frequency, base_price=None):
+        plan_index = self.index.get(service_type)
+        if plan_index is None or (base_price is not None and base_price != self.base_prices[plan_index]):
+            return None
+        return int(matrix[plan_index, _vehicle_index(vehicle_type), _frequency_index(frequency)])
+
+
+class PricingEngine:
+    """Single source of subscription prices for the plans endpoint, checkout and subscriptions.
+
+    The matrix is rebuilt whenever the plan registry publishes a new snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._source = None
+
+    def matrix(self):
+        snapshot = plan_registry.snapshot()
+        if self._source is not snapshot:
+            with self._lock:
+                if self._source is not snapshot:
+                    self._matrix = PriceMatrix(snapshot.records)
+                    self._source = snapshot
+                    logger.info(f"Built price matrix {self._matrix.version} "
+                                f"for {len(snapshot.records)} plans")
+        return self._matrix
+
+    @property
+    def version(self):
+        return self.matrix().version
+
+    @staticmethod
+    def compute_interval_pence(service_type, base_price, vehicle_type, frequency):
+        """Scalar form of the matrix formula, for plans not (yet) in the registry"""
+        ratio = _vehicle_ratios(service_type)[_vehicle_index(vehicle_type)]
+        return int(np.rint(base_price * 100 * ratio * FREQUENCY_DISCOUNTS[_frequency_index(frequency)]))
+
+    def interval_amount(self, service_type, vehicle_type, frequency, base_price=None):
+        """Pence charged per Stripe billing interval"""
+        matrix = self.matrix()
+        amount = matrix.lookup(matrix.interval_pence, service_type, vehicle_type, frequency, base_price)
+        if amount is None:
+            amount = self.compute_interval_pence(service_type, base_price or 0.0, vehicle_type, frequency)
+        return amount
+
+    def quote(self, service_type, vehicle_type, frequency, base_price=None):
+        """Published subscription price in pence"""
+        matrix = self.matrix()
+        amount = matrix.lookup(matrix.quote_pence, service_type, vehicle_type, frequency, base_price)
+        if amount is None:
+            amount = self.compute_interval_pence(service_type, base_price or 0.0, vehicle_type, frequency) \
+                * int(VISITS_PER_QUOTE[_frequency_index(frequency)])
+        return amount
+
+    def pricing_examples(self, plan):
+        """Published prices in pounds for the plan's vehicle types and frequency options"""
+        matrix = self.matrix()
+        plan_index = matrix.index[plan.service_type]
+        return {
+            vehicle_type: {
+                frequency: float(matrix.quote_pence[plan_index, _vehicle_index(vehicle_type),
+                                                    _frequency_index(frequency)]) / 100
+                for frequency in plan.frequency_options
+            }
+            for vehicle_type in plan.vehicle_types
+        }
+
+
+# Global instance
+pricing_engine = PricingEngine()
@@ -0,0 +1,172 @@
+import os
+import smtplib
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a send should be deferred instead of recorded as failed"""
+
+
+def is_throttling_error(error):
+    """Return True for transient SMTP errors (4xx) that providers use for throttling"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, smtplib.SMTPServerDisconnected)
+
+
+class TokenBucket:
+    """Thread-safe token bucket that paces callers instead of rejecting them.
+
+    Callers reserve a token up front and sleep until it is due, so waiters are
+    served in arrival order. Once ``max_queue`` callers are already waiting,
+    further acquires are rejected so producers can back off.
+    """
+
+    def __init__(self, name, rate_per_minute, burst=None, max_queue=100):
+        self.name = name
+        self.rate_per_minute = float(rate_per_minute)
+        self.rate = self.rate_per_minute / 60.0  # tokens per second
+        self.burst = burst or max(1, int(self.rate_per_minute // 10))
+        self.max_queue = max_queue
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+
+        # Metrics
+        self._waiting = 0
+        self._max_waiting = 0
+        self._acquired = 0
+        self._rejected = 0
+        self._throttled = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+
+    def estimated_wait(self):
+        """Seconds a new caller would currently have to wait for a token"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    @property
+    def queue_depth(self):
+        return self._waiting
+
+    def try_acquire(self):
+        """Take a token only if one is available right now"""
+        return self.acquire(timeout=0)
+
+    def acquire(self, timeout=None):
+        """Wait for a token. Returns False if the wait would exceed ``timeout``
+        or the wait queue is full."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - self._tokens) / self.rate
+                if (timeout is not None and wait > timeout) or self._waiting >= self.max_queue:
+                    self._rejected += 1
+                    return False
+                # Reserve the token now so later callers queue behind us
+                self._tokens -= 1
+                self._waiting += 1
+                self._max_waiting = max(self._max_waiting, self._waiting)
+
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+
+        with self._lock:
+            self._acquired += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        return True
+
+    def penalize(self, seconds=None):
+        """Back off after the provider throttled us: drain the bucket and push
+        the next token ``seconds`` into the future (default: one full minute)."""
+        seconds = 60.0 if seconds is None else seconds
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+            self._throttled += 1
+        logger.warning(f"Rate limiter '{self.name}' throttled by provider - backing off {seconds:.0f}s")
+
+    def get_metrics(self):
+        with self._lock:
+            self._refill()
+            return {
+                'name': self.name,
+                'rate_per_minute': self.rate_per_minute,
+                'burst': self.burst,
+                'tokens_available': round(max(self._tokens, 0.0), 2),
+                'queue_depth': self._waiting,
+                'max_queue_depth': self._max_waiting,
+                'max_queue': self.max_queue,
+                'acquired': self._acquired,
+                'rejected': self._rejected,
+                'throttled': self._throttled,
+                'total_wait_seconds': round(self._total_wait, 3),
+                'avg_wait_seconds': round(self._total_wait / self._acquired, 3) if self._acquired else 0.0,
+                'max_wait_seconds': round(self._max_wait, 3),
+                'estimated_wait_seconds': round(max(0.0, (1 - self._tokens) / self.rate), 3) if self._tokens < 1 else 0.0
+            }
+
+
+class RateLimiterRegistry:
+    """Process-wide registry holding one token bucket per outbound transport"""
+
+    # transport name -> (env var prefix, default sends per minute)
+    DEFAULT_LIMITS = {
+        'ionos_smtp': ('IONOS_SMTP', 20),
+        'gmail_smtp': ('GMAIL_SMTP', 20),
+        'sendgrid': ('SENDGRID', 300)
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def get(self, name):
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                env_prefix, default_rate = self.DEFAULT_LIMITS.get(name, (name.upper(), 60))
+                burst = os.getenv(f'{env_prefix}_BURST')
+                bucket = TokenBucket(
+                    name,
+                    rate_per_minute=float(os.getenv(f'{env_prefix}_RATE_PER_MINUTE', default_rate)),
+                    burst=int(burst) if burst else None,
+                    max_queue=int(os.getenv(f'{env_prefix}_MAX_QUEUE', '100'))
+                )
+                self._buckets[name] = bucket
+            return bucket
+
+    def get_metrics(self):
+        with self._lock:
+            buckets = list(self._buckets.values())
+        return {bucket.name: bucket.get_metrics() for bucket in buckets}
+
+
+# Global instance
+rate_limiters = RateLimiterRegistry()
@@ -0,0 +1,211 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.models.user import db
+from src.models.booking import Booking
+from src.models.subscription_plan import CustomerSubscription, SubscriptionService
+from src.services.availability import (
+    availability_engine, time_to_minutes, minutes_to_time, INACTIVE_BOOKING_STATUSES, ACTIVE_VISIT_STATUSES
+)
+from src.services.geo import distance_matrix_km, locate_booking, locate_subscription
+from src.services.plan_registry import plan_registry
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RouteJob:
+    kind: str  # 'booking' or 'subscription_visit'
+    reference: str
+    customer_name: str
+    service_type: str
+    location_text: Optional[str]
+    location: Optional[Tuple[float, float]]
+    booked_minutes: int
+    duration: int
+
+
+class RoutePlanner:
+    """Orders one driver's jobs for a day to keep driving short while arriving
+    within each job's time window.
+
+    Travel times come from a distance matrix computed once per plan. The route
+    starts from the better of booked-time order and a nearest-neighbour tour,
+    then 2-opt reverses segments while that lowers travel plus lateness.
+    """
+
+    def __init__(self):
+        self.average_speed_kmh = float(os.getenv('ROUTE_AVERAGE_SPEED_KMH', '30'))
+        self.road_factor = float(os.getenv('ROUTE_ROAD_FACTOR', '1.3'))  # road distance vs straight line
+        self.default_travel_minutes = float(os.getenv('ROUTE_DEFAULT_TRAVEL_MINUTES', '20'))
+        # A job may start this many minutes either side of its booked time
+        self.window_minutes = int(os.getenv('ROUTE_WINDOW_MINUTES', '30'))
+        self.late_penalty = float(os.getenv('ROUTE_LATE_PENALTY', '10'))  # per minute late, in travel minutes
+
+    def _jobs(self, driver, day):
+        jobs = []
+        bookings = Booking.query.filter(
+            Booking.service_date == day,
+            Booking.assigned_driver_id == driver.id,
+            Booking.status.notin_(INACTIVE_BOOKING_STATUSES)
+        ).all()
+        for booking in bookings:
+            start = time_to_minutes(booking.service_time)
+            if start is None:
+                continue
+            jobs.append(RouteJob(
+                'booking', booking.booking_id, booking.customer_name, booking.service_type,
+                booking.service_location, locate_booking(booking), start,
+                availability_engine.duration_for(booking.service_type)
+            ))
+
+        visits = db.session.query(SubscriptionService, CustomerSubscription).join(
+            CustomerSubscription, CustomerSubscription.subscription_id == SubscriptionService.subscription_id
+        ).filter(
+            SubscriptionService.scheduled_date == day,
+            SubscriptionService.status.in_(ACTIVE_VISIT_STATUSES),
+            SubscriptionService.assigned_staff.in_([driver.id, driver.driver_id, driver.name])
+        ).all()
+        for visit, subscription in visits:
+            start = time_to_minutes(visit.scheduled_time)
+            if start is None:
+                continue
+            plan = plan_registry.get(subscription.plan_id)
+            jobs.append(RouteJob(
+                'subscription_visit', visit.service_id, subscription.customer_name,
+                plan.service_type if plan else 'subscription',
+                ' '.join(filter(None, (subscription.address, subscription.postcode))) or None,
+                locate_subscription(subscription), start,
+                plan.duration_minutes if plan and plan.duration_minutes else availability_engine.default_duration
+            ))
+        return jobs
+
+    def _travel_matrix(self, origin, jobs):
+        """Minutes between every pair of stops; stop 0 is the driver's start point"""
+        points = np.array([origin or (np.nan, np.nan)] + [job.location or (np.nan, np.nan) for job in jobs], dtype=float)
+        distances = distance_matrix_km(points) * self.road_factor
+        minutes = distances / self.average_speed_kmh * 60
+        minutes = np.where(np.isnan(minutes), self.default_travel_minutes, minutes)
+        np.fill_diagonal(minutes, 0.0)
+        # Driving from an unknown start point costs nothing extra
+        if origin is None:
+            minutes[0, :] = 0.0
+        return distances, minutes
+
+    def _simulate(self, order, travel, open_at, close_at, durations, day_start):
+        """Walk a route: (cost, arrival, start, late) arrays in route order"""
+        arrivals = np.empty(len(order))
+        starts = np.empty(len(order))
+        late = np.empty(len(order))
+        clock = day_start
+        previous = 0
+        driving = 0.0
+        for position, job in enumerate(order):
+            stop = job + 1
+            driving += travel[previous, stop]
+            arrivals[position] = clock + travel[previous, stop]
+            starts[position] = max(arrivals[position], open_at[job])
+            late[position] = max(0.0, starts[position] - close_at[job])
+            clock = starts[position] + durations[job]
+            previous = stop
+        return driving + self.late_penalty * late.sum(), arrivals, starts, late
+
+    def _nearest_neighbour(self, travel, open_at, durations, day_start):
+        remaining = set(range(len(durations)))
+        order = []
+        clock = day_start
+        previous = 0
+        while remaining:
+            # Cheapest next stop counting both driving and waiting for its window to open
+            job = min(remaining, key=lambda j: max(clock + travel[previous, j + 1], open_at[j]) - clock)
+            clock = max(clock + travel[previous, job + 1], open_at[job]) + durations[job]
+            order.append(job)
+            previous = job + 1
+            remaining.remove(job)
+        return order
+
+    def _two_opt(self, order, simulate):
+        best_cost = simulate(order)[0]
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(order) - 1):
+                for j in range(i + 1, len(order)):
+                    candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                    cost = simulate(candidate)[0]
+                    if cost < best_cost - 1e-9:
+                        order, best_cost = candidate, cost
+                        improved = True
+        return order
+
+    def plan(self, driver, day):
+        jobs = self._jobs(driver, day)
+        origin = None
+        if driver.current_location_lat is not None and driver.current_location_lng is not None:
+            origin = (driver.current_location_lat, driver.current_location_lng)
+        if not jobs:
+            return {'success': True, 'date': day.isoformat(), 'stops': [], 'total_distance_km': 0.0,
+                    'total_travel_minutes': 0.0, 'late_stops': 0}
+
+        distances, travel = self._travel_matrix(origin, jobs)
+        booked = np.array([job.booked_minutes for job in jobs], dtype=float)
+        open_at = booked - self.window_minutes
+        close_at = booked + self.window_minutes
+        durations = np.array([job.duration for job in jobs], dtype=float)
+        day_start = float(min(time_to_minutes(driver.availability_start or '08:00') or 0, open_at.min()))
+
+        def simulate(order):
+            return self._simulate(order, travel, open_at, close_at, durations, day_start)
+
+        by_time = sorted(range(len(jobs)), key=lambda j: booked[j])
+        nearest = self._nearest_neighbour(travel, open_at, durations, day_start)
+        order = min((by_time, nearest), key=lambda candidate: simulate(candidate)[0])
+        order = self._two_opt(order, simulate)
+
+        _, arrivals, starts, late = simulate(order)
+        stops = []
+        previous = 0
+        total_distance = 0.0
+        total_travel = 0.0
+        for position, job_index in enumerate(order):
+            job = jobs[job_index]
+            stop = job_index + 1
+            leg_km = None if np.isnan(distances[previous, stop]) else round(float(distances[previous, stop]), 2)
+            total_distance += leg_km or 0.0
+            total_travel += float(travel[previous, stop])
+            stops.append({
+                'sequence': position + 1,
+                'type': job.kind,
+                'reference': job.reference,
+                'customer_name': job.customer_name,
+                'service_type': job.service_type,
+                'location': job.location_text,
+                'coordinates': list(job.location) if job.location else None,
+                'booked_time': minutes_to_time(job.booked_minutes),
+                'eta': minutes_to_time(int(round(arrivals[position])) % (24 * 60)),
+                'start_time': minutes_to_time(int(round(starts[position])) % (24 * 60)),
+                'end_time': minutes_to_time(int(round(starts[position] + job.duration)) % (24 * 60)),
+                'duration_minutes': job.duration,
+                'travel_minutes': round(float(travel[previous, stop]), 1),
+                'distance_km': leg_km,
+                'late_minutes': round(float(late[position]), 1)
+            })
+            previous = stop
+
+        return {
+            'success': True,
+            'date': day.isoformat(),
+            'start_location': list(origin) if origin else None,
+            'stops': stops,
+            'total_distance_km': round(total_distance, 2),
+            'total_travel_minutes': round(total_travel, 1),
+            'late_stops': int((late > 0).sum())
+        }
+
+
+# Global instance
+route_planner = RoutePlanner()
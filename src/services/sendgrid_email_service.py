@@ -3,6 +3,10 @@ import os
 import logging
 import sendgrid
 from sendgrid.helpers.mail import Mail, Email, To, Content
+from python_http_client.exceptions import HTTPError
+from flask import has_request_context
+from src.services.rate_limiter import rate_limiters
+from src.services.email_queue import email_queue
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +16,10 @@ class SendGridEmailService:
         self.api_key = os.environ.get("SENDGRID_API_KEY")
         self.from_email = os.environ.get("FROM_EMAIL", "info@infinitemobilecarwashdetailing.co.uk")
         self.business_email = os.environ.get("BUSINESS_EMAIL", "info@infinitemobilecarwashdetailing.co.uk")
+        self.rate_limiter = rate_limiters.get('sendgrid')
+        self.max_send_attempts = int(os.environ.get("SENDGRID_MAX_SEND_ATTEMPTS", "3"))
+        # Longest a request handler waits for a send slot before handing the email to the background queue
+        self.request_send_timeout = float(os.environ.get("EMAIL_REQUEST_SEND_TIMEOUT", "2"))
         
         if not self.api_key:
             logger.warning("SENDGRID_API_KEY environment variable not set - email service will be disabled")
@@ -20,8 +28,12 @@ class SendGridEmailService:
             self.sg = sendgrid.SendGridAPIClient(api_key=self.api_key)
             logger.info("SendGrid email service initialized successfully")
     
-    def send_email(self, to_email, subject, content_text, content_html=None):
-        """Send email using SendGrid API"""
+    def send_email(self, to_email, subject, content_text, content_html=None, timeout=None):
+        """Send email using SendGrid API, paced by the SendGrid rate limiter.
+
+        Inside a request the wait for the limiter is capped at
+        ``request_send_timeout``; slower sends are queued for background delivery.
+        """
         if not self.sg:
             logger.warning(f"SendGrid not configured - cannot send email to {to_email}")
             return False
@@ -37,14 +49,35 @@ class SendGridEmailService:
             
             mail = Mail(from_email_obj, to_email_obj, subject, content)
             
-            response = self.sg.client.mail.send.post(request_body=mail.get())
+            if timeout is None and has_request_context():
+                timeout = self.request_send_timeout
             
-            if response.status_code == 202:
-                logger.info(f"Email sent successfully to {to_email}. Status: {response.status_code}")
-                return True
-            else:
-                logger.error(f"Failed to send email to {to_email}. Status: {response.status_code}")
-                return False
+            for attempt in range(1, self.max_send_attempts + 1):
+                if not self.rate_limiter.acquire(timeout=timeout):
+                    if timeout is not None and email_queue.submit(self.send_email, to_email, subject, content_text, content_html):
+                        logger.info(f"SendGrid limiter busy - queued email to {to_email} for background delivery")
+                        return True
+                    logger.error(f"SendGrid queue full ({self.rate_limiter.queue_depth} waiting) - not sending to {to_email}")
+                    return False
+                
+                try:
+                    response = self.sg.client.mail.send.post(request_body=mail.get())
+                except HTTPError as e:
+                    if e.status_code == 429 and attempt < self.max_send_attempts:
+                        retry_after = (e.headers or {}).get('Retry-After')
+                        logger.warning(f"SendGrid throttled sending to {to_email} (attempt {attempt})")
+                        self.rate_limiter.penalize(float(retry_after) if retry_after else None)
+                        continue
+                    raise
+                
+                if response.status_code == 202:
+                    logger.info(f"Email sent successfully to {to_email}. Status: {response.status_code}")
+                    return True
+                else:
+                    logger.error(f"Failed to send email to {to_email}. Status: {response.status_code}")
+                    return False
+            
+            return False
                 
         except Exception as e:
             logger.error(f"Error sending email to {to_email}: {str(e)}")
@@ -0,0 +1,184 @@
+import threading
+import logging
+from typing import Dict, Any
+
+import stripe
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.stripe_customer import StripeCustomer
+from src.services.stripe_service import stripe_service
+from src.services.stripe_client import idempotency_key
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_KEY_PREFIX = 'imc'
+
+
+class StripeCatalog:
+    """Reuses Stripe products, prices and customers across checkouts.
+
+    Prices are identified by a ``lookup_key`` derived from
+    (service_type, vehicle_type, frequency, amount), so the same quote always
+    maps to the same Stripe price. Products use a deterministic id per service
+    type. The first lookup in a process lists the existing catalog once. A
+    cached price Stripe rejects (e.g. archived by ``setup_stripe_products.py
+    --prune``) is dropped with ``discard_price`` and looked up again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prices = {}    # lookup_key -> price id
+        self._products = {}  # service_type -> product id
+        self._synced = False
+        self._discarded = {}  # lookup_key -> price id dropped from the cache
+
+    @staticmethod
+    def lookup_key(service_type: str, vehicle_type: str, frequency: str, amount: int) -> str:
+        return f"{LOOKUP_KEY_PREFIX}_{service_type}_{vehicle_type}_{frequency}_{amount}"
+
+    @staticmethod
+    def product_id(service_type: str) -> str:
+        return f"{LOOKUP_KEY_PREFIX}_{service_type}"
+
+    def sync(self) -> int:
+        """Load every active price carrying one of our lookup keys into the cache"""
+        prices = {}
+        for price in stripe.Price.list(active=True, limit=100).auto_paging_iter():
+            key = price.get('lookup_key')
+            if key and key.startswith(f"{LOOKUP_KEY_PREFIX}_"):
+                prices[key] = price.id
+
+        with self._lock:
+            self._prices = prices
+            self._synced = True
+
+        logger.info(f"Synced {len(prices)} Stripe prices into the catalog cache")
+        return len(prices)
+
+    def invalidate(self):
+        with self._lock:
+            self._prices = {}
+            self._products = {}
+            self._synced = False
+
+    def discard_price(self, lookup_key: str, price_id: str):
+        """Forget a cached price Stripe no longer accepts, so the next lookup asks Stripe again"""
+        with self._lock:
+            if self._prices.get(lookup_key) == price_id:
+                del self._prices[lookup_key]
+            self._discarded[lookup_key] = price_id
+        logger.warning(f"Dropped price {price_id} for {lookup_key} from the catalog cache")
+
+    def get_product_id(self, plan) -> str:
+        """Return the Stripe product for a plan, creating it on first use"""
+        product_id = self._products.get(plan.service_type)
+        if product_id:
+            return product_id
+
+        product_id = self.product_id(plan.service_type)
+        try:
+            stripe.Product.retrieve(product_id)
+        except stripe.error.InvalidRequestError:
+            stripe.Product.create(
+                idempotency_key=idempotency_key('product', product_id),
+                id=product_id,
+                name=plan.name,
+                description=plan.description or plan.name,
+                metadata={
+                    'service_type': plan.service_type,
+                    'business': 'infinite_carwash'
+                }
+            )
+            logger.info(f"Created Stripe product: {product_id}")
+
+        with self._lock:
+            self._products[plan.service_type] = product_id
+        return product_id
+
+    def get_price_id(self, plan, vehicle_type: str, frequency: str, amount: int,
+                     interval: str = 'month', interval_count: int = 1) -> Dict[str, Any]:
+        """Resolve the Stripe price for a quote, creating it only if it does not exist"""
+        key = self.lookup_key(plan.service_type, vehicle_type, frequency, amount)
+        try:
+            if not self._synced:
+                self.sync()
+
+            price_id = self._prices.get(key)
+            if price_id:
+                return {'success': True, 'price_id': price_id, 'lookup_key': key, 'cached': True}
+
+            discarded = self._discarded.get(key)
+            if discarded:
+                # The key may have moved to a newer active price since the cache was filled
+                found = stripe.Price.list(lookup_keys=[key], active=True, limit=1).data
+                if found:
+                    with self._lock:
+                        self._prices[key] = found[0].id
+                        self._discarded.pop(key, None)
+                    return {'success': True, 'price_id': found[0].id, 'lookup_key': key, 'cached': False}
+
+            price = stripe.Price.create(
+                # A fresh key after a discard, or Stripe would replay the archived price
+                idempotency_key=idempotency_key('price', key, *([discarded] if discarded else [])),
+                product=self.get_product_id(plan),
+                unit_amount=amount,  # Amount in pence for GBP
+                currency='gbp',
+                recurring={
+                    'interval': interval,
+                    'interval_count': interval_count
+                },
+                lookup_key=key,
+                transfer_lookup_key=True,
+                metadata={
+                    'service_type': plan.service_type,
+                    'vehicle_type': vehicle_type,
+                    'frequency': frequency
+                }
+            )
+
+            with self._lock:
+                self._prices[key] = price.id
+                self._discarded.pop(key, None)
+
+            logger.info(f"Created Stripe price {price.id} for {key}")
+            return {'success': True, 'price_id': price.id, 'lookup_key': key, 'cached': False}
+
+        except stripe.error.StripeError as e:
+            logger.error(f"Stripe error resolving price {key}: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def get_or_create_customer(self, email: str, name: str, phone: str = None,
+                               address: Dict = None) -> Dict[str, Any]:
+        """Return the Stripe customer for an email, creating one only for new emails"""
+        normalized_email = StripeCustomer.normalize_email(email)
+        mapping = StripeCustomer.query.filter_by(email=normalized_email).first()
+        if mapping:
+            return {'success': True, 'customer_id': mapping.stripe_customer_id, 'cached': True}
+
+        result = stripe_service.create_customer(email=email, name=name, phone=phone, address=address)
+        if not result['success']:
+            return result
+
+        try:
+            db.session.add(StripeCustomer(
+                email=normalized_email,
+                stripe_customer_id=result['customer_id'],
+                name=name
+            ))
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent checkout for the same email won the race - use its customer
+            db.session.rollback()
+            mapping = StripeCustomer.query.filter_by(email=normalized_email).first()
+            if mapping:
+                return {'success': True, 'customer_id': mapping.stripe_customer_id, 'cached': True}
+
+        return {'success': True, 'customer_id': result['customer_id'], 'cached': False}
+
+
+# Global instance
+stripe_catalog = StripeCatalog()
@@ -0,0 +1,146 @@
+import bisect
+import hashlib
+import os
+import re
+import threading
+import time
+import logging
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram bucket upper bounds in milliseconds (last bucket is +inf)
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Path segments that are object ids (cus_..., price_..., cs_test_..., custom product ids aside)
+_ID_SEGMENT = re.compile(r'^(?:[a-z]{2,6}_)+[A-Za-z0-9]{8,}$')
+
+
+def endpoint_label(method, url):
+    """Group requests by endpoint: 'GET /v1/customers/{id}'"""
+    path = url.split('://', 1)[-1]
+    path = path[path.find('/'):] if '/' in path else '/'
+    path = path.split('?', 1)[0]
+    segments = ['{id}' if _ID_SEGMENT.match(segment) else segment for segment in path.split('/')]
+    return f"{method.upper()} {'/'.join(segments)}"
+
+
+def idempotency_key(operation, *parts):
+    """Deterministic idempotency key so a repeated create returns the original object"""
+    digest = hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f"imc-{operation}-{digest}"
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.status_codes = {}
+
+    def record(self, elapsed_ms, status):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        if status is None or status >= 500 or status == 429:
+            self.errors += 1
+        key = str(status) if status is not None else 'connection_error'
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of requests"""
+        target = fraction * self.count
+        running = 0
+        for index, bucket_count in enumerate(self.buckets):
+            running += bucket_count
+            if running >= target and bucket_count:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return 0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else 0,
+            'max_ms': round(self.max_ms, 2),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'histogram': {
+                **{f"le_{bound}ms": self.buckets[i] for i, bound in enumerate(LATENCY_BUCKETS_MS)},
+                'le_inf': self.buckets[-1]
+            },
+            'status_codes': dict(self.status_codes)
+        }
+
+
+class InstrumentedRequestsClient(stripe.RequestsClient):
+    """Stripe HTTP client on a shared keep-alive session that records per-endpoint latency.
+
+    Every attempt is recorded, including the library's automatic retries.
+    """
+
+    def __init__(self, pool_size=10, **kwargs):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        super().__init__(session=session, **kwargs)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _request_internal(self, method, url, headers, post_data, is_streaming):
+        started = time.perf_counter()
+        status = None
+        try:
+            result = super()._request_internal(method, url, headers, post_data, is_streaming)
+            status = result[1]
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            label = endpoint_label(method, url)
+            with self._stats_lock:
+                stats = self._stats.get(label)
+                if stats is None:
+                    stats = self._stats[label] = EndpointStats()
+                stats.record(elapsed_ms, status)
+
+    def get_metrics(self):
+        with self._stats_lock:
+            return {label: stats.to_dict() for label, stats in sorted(self._stats.items())}
+
+    def reset_metrics(self):
+        with self._stats_lock:
+            self._stats = {}
+
+
+def configure_stripe():
+    """Point the stripe library at one shared, pooled, instrumented client.
+
+    Safe to call repeatedly; the client is only created once.
+    """
+    global stripe_http_client
+    if stripe_http_client is None:
+        stripe_http_client = InstrumentedRequestsClient(
+            pool_size=int(os.getenv('STRIPE_HTTP_POOL_SIZE', '10')),
+            timeout=int(os.getenv('STRIPE_TIMEOUT_SECONDS', '30'))
+        )
+
+    stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+    stripe.default_http_client = stripe_http_client
+    # The library retries connection errors, 409s and 5xx with backoff, and adds an
+    # idempotency key to retried POSTs that don't already carry one
+    stripe.max_network_retries = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', '2'))
+    if os.getenv('STRIPE_API_BASE'):
+        stripe.api_base = os.getenv('STRIPE_API_BASE')
+    return stripe_http_client
+
+
+stripe_http_client = None
+configure_stripe()
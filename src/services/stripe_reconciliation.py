@@ -0,0 +1,257 @@
+import os
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+import stripe
+
+from src.models.user import db
+from src.models.subscription_plan import CustomerSubscription
+from src.services.subscription_mirror import subscription_mirror
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORT_SAMPLES = 50
+
+
+def _chunks(iterator, size):
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class StripeReconciler:
+    """Nightly comparison of Stripe subscriptions and invoices with the local mirror.
+
+    Stripe lists are streamed with auto-paging iterators and processed in chunks:
+    one batched query per chunk to load the matching rows, and one short write
+    transaction per chunk (only when something drifted), with a pause between
+    chunks so request handlers get the SQLite write lock in between.
+    """
+
+    def __init__(self):
+        self.chunk_size = int(os.getenv('STRIPE_RECONCILE_CHUNK_SIZE', '200'))
+        self.invoice_days = int(os.getenv('STRIPE_RECONCILE_INVOICE_DAYS', '35'))
+        self.chunk_pause = float(os.getenv('STRIPE_RECONCILE_CHUNK_PAUSE', '0.05'))
+        self.last_report = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def run(self, repair=True):
+        """Reconcile everything and return the drift report. Needs an app context."""
+        if not self._lock.acquire(blocking=False):
+            logger.warning("Stripe reconciliation already running, skipping")
+            return None
+
+        try:
+            report = self._new_report(repair)
+            started = time.perf_counter()
+            seen_subscription_ids = self._reconcile_subscriptions(report, repair)
+            self._find_missing_in_stripe(report, seen_subscription_ids)
+            self._reconcile_invoices(report, repair)
+            report['finished_at'] = datetime.utcnow().isoformat()
+            report['duration_seconds'] = round(time.perf_counter() - started, 2)
+
+            self.last_report = report
+            logger.info(
+                f"Stripe reconciliation finished in {report['duration_seconds']}s: "
+                f"{report['subscriptions_scanned']} subscriptions, {report['invoices_scanned']} invoices, "
+                f"{report['drifted_subscriptions']} drifted, {report['repaired']} repaired, "
+                f"{len(report['missing_locally'])} missing locally, "
+                f"{len(report['missing_in_stripe'])} missing in Stripe, "
+                f"{len(report['ambiguous_matches'])} ambiguous"
+            )
+            return report
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Stripe reconciliation failed: {str(e)}")
+            raise
+        finally:
+            db.session.remove()
+            self._lock.release()
+
+    @staticmethod
+    def _new_report(repair):
+        return {
+            'started_at': datetime.utcnow().isoformat(),
+            'finished_at': None,
+            'repair': repair,
+            'subscriptions_scanned': 0,
+            'invoices_scanned': 0,
+            'drifted_subscriptions': 0,
+            'repaired': 0,
+            'drift_by_field': {},
+            'missing_locally': [],
+            'missing_in_stripe': [],
+            'ambiguous_matches': [],
+            'samples': []
+        }
+
+    def _record_drift(self, report, subscription, stripe_id, differences):
+        report['drifted_subscriptions'] += 1
+        for field, (local_value, stripe_value) in differences.items():
+            report['drift_by_field'][field] = report['drift_by_field'].get(field, 0) + 1
+            if len(report['samples']) < MAX_REPORT_SAMPLES:
+                report['samples'].append({
+                    'subscription_id': subscription.subscription_id,
+                    'stripe_id': stripe_id,
+                    'field': field,
+                    'local': _json_value(local_value),
+                    'stripe': _json_value(stripe_value)
+                })
+
+    def _load_local(self, stripe_subscription_ids, stripe_customer_ids):
+        """One query per chunk: rows by Stripe subscription id, plus unlinked legacy rows by customer"""
+        rows = CustomerSubscription.query.filter(
+            db.or_(
+                CustomerSubscription.stripe_subscription_id.in_(stripe_subscription_ids),
+                db.and_(
+                    CustomerSubscription.stripe_subscription_id.is_(None),
+                    CustomerSubscription.customer_id.in_(stripe_customer_ids)
+                )
+            )
+        ).all()
+
+        by_subscription = {}
+        legacy_by_customer = {}
+        for row in rows:
+            if row.stripe_subscription_id:
+                by_subscription[row.stripe_subscription_id] = row
+            else:
+                legacy_by_customer.setdefault(row.customer_id, []).append(row)
+        return by_subscription, legacy_by_customer
+
+    @staticmethod
+    def _checkout_metadata(stripe_subscription):
+        """Metadata of the checkout session that created a subscription, if any"""
+        sessions = stripe.checkout.Session.list(subscription=stripe_subscription['id'], limit=1)
+        return sessions.data[0].get('metadata') if sessions.data else None
+
+    def _match_legacy(self, report, stripe_subscription, legacy_rows, claimed):
+        """(row, ambiguous) - the legacy row if exactly one matches; ambiguous matches are reported, not linked"""
+        legacy_rows = [row for row in legacy_rows if row.id not in claimed]
+        if not legacy_rows:
+            return None, False
+        metadata = None
+        if not (stripe_subscription.get('metadata') or {}).get('plan_id'):
+            metadata = self._checkout_metadata(stripe_subscription)
+        local, candidates = subscription_mirror.match_legacy(stripe_subscription, legacy_rows, metadata)
+        ambiguous = local is None and len(candidates) > 1
+        if ambiguous and len(report['ambiguous_matches']) < MAX_REPORT_SAMPLES:
+            report['ambiguous_matches'].append({
+                'stripe_id': stripe_subscription['id'],
+                'candidates': [row.subscription_id for row in candidates]
+            })
+        if local is not None:
+            claimed.add(local.id)
+        return local, ambiguous
+
+    def _finish_chunk(self, changed):
+        if changed:
+            db.session.commit()
+        # Drop the chunk's objects so memory stays flat however many subscriptions there are
+        db.session.expunge_all()
+        if changed and self.chunk_pause:
+            time.sleep(self.chunk_pause)
+
+    def _reconcile_subscriptions(self, report, repair):
+        seen = set()
+        claimed = set()  # legacy rows already matched, in case a dry run leaves them unlinked
+        stream = stripe.Subscription.list(status='all', limit=100).auto_paging_iter()
+
+        for chunk in _chunks(stream, self.chunk_size):
+            customer_ids = [s.get('customer') for s in chunk if isinstance(s.get('customer'), str)]
+            by_subscription, legacy_by_customer = self._load_local([s['id'] for s in chunk], customer_ids)
+            changed = False
+
+            for stripe_subscription in chunk:
+                report['subscriptions_scanned'] += 1
+                seen.add(stripe_subscription['id'])
+                local = by_subscription.get(stripe_subscription['id'])
+                ambiguous = False
+                if local is None:
+                    local, ambiguous = self._match_legacy(
+                        report, stripe_subscription,
+                        legacy_by_customer.get(stripe_subscription.get('customer'), []), claimed
+                    )
+                if local is None:
+                    if not ambiguous and len(report['missing_locally']) < MAX_REPORT_SAMPLES:
+                        report['missing_locally'].append(stripe_subscription['id'])
+                    continue
+
+                differences = subscription_mirror.diff_subscription(local, stripe_subscription)
+                if not differences:
+                    continue
+                self._record_drift(report, local, stripe_subscription['id'], differences)
+                if repair:
+                    subscription_mirror.apply_subscription(stripe_subscription, subscription=local)
+                    report['repaired'] += 1
+                    changed = True
+
+            self._finish_chunk(changed)
+
+        return seen
+
+    def _find_missing_in_stripe(self, report, seen_subscription_ids):
+        """Local rows pointing at Stripe subscriptions the list didn't return"""
+        query = db.session.query(CustomerSubscription.subscription_id, CustomerSubscription.stripe_subscription_id).filter(
+            CustomerSubscription.stripe_subscription_id.isnot(None)
+        ).execution_options(yield_per=1000)
+
+        for subscription_id, stripe_subscription_id in query:
+            if stripe_subscription_id not in seen_subscription_ids:
+                report['missing_in_stripe'].append(subscription_id)
+                if len(report['missing_in_stripe']) >= MAX_REPORT_SAMPLES:
+                    break
+
+    def _reconcile_invoices(self, report, repair):
+        since = int((datetime.utcnow() - timedelta(days=self.invoice_days)).timestamp())
+        # Invoices are listed newest first - only the first one seen per subscription matters
+        latest_seen = set()
+        stream = stripe.Invoice.list(created={'gte': since}, limit=100).auto_paging_iter()
+
+        for chunk in _chunks(stream, self.chunk_size):
+            latest = []
+            for invoice in chunk:
+                report['invoices_scanned'] += 1
+                stripe_subscription_id = invoice.get('subscription')
+                if isinstance(stripe_subscription_id, str) and stripe_subscription_id not in latest_seen:
+                    latest_seen.add(stripe_subscription_id)
+                    latest.append(invoice)
+            if not latest:
+                continue
+
+            by_subscription, _ = self._load_local([invoice['subscription'] for invoice in latest], [])
+            changed = False
+            for invoice in latest:
+                local = by_subscription.get(invoice['subscription'])
+                if local is None:
+                    continue
+                differences = subscription_mirror.diff_invoice(local, invoice)
+                if not differences:
+                    continue
+                self._record_drift(report, local, invoice['subscription'], differences)
+                if repair:
+                    subscription_mirror.apply_invoice(invoice, subscription=local)
+                    report['repaired'] += 1
+                    changed = True
+
+            self._finish_chunk(changed)
+
+
+# Global instance
+stripe_reconciler = StripeReconciler()
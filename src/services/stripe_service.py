@@ -2,7 +2,9 @@ import stripe
 import os
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
+import json
 import logging
+from src.services.stripe_client import configure_stripe, idempotency_key
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -10,8 +12,8 @@ logger = logging.getLogger(__name__)
 
 class StripeService:
     def __init__(self):
-        # Set Stripe API key from environment variable
-        stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+        # Set Stripe API key and the shared pooled HTTP client from environment variables
+        configure_stripe()
         if not stripe.api_key:
             logger.warning("STRIPE_SECRET_KEY not found in environment variables")
         
@@ -35,7 +37,12 @@ class StripeService:
             if address:
                 customer_data['address'] = address
                 
-            customer = stripe.Customer.create(**customer_data)
+            customer = stripe.Customer.create(
+                idempotency_key=idempotency_key(
+                    'customer', email.strip().lower(), name, phone, json.dumps(address, sort_keys=True)
+                ),
+                **customer_data
+            )
             
             logger.info(f"Created Stripe customer: {customer.id}")
             return {
@@ -61,6 +68,7 @@ class StripeService:
         """Create a Stripe product for subscription"""
         try:
             product = stripe.Product.create(
+                idempotency_key=idempotency_key('product', plan_name, description),
                 name=plan_name,
                 description=description,
                 metadata={
@@ -88,6 +96,7 @@ class StripeService:
         """Create a Stripe price for subscription"""
         try:
             price = stripe.Price.create(
+                idempotency_key=idempotency_key('price', product_id, amount, currency, interval, interval_count),
                 product=product_id,
                 unit_amount=amount,  # Amount in pence for GBP
                 currency=currency,
@@ -160,6 +169,8 @@ class StripeService:
                 success_url=success_url,
                 cancel_url=cancel_url,
                 metadata=metadata or {},
+                # Copied onto the subscription so webhooks can tell it was bought through checkout
+                subscription_data={'metadata': metadata or {}},
                 allow_promotion_codes=True,
                 billing_address_collection='required',
                 customer_update={
@@ -180,13 +191,15 @@ class StripeService:
             logger.error(f"Stripe error creating checkout session: {str(e)}")
             return {
                 'success': False,
-                'error': str(e)
+                'error': str(e),
+                'param': getattr(e, 'param', None)
             }
     
-    def get_subscription(self, subscription_id: str) -> Dict[str, Any]:
+    def get_subscription(self, subscription_id: str, expand: list = None) -> Dict[str, Any]:
         """Retrieve a Stripe subscription"""
         try:
-            subscription = stripe.Subscription.retrieve(subscription_id)
+            subscription = stripe.Subscription.retrieve(subscription_id, expand=expand) if expand \
+                else stripe.Subscription.retrieve(subscription_id)
             
             return {
                 'success': True,
@@ -262,41 +275,18 @@ class StripeService:
             }
     
     def calculate_subscription_amount(self, base_price: float, frequency: str, 
-                                    vehicle_type: str = 'small_car') -> int:
-        """Calculate subscription amount in pence based on frequency and vehicle type"""
-        
-        # Vehicle type multipliers
-        vehicle_multipliers = {
-            'small_car': 1.0,
-            'medium_car': 1.43,  # £50/£35 = 1.43
-            'large_car': 1.71,   # £60/£35 = 1.71
-            'van': 2.14          # £75/£35 = 2.14
-        }
-        
-        # Frequency multipliers (discount for more frequent service)
-        frequency_multipliers = {
-            'weekly': 1.36,      # 36% premium for weekly service
-            'bi_weekly': 0.72,   # 28% discount for bi-weekly
-            'monthly': 0.4       # 60% discount for monthly
-        }
-        
-        vehicle_multiplier = vehicle_multipliers.get(vehicle_type, 1.0)
-        frequency_multiplier = frequency_multipliers.get(frequency, 1.0)
-        
-        # Calculate final price
-        final_price = base_price * vehicle_multiplier * frequency_multiplier
-        
-        # Convert to pence (Stripe uses smallest currency unit)
-        amount_in_pence = int(final_price * 100)
-        
-        return amount_in_pence
+                                    vehicle_type: str = 'small_car', service_type: str = None) -> int:
+        """Calculate the amount in pence charged per billing interval (one service visit)"""
+        from src.services.pricing_engine import pricing_engine
+        return pricing_engine.interval_amount(service_type, vehicle_type, frequency, base_price=base_price)
     
     def get_stripe_interval(self, frequency: str) -> tuple:
         """Convert frequency to Stripe interval format"""
         frequency_mapping = {
             'weekly': ('week', 1),
             'bi_weekly': ('week', 2),
-            'monthly': ('month', 1)
+            'monthly': ('month', 1),
+            'yearly': ('year', 1)
         }
         
         return frequency_mapping.get(frequency, ('month', 1))
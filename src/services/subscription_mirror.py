@@ -0,0 +1,225 @@
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.models.subscription_plan import CustomerSubscription
+from src.services.plan_registry import plan_registry
+
+logger = logging.getLogger(__name__)
+
+# Stripe subscription status -> our CustomerSubscription.status. Statuses not listed
+# (past_due, unpaid, incomplete) leave the local status alone; stripe_status has the detail.
+LOCAL_STATUS = {
+    'active': 'active',
+    'trialing': 'active',
+    'paused': 'paused',
+    'canceled': 'cancelled',
+    'incomplete_expired': 'expired',
+}
+
+# Stripe price billing interval -> subscription frequency (see StripeService.get_stripe_interval)
+INTERVAL_FREQUENCIES = {
+    ('week', 1): 'weekly',
+    ('week', 2): 'bi_weekly',
+    ('month', 1): 'monthly',
+    ('year', 1): 'yearly',
+}
+
+
+def _timestamp(value):
+    return datetime.utcfromtimestamp(value) if value else None
+
+
+def _unix(value):
+    return int((value - datetime(1970, 1, 1)).total_seconds()) if value else None
+
+
+def _object_id(value):
+    if isinstance(value, dict):
+        return value.get('id')
+    return value
+
+
+class SubscriptionMirror:
+    """Keeps Stripe subscription and invoice state on CustomerSubscription.
+
+    Webhook handlers and the reconciliation job feed Stripe objects in; the
+    subscription status endpoint reads the result without calling Stripe.
+    """
+
+    @staticmethod
+    def find_subscription(stripe_subscription_id) -> Optional[CustomerSubscription]:
+        return CustomerSubscription.query.filter_by(stripe_subscription_id=stripe_subscription_id).first()
+
+    @staticmethod
+    def created_by_checkout(subscription, session) -> bool:
+        """Whether a row was created by this checkout session (and not just linked to its subscription)"""
+        if subscription.stripe_checkout_session_id:
+            return subscription.stripe_checkout_session_id == session['id']
+        # Rows from before the session id was stored: only ones created after the session qualify
+        created = _timestamp(session.get('created'))
+        return created is not None and subscription.created_at is not None and subscription.created_at >= created
+
+    @staticmethod
+    def subscription_frequency(stripe_subscription) -> Optional[str]:
+        items = (stripe_subscription.get('items') or {}).get('data') or []
+        recurring = (items[0].get('price') or {}).get('recurring') if items else None
+        if not recurring:
+            return None
+        return INTERVAL_FREQUENCIES.get((recurring.get('interval'), recurring.get('interval_count') or 1))
+
+    def match_legacy(self, stripe_subscription, legacy_rows, checkout_metadata=None) -> Tuple[Optional[CustomerSubscription], List[CustomerSubscription]]:
+        """Pick the pre-mirror row (no stripe_subscription_id) a Stripe subscription belongs to.
+
+        ``legacy_rows`` are the customer's unlinked rows. The plan and frequency
+        come from the metadata of the checkout session that created the
+        subscription, or failing that the frequency from its price. Returns
+        (row, candidates); row is None unless exactly one candidate matches.
+        """
+        if (stripe_subscription.get('metadata') or {}).get('plan_id'):
+            # Created by a checkout that records its own row on completion - never a legacy one
+            return None, []
+
+        metadata = checkout_metadata or {}
+        plan = plan_registry.resolve(metadata['plan_id']) if metadata.get('plan_id') else None
+        frequency = metadata.get('frequency') or self.subscription_frequency(stripe_subscription)
+        email = (metadata.get('customer_email') or '').strip().lower()
+        if not frequency:
+            return None, list(legacy_rows)
+
+        candidates = [
+            row for row in legacy_rows
+            if row.frequency == frequency
+            and (plan is None or row.plan_id == plan.plan_id)
+            and (not email or (row.customer_email or '').strip().lower() == email)
+        ]
+        return (candidates[0] if len(candidates) == 1 else None), candidates
+
+    @staticmethod
+    def _is_stale(watermark, event_created):
+        # Subscription and invoice events keep separate watermarks, so neither kind hides the other
+        return event_created is not None and watermark is not None and event_created < watermark
+
+    def apply_subscription(self, stripe_subscription, event_created=None, subscription=None) -> Optional[CustomerSubscription]:
+        """Copy status and billing period from a Stripe subscription object. Caller commits."""
+        if subscription is None:
+            subscription = self.find_subscription(stripe_subscription['id'])
+        if subscription is None:
+            logger.info(f"No local subscription for Stripe subscription {stripe_subscription['id']}")
+            return None
+        if self._is_stale(subscription.stripe_event_created, event_created):
+            logger.info(f"Ignoring out-of-order update for {stripe_subscription['id']}")
+            return subscription
+
+        stripe_status = stripe_subscription.get('status')
+        subscription.stripe_subscription_id = stripe_subscription['id']
+        subscription.stripe_status = stripe_status
+        subscription.current_period_start = _timestamp(stripe_subscription.get('current_period_start'))
+        subscription.current_period_end = _timestamp(stripe_subscription.get('current_period_end'))
+        subscription.cancel_at_period_end = bool(stripe_subscription.get('cancel_at_period_end'))
+        subscription.canceled_at = _timestamp(stripe_subscription.get('canceled_at'))
+        if stripe_status in LOCAL_STATUS:
+            subscription.status = LOCAL_STATUS[stripe_status]
+        if stripe_status == 'canceled' and not subscription.end_date:
+            subscription.end_date = (subscription.canceled_at or datetime.utcnow()).date()
+
+        self._touch(subscription, 'stripe_event_created', event_created)
+        return subscription
+
+    def apply_invoice(self, invoice, event_created=None, subscription=None) -> Optional[CustomerSubscription]:
+        """Record the latest invoice for a subscription. Caller commits."""
+        stripe_subscription_id = _object_id(invoice.get('subscription'))
+        if not stripe_subscription_id:
+            return None
+        if subscription is None:
+            subscription = self.find_subscription(stripe_subscription_id)
+        if subscription is None:
+            logger.info(f"No local subscription for invoice {invoice['id']}")
+            return None
+        if self._is_stale(subscription.last_invoice_event_created, event_created):
+            logger.info(f"Ignoring out-of-order invoice {invoice['id']}")
+            return subscription
+
+        status = self.invoice_status(invoice)
+        newly_paid = status == 'paid' and not (
+            subscription.last_invoice_id == invoice['id'] and subscription.last_invoice_status == 'paid'
+        )
+
+        subscription.last_invoice_id = invoice['id']
+        subscription.last_invoice_status = status
+        amount = invoice.get('amount_paid') if status == 'paid' else invoice.get('amount_due')
+        subscription.last_invoice_amount = amount / 100 if amount is not None else None
+        subscription.last_invoice_at = _timestamp(invoice.get('created')) or datetime.utcnow()
+        if newly_paid and amount:
+            subscription.total_paid = (subscription.total_paid or 0.0) + amount / 100
+
+        self._touch(subscription, 'last_invoice_event_created', event_created)
+        return subscription
+
+    @staticmethod
+    def invoice_status(invoice):
+        status = invoice.get('status')
+        if status == 'open' and invoice.get('attempted') and not invoice.get('paid'):
+            return 'payment_failed'
+        return status
+
+    @staticmethod
+    def diff_subscription(subscription, stripe_subscription) -> Dict[str, tuple]:
+        """Mirror fields that differ from a Stripe subscription: {field: (local, stripe)}"""
+        expected = {
+            'stripe_subscription_id': stripe_subscription['id'],
+            'stripe_status': stripe_subscription.get('status'),
+            'current_period_start': _timestamp(stripe_subscription.get('current_period_start')),
+            'current_period_end': _timestamp(stripe_subscription.get('current_period_end')),
+            'cancel_at_period_end': bool(stripe_subscription.get('cancel_at_period_end')),
+            'canceled_at': _timestamp(stripe_subscription.get('canceled_at')),
+        }
+        local_status = LOCAL_STATUS.get(stripe_subscription.get('status'))
+        if local_status:
+            expected['status'] = local_status
+        return {
+            field: (getattr(subscription, field), value)
+            for field, value in expected.items()
+            if getattr(subscription, field) != value
+        }
+
+    def diff_invoice(self, subscription, invoice) -> Dict[str, tuple]:
+        """Differences between the mirrored last invoice and Stripe's latest invoice"""
+        expected = {
+            'last_invoice_id': invoice['id'],
+            'last_invoice_status': self.invoice_status(invoice),
+        }
+        return {
+            field: (getattr(subscription, field), value)
+            for field, value in expected.items()
+            if getattr(subscription, field) != value
+        }
+
+    @staticmethod
+    def _touch(subscription, watermark, event_created):
+        if event_created is not None:
+            setattr(subscription, watermark, max(event_created, getattr(subscription, watermark) or 0))
+        subscription.stripe_synced_at = datetime.utcnow()
+
+    @staticmethod
+    def to_status_dict(subscription) -> Dict[str, Any]:
+        """Same shape the status endpoint returned from Stripe, plus mirror details"""
+        return {
+            'id': subscription.stripe_subscription_id,
+            'status': subscription.stripe_status,
+            'current_period_start': _unix(subscription.current_period_start),
+            'current_period_end': _unix(subscription.current_period_end),
+            'cancel_at_period_end': bool(subscription.cancel_at_period_end),
+            'local_status': subscription.status,
+            'last_invoice': {
+                'id': subscription.last_invoice_id,
+                'status': subscription.last_invoice_status,
+                'amount': subscription.last_invoice_amount,
+                'created_at': subscription.last_invoice_at.isoformat() if subscription.last_invoice_at else None
+            } if subscription.last_invoice_id else None,
+            'synced_at': subscription.stripe_synced_at.isoformat() if subscription.stripe_synced_at else None
+        }
+
+
+# Global instance
+subscription_mirror = SubscriptionMirror()
@@ -1,12 +1,150 @@
 from src.models.user import db
 from src.models.subscription_plan import SubscriptionPlan, CustomerSubscription, SubscriptionService
 from src.models.notification import ServiceNotification, LiveNotification
-from datetime import datetime, date, timedelta
+from src.services.plan_registry import plan_registry
+from datetime import datetime, date
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Basic Services - Updated with new Home Base pricing
+BASIC_PLANS = [
+    {
+        'name': 'Mini Valet Subscription',
+        'description': 'Comprehensive exterior and interior cleaning service',
+        'service_type': 'mini_valet',
+        'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
+        'base_price': 35.0,  # Updated to Home Base pricing for Small Car
+        'frequency_options': ['weekly', 'bi_weekly', 'monthly'],
+        'duration_minutes': 90,
+        'features': [
+            'Full exterior wash',
+            'Interior vacuuming',
+            'Dashboard cleaning',
+            'Window cleaning (interior & exterior)',
+            'Wheel and tire cleaning'
+        ],
+        'is_premium': False
+    },
+    {
+        'name': 'Full Valet Subscription',
+        'description': 'Complete premium cleaning service inside and out',
+        'service_type': 'full_valet',
+        'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
+        'base_price': 80.0,  # Updated to Home Base pricing for Small Car
+        'frequency_options': ['bi_weekly', 'monthly'],
+        'duration_minutes': 120,
+        'features': [
+            'Complete exterior wash and wax',
+            'Full interior deep clean',
+            'Leather/fabric treatment',
+            'Dashboard and trim detailing',
+            'All windows cleaned',
+            'Wheel and tire shine',
+            'Air freshener'
+        ],
+        'is_premium': False
+    }
+]
+
+# Premium Services - Updated with new Home Base pricing
+PREMIUM_PLANS = [
+    {
+        'name': 'Interior Detailing Subscription',
+        'description': 'Professional interior deep cleaning and protection service',
+        'service_type': 'interior_detailing',
+        'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
+        'base_price': 140.0,  # Updated to Home Base pricing
+        'frequency_options': ['monthly'],
+        'duration_minutes': 180,
+        'features': [
+            'Deep interior cleaning',
+            'Leather conditioning',
+            'Fabric protection',
+            'Steam cleaning',
+            'Odor elimination',
+            'UV protection treatment'
+        ],
+        'is_premium': True
+    },
+    {
+        'name': 'Exterior Detailing Subscription',
+        'description': 'Professional exterior paint correction and protection',
+        'service_type': 'exterior_detailing',
+        'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
+        'base_price': 260.0,  # Updated to Home Base pricing
+        'frequency_options': ['monthly'],
+        'duration_minutes': 300,
+        'features': [
+            'Paint correction',
+            'Ceramic coating application',
+            'Chrome polishing',
+            'Headlight restoration',
+            'Tire and wheel detailing',
+            'Paint protection'
+        ],
+        'is_premium': True
+    },
+    {
+        'name': 'Full Detailing Subscription',
+        'description': 'Complete professional detailing service - interior and exterior',
+        'service_type': 'full_detailing',
+        'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
+        'base_price': 360.0,  # Updated to Home Base pricing
+        'frequency_options': ['monthly'],
+        'duration_minutes': 480,
+        'features': [
+            'Complete paint correction',
+            'Ceramic coating',
+            'Full interior detailing',
+            'Leather restoration',
+            'Engine bay cleaning',
+            'Headlight restoration',
+            'Tire and wheel detailing',
+            'Paint and fabric protection'
+        ],
+        'is_premium': True
+    },
+    {
+        'name': 'Stage 1 Polishing Subscription',
+        'description': 'Single-stage machine polishing for paint enhancement',
+        'service_type': 'stage1_polishing',
+        'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
+        'base_price': 450.0,  # Updated to Home Base pricing
+        'frequency_options': ['yearly'],
+        'duration_minutes': 240,
+        'features': [
+            'Single-stage machine polish',
+            'Paint enhancement',
+            'Swirl mark removal',
+            'Protective wax application',
+            'Chrome and trim polishing'
+        ],
+        'is_premium': True
+    },
+    {
+        'name': 'Stage 2 Polishing Subscription',
+        'description': 'Two-stage machine polishing for maximum paint correction',
+        'service_type': 'stage2_polishing',
+        'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
+        'base_price': 650.0,  # Updated to Home Base pricing
+        'frequency_options': ['yearly'],
+        'duration_minutes': 360,
+        'features': [
+            'Two-stage machine polish',
+            'Complete paint correction',
+            'Scratch and swirl removal',
+            'High-grade protective coating',
+            'Chrome and trim restoration',
+            'Paint depth enhancement'
+        ],
+        'is_premium': True
+    }
+]
+
+DEFAULT_SUBSCRIPTION_PLANS = BASIC_PLANS + PREMIUM_PLANS
+
 class SubscriptionService:
     
     @staticmethod
@@ -23,142 +161,7 @@ class SubscriptionService:
                 print(f"Error clearing existing plans: {e}")
                 db.session.rollback()
         
-        # Basic Services - Updated with new Home Base pricing
-        basic_plans = [
-            {
-                'name': 'Mini Valet Subscription',
-                'description': 'Comprehensive exterior and interior cleaning service',
-                'service_type': 'mini_valet',
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'base_price': 35.0,  # Updated to Home Base pricing for Small Car
-                'frequency_options': ['weekly', 'bi_weekly', 'monthly'],
-                'duration_minutes': 90,
-                'features': [
-                    'Full exterior wash',
-                    'Interior vacuuming',
-                    'Dashboard cleaning',
-                    'Window cleaning (interior & exterior)',
-                    'Wheel and tire cleaning'
-                ],
-                'is_premium': False
-            },
-            {
-                'name': 'Full Valet Subscription',
-                'description': 'Complete premium cleaning service inside and out',
-                'service_type': 'full_valet',
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'base_price': 80.0,  # Updated to Home Base pricing for Small Car
-                'frequency_options': ['bi_weekly', 'monthly'],
-                'duration_minutes': 120,
-                'features': [
-                    'Complete exterior wash and wax',
-                    'Full interior deep clean',
-                    'Leather/fabric treatment',
-                    'Dashboard and trim detailing',
-                    'All windows cleaned',
-                    'Wheel and tire shine',
-                    'Air freshener'
-                ],
-                'is_premium': False
-            }
-        ]
-        
-        # Premium Services - Updated with new Home Base pricing
-        premium_plans = [
-            {
-                'name': 'Interior Detailing Subscription',
-                'description': 'Professional interior deep cleaning and protection service',
-                'service_type': 'interior_detailing',
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'base_price': 140.0,  # Updated to Home Base pricing
-                'frequency_options': ['monthly'],
-                'duration_minutes': 180,
-                'features': [
-                    'Deep interior cleaning',
-                    'Leather conditioning',
-                    'Fabric protection',
-                    'Steam cleaning',
-                    'Odor elimination',
-                    'UV protection treatment'
-                ],
-                'is_premium': True
-            },
-            {
-                'name': 'Exterior Detailing Subscription',
-                'description': 'Professional exterior paint correction and protection',
-                'service_type': 'exterior_detailing',
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'base_price': 200.0,  # Same pricing for Home Base
-                'frequency_options': ['monthly'],
-                'duration_minutes': 300,
-                'features': [
-                    'Paint correction',
-                    'Ceramic coating application',
-                    'Chrome polishing',
-                    'Headlight restoration',
-                    'Tire and wheel detailing',
-                    'Paint protection'
-                ],
-                'is_premium': True
-            },
-            {
-                'name': 'Full Detailing Subscription',
-                'description': 'Complete professional detailing service - interior and exterior',
-                'service_type': 'full_detailing',
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'base_price': 300.0,  # Same pricing for Home Base
-                'frequency_options': ['monthly'],
-                'duration_minutes': 480,
-                'features': [
-                    'Complete paint correction',
-                    'Ceramic coating',
-                    'Full interior detailing',
-                    'Leather restoration',
-                    'Engine bay cleaning',
-                    'Headlight restoration',
-                    'Tire and wheel detailing',
-                    'Paint and fabric protection'
-                ],
-                'is_premium': True
-            },
-            {
-                'name': 'Stage 1 Polishing Subscription',
-                'description': 'Single-stage machine polishing for paint enhancement',
-                'service_type': 'stage1_polishing',
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'base_price': 450.0,  # Updated to Home Base pricing
-                'frequency_options': ['monthly'],
-                'duration_minutes': 240,
-                'features': [
-                    'Single-stage machine polish',
-                    'Paint enhancement',
-                    'Swirl mark removal',
-                    'Protective wax application',
-                    'Chrome and trim polishing'
-                ],
-                'is_premium': True
-            },
-            {
-                'name': 'Stage 2 Polishing Subscription',
-                'description': 'Two-stage machine polishing for maximum paint correction',
-                'service_type': 'stage2_polishing',
-                'vehicle_types': ['small_car', 'medium_car', 'large_car', 'van'],
-                'base_price': 650.0,  # Updated to Home Base pricing
-                'frequency_options': ['monthly'],
-                'duration_minutes': 360,
-                'features': [
-                    'Two-stage machine polish',
-                    'Complete paint correction',
-                    'Scratch and swirl removal',
-                    'High-grade protective coating',
-                    'Chrome and trim restoration',
-                    'Paint depth enhancement'
-                ],
-                'is_premium': True
-            }
-        ]
-        
-        all_plans = basic_plans + premium_plans
+        all_plans = DEFAULT_SUBSCRIPTION_PLANS
         
         for plan_data in all_plans:
             # Check if plan already exists
@@ -185,6 +188,7 @@ class SubscriptionService:
         
         try:
             db.session.commit()
+            plan_registry.refresh()
             print("Subscription plans initialized successfully!")
             return True
         except Exception as e:
@@ -319,63 +323,19 @@ class SubscriptionService:
             return False
     
     @staticmethod
-    def schedule_recurring_services():
-        """Schedule recurring services for active subscriptions"""
-        try:
-            active_subscriptions = CustomerSubscription.query.filter_by(status='active').all()
-            services_scheduled = 0
-            
-            for subscription in active_subscriptions:
-                # Check if we need to schedule the next service
-                if subscription.next_service_date and subscription.next_service_date <= date.today() + timedelta(days=30):
-                    # Check if service is already scheduled
-                    existing_service = SubscriptionService.query.filter_by(
-                        subscription_id=subscription.subscription_id,
-                        scheduled_date=subscription.next_service_date,
-                        status='scheduled'
-                    ).first()
-                    
-                    if not existing_service:
-                        # Create new service
-                        new_service = SubscriptionService(
-                            service_id=SubscriptionService.generate_service_id(),
-                            subscription_id=subscription.subscription_id,
-                            scheduled_date=subscription.next_service_date,
-                            scheduled_time=subscription.preferred_time,
-                            status='scheduled'
-                        )
-                        
-                        db.session.add(new_service)
-                        
-                        # Schedule reminder notification
-                        reminder_date = subscription.next_service_date - timedelta(days=subscription.notification_days_ahead)
-                        if reminder_date >= date.today():
-                            reminder_notification = ServiceNotification(
-                                notification_id=ServiceNotification.generate_notification_id(),
-                                subscription_id=subscription.subscription_id,
-                                notification_type='service_reminder',
-                                title='Upcoming Car Service Reminder',
-                                message=f'Your {subscription.plan.name if subscription.plan else "car service"} is scheduled for {subscription.next_service_date.strftime("%B %d, %Y")} at {subscription.preferred_time}.',
-                                scheduled_send_time=datetime.combine(reminder_date, datetime.strptime('09:00', '%H:%M').time()),
-                                service_date=subscription.next_service_date,
-                                service_time=subscription.preferred_time,
-                                send_email=subscription.notification_email,
-                                send_sms=subscription.notification_sms,
-                                send_website=True
-                            )
-                            
-                            db.session.add(reminder_notification)
-                        
-                        services_scheduled += 1
-            
-            db.session.commit()
-            print(f"Scheduled {services_scheduled} recurring services")
-            return services_scheduled
-            
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error scheduling recurring services: {str(e)}")
+    def schedule_recurring_services(horizon_days=None):
+        """Schedule recurring services for active subscriptions over the visit horizon.
+
+        Reminders are created by the notification scheduler from next_service_date.
+        """
+        from src.services.visit_schedule import visit_materializer
+        
+        result = visit_materializer.materialize(horizon_days=horizon_days)
+        if not result['success']:
+            print(f"Error scheduling recurring services: {result['error']}")
             return 0
+        print(f"Scheduled {result['created']} recurring services")
+        return result['created']
     
     @staticmethod
     def create_subscription(subscription_data):
@@ -386,7 +346,7 @@ class SubscriptionService:
             # Create new subscription
             customer_info = subscription_data.get('customer_info', {})
             # Calculate pricing for the subscription
-            plan = SubscriptionPlan.query.filter_by(plan_id=subscription_data['plan_id']).first()
+            plan = plan_registry.resolve(subscription_data['plan_id'])
             monthly_price = 0.0
             if plan:
                 monthly_price = plan.calculate_subscription_price(
@@ -397,7 +357,7 @@ class SubscriptionService:
             subscription = CustomerSubscription(
                 subscription_id=CustomerSubscription.generate_subscription_id(),
                 customer_id=subscription_data.get('stripe_customer_id', f"cus_{CustomerSubscription.generate_subscription_id()}"),
-                plan_id=subscription_data['plan_id'],
+                plan_id=plan.plan_id if plan else subscription_data['plan_id'],
                 customer_name=customer_info.get('name', ''),
                 customer_email=customer_info.get('email', ''),
                 customer_phone=customer_info.get('phone', ''),
@@ -407,7 +367,9 @@ class SubscriptionService:
                 start_date=date.today(),
                 monthly_price=monthly_price,
                 status=subscription_data.get('status', 'active'),
-                next_service_date=SubscriptionService.calculate_next_service_date(subscription_data['frequency'])
+                next_service_date=SubscriptionService.calculate_next_service_date(subscription_data['frequency']),
+                stripe_subscription_id=subscription_data.get('stripe_subscription_id'),
+                stripe_checkout_session_id=subscription_data.get('stripe_checkout_session_id')
             )
             
             db.session.add(subscription)
@@ -430,18 +392,11 @@ class SubscriptionService:
             }
     
     @staticmethod
-    def calculate_next_service_date(frequency):
-        """Calculate the next service date based on frequency"""
-        today = date.today()
+    def calculate_next_service_date(frequency, preferred_day=None, start_date=None):
+        """Calculate the next service date based on frequency, preferred day and calendar months"""
+        from src.services.visit_schedule import next_series_date
         
-        if frequency == 'weekly':
-            return today + timedelta(days=7)
-        elif frequency == 'bi_weekly':
-            return today + timedelta(days=14)
-        elif frequency == 'monthly':
-            return today + timedelta(days=30)
-        else:
-            return today + timedelta(days=30)  # Default to monthly
+        return next_series_date(frequency, preferred_day, start_date)
 
 
 # Create global instance
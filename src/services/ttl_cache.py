@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a per-entry TTL.
+
+    ``get_or_load`` lets only one caller run the loader for a missing key;
+    concurrent callers for the same key wait for that result instead of
+    hitting the backend themselves.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> threading.Event
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_load(self, key, loader):
+        """Return the cached value or call ``loader()``.
+
+        The loader returns ``(value, ttl)``; a ``None`` ttl means do not cache.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+            with self._lock:
+                pending = self._loading.get(key)
+                if pending is None:
+                    pending = self._loading[key] = threading.Event()
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                pending.wait()
+                # Loader finished (or failed) - re-check the cache, load ourselves if it is still empty
+                if self.get(key) is None:
+                    return loader()[0]
+                continue
+
+            try:
+                value, ttl = loader()
+                if value is not None and ttl is not None:
+                    self.set(key, value, ttl)
+                return value
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+                pending.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,246 @@
+import os
+import threading
+import logging
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, insert, select
+
+from src.models.user import db
+from src.models.subscription_plan import CustomerSubscription, SubscriptionService
+from src.services.availability import availability_engine, minutes_to_time
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = {day: index for index, day in enumerate(
+    ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'))}
+
+# frequency -> (unit, step); unknown frequencies are treated as monthly
+FREQUENCY_STEPS = {
+    'weekly': ('D', 7),
+    'bi_weekly': ('D', 14),
+    'monthly': ('M', 1),
+    'yearly': ('M', 12),
+}
+
+# An existing visit this close to a series date stands in for it (e.g. it was rescheduled)
+MATCH_TOLERANCE_DAYS = {'weekly': 3, 'bi_weekly': 6, 'monthly': 13, 'yearly': 180}
+
+_DAY = np.timedelta64(1, 'D')
+_KEY_STRIDE = 1_000_000  # days since 1970 stay far below this, so (row, day) packs into one int
+
+
+def _frequency(frequency):
+    return frequency if frequency in FREQUENCY_STEPS else 'monthly'
+
+
+def _preferred_weekday(preferred_day):
+    return WEEKDAYS.get((preferred_day or '').strip().lower(), -1)
+
+
+def _weekday(days):
+    """Monday=0 weekday of a datetime64[D] array (1970-01-01 was a Thursday)"""
+    return (days.astype('int64') + 3) % 7
+
+
+def _roll_forward(days, weekdays):
+    """Move each date forward to its preferred weekday; -1 leaves it alone"""
+    shift = np.where(weekdays >= 0, (weekdays - _weekday(days)) % 7, 0)
+    return days + shift * _DAY
+
+
+def _weekly_series(anchors, step, first, last):
+    """Every ``step`` days from each anchor, covering [first, last]"""
+    k0 = np.maximum(0, -((anchors - first) // _DAY // step))  # ceil((first - anchor) / step)
+    ks = k0[:, None] + np.arange((last - first) // _DAY // step + 1)[None, :]
+    return anchors[:, None] + ks * step * _DAY
+
+
+def _monthly_series(anchors, weekdays, step, first, last):
+    """Every ``step`` calendar months from each anchor, covering [first, last].
+
+    Without a preferred day the anchor's day of month is kept (clipped to the
+    month's length); with one, the same nth weekday of the month is used,
+    e.g. every second Tuesday. A fifth weekday becomes the last one of the
+    month, so a series anchored on it keeps its first visit.
+    """
+    anchor_months = anchors.astype('datetime64[M]')
+    offsets = (first.astype('datetime64[M]') - anchor_months).astype('int64')
+    k0 = np.maximum(0, offsets // step)
+    span = (last.astype('datetime64[M]') - first.astype('datetime64[M]')).astype('int64')
+    ks = k0[:, None] + np.arange(span // step + 2)[None, :]
+    months = anchor_months[:, None] + ks * step * np.timedelta64(1, 'M')
+
+    month_starts = months.astype('datetime64[D]')
+    month_lengths = ((months + np.timedelta64(1, 'M')).astype('datetime64[D]') - month_starts) // _DAY
+    day_index = ((anchors - anchor_months.astype('datetime64[D]')) // _DAY)[:, None]
+
+    same_day = month_starts + np.minimum(day_index, month_lengths - 1) * _DAY
+    nth = day_index // 7
+    nth_weekday = month_starts + (((weekdays[:, None] - _weekday(month_starts)) % 7) + 7 * nth) * _DAY
+    month_ends = month_starts + (month_lengths - 1) * _DAY
+    last_weekday = month_ends - ((_weekday(month_ends) - weekdays[:, None]) % 7) * _DAY
+    nth_weekday = np.where(nth >= 4, last_weekday, nth_weekday)
+    return np.where(weekdays[:, None] >= 0, nth_weekday, same_day)
+
+
+def series_dates(frequencies, preferred_days, start_dates, end_dates, first, last):
+    """Visit dates between ``first`` and ``last`` for many subscriptions at once.
+
+    Returns (row, date) arrays: ``row`` indexes the inputs and ``date`` is a
+    datetime64[D]. A subscription's series starts on its start date rolled
+    forward to its preferred day and repeats by its frequency.
+    """
+    first, last = np.datetime64(first, 'D'), np.datetime64(last, 'D')
+    frequencies = np.array([_frequency(f) for f in frequencies], dtype=object)
+    weekdays = np.array([_preferred_weekday(d) for d in preferred_days], dtype=np.int64)
+    starts = np.array(start_dates, dtype='datetime64[D]')
+    ends = np.array([d or np.datetime64('NaT') for d in end_dates], dtype='datetime64[D]')
+    anchors = _roll_forward(starts, weekdays)
+
+    rows, dates = [], []
+    for frequency, (unit, step) in FREQUENCY_STEPS.items():
+        group = np.flatnonzero(frequencies == frequency)
+        if not len(group):
+            continue
+        if unit == 'D':
+            candidates = _weekly_series(anchors[group], step, first, last)
+        else:
+            candidates = _monthly_series(anchors[group], weekdays[group], step, first, last)
+        keep = (candidates >= first) & (candidates <= last) & (candidates >= starts[group][:, None])
+        keep &= np.isnat(ends[group][:, None]) | (candidates <= ends[group][:, None])
+        r, c = np.nonzero(keep)
+        rows.append(group[r])
+        dates.append(candidates[r, c])
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([], dtype='datetime64[D]')
+    return np.concatenate(rows), np.concatenate(dates)
+
+
+def next_series_date(frequency, preferred_day=None, start_date=None, after=None):
+    """First visit date of a series strictly after ``after`` (default today)"""
+    after = after or date.today()
+    start_date = start_date or after
+    unit, step = FREQUENCY_STEPS[_frequency(frequency)]
+    first = max(after + timedelta(days=1), start_date)
+    # One step plus a week for the weekday roll always holds the next date
+    last = first + timedelta(days=(step * 31 if unit == 'M' else step) + 7)
+    _, dates = series_dates([frequency], [preferred_day], [start_date], [None], first, last)
+    return dates.min().item() if len(dates) else None
+
+
+class VisitMaterializer:
+    """Creates every subscription visit over a rolling horizon in one go.
+
+    Series dates for all active subscriptions are computed with NumPy date
+    arithmetic, matched against the visits already on the books, and the
+    missing ones are inserted with one executemany. Reruns only add visits
+    that are still missing, so it is safe to run daily.
+    """
+
+    def __init__(self):
+        self.horizon_days = int(os.getenv('VISIT_HORIZON_WEEKS', '8')) * 7
+        self.default_time = minutes_to_time(availability_engine.default_start)
+        self._lock = threading.Lock()
+
+    def materialize(self, horizon_days=None, today=None):
+        """Insert missing visits from tomorrow until the end of the horizon. Needs an app context."""
+        if not self._lock.acquire(blocking=False):
+            return {'success': False, 'error': 'Visit materialisation already running'}
+        try:
+            return self._materialize(horizon_days or self.horizon_days, today or date.today())
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error materialising subscription visits: {str(e)}")
+            return {'success': False, 'error': str(e)}
+        finally:
+            self._lock.release()
+
+    def _materialize(self, horizon_days, today):
+        first = today + timedelta(days=1)
+        last = today + timedelta(days=horizon_days)
+
+        subscriptions = db.session.query(
+            CustomerSubscription.subscription_id, CustomerSubscription.frequency,
+            CustomerSubscription.preferred_day, CustomerSubscription.preferred_time,
+            CustomerSubscription.start_date, CustomerSubscription.end_date
+        ).filter(CustomerSubscription.status == 'active', CustomerSubscription.start_date.isnot(None)).all()
+        result = {'success': True, 'from': first.isoformat(), 'until': last.isoformat(),
+                  'subscriptions': len(subscriptions), 'created': 0}
+        if not subscriptions:
+            return result
+
+        rows, dates = series_dates(
+            [s.frequency for s in subscriptions], [s.preferred_day for s in subscriptions],
+            [s.start_date for s in subscriptions], [s.end_date for s in subscriptions], first, last
+        )
+        rows, dates = self._missing(subscriptions, rows, dates, first, last)
+
+        if len(rows):
+            used_ids = set()
+            visits = []
+            for row, day in zip(rows.tolist(), dates.tolist()):
+                service_id = SubscriptionService.generate_service_id()
+                while service_id in used_ids:
+                    service_id = SubscriptionService.generate_service_id()
+                used_ids.add(service_id)
+                subscription = subscriptions[row]
+                visits.append({
+                    'service_id': service_id,
+                    'subscription_id': subscription.subscription_id,
+                    'scheduled_date': day,
+                    'scheduled_time': subscription.preferred_time or self.default_time,
+                    'status': 'scheduled'
+                })
+            db.session.execute(insert(SubscriptionService.__table__), visits)
+
+        self._refresh_next_service_dates(today)
+        db.session.commit()
+        # Core statements skip the session events that keep availability current
+        availability_engine.invalidate()
+
+        result['created'] = int(len(rows))
+        logger.info(f"Materialised {result['created']} subscription visits up to {last.isoformat()}")
+        return result
+
+    def _missing(self, subscriptions, rows, dates, first, last):
+        """Drop series dates that already have a visit within the match tolerance"""
+        if not len(rows):
+            return rows, dates
+        widest = max(MATCH_TOLERANCE_DAYS.values())
+        positions = {s.subscription_id: i for i, s in enumerate(subscriptions)}
+        existing = db.session.query(SubscriptionService.subscription_id, SubscriptionService.scheduled_date).filter(
+            SubscriptionService.scheduled_date.between(first - timedelta(days=widest), last + timedelta(days=widest))
+        ).all()
+        existing = [(positions[sid], day) for sid, day in existing if sid in positions]
+        if not existing:
+            return rows, dates
+
+        keys = np.sort(np.array([p * _KEY_STRIDE for p, _ in existing], dtype=np.int64)
+                       + np.array([d for _, d in existing], dtype='datetime64[D]').astype(np.int64))
+        candidates = rows * _KEY_STRIDE + dates.astype(np.int64)
+        tolerance = np.array([MATCH_TOLERANCE_DAYS[_frequency(subscriptions[r].frequency)] for r in rows.tolist()])
+        lo = np.searchsorted(keys, candidates - tolerance, side='left')
+        hi = np.searchsorted(keys, candidates + tolerance, side='right')
+        keep = lo == hi
+        return rows[keep], dates[keep]
+
+    def _refresh_next_service_dates(self, today):
+        """Point stale next_service_date values at the next upcoming visit"""
+        upcoming = select(func.min(SubscriptionService.scheduled_date)).where(
+            SubscriptionService.subscription_id == CustomerSubscription.subscription_id,
+            SubscriptionService.scheduled_date >= today,
+            SubscriptionService.status.in_(('scheduled', 'rescheduled'))
+        ).scalar_subquery()
+        table = CustomerSubscription.__table__
+        db.session.execute(
+            table.update().where(
+                table.c.status == 'active',
+                (table.c.next_service_date.is_(None)) | (table.c.next_service_date < today)
+            ).values(next_service_date=func.coalesce(upcoming, table.c.next_service_date),
+                     updated_at=datetime.utcnow())
+        )
+
+
+# Global instance
+visit_materializer = VisitMaterializer()
@@ -0,0 +1,207 @@
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+import logging
+from datetime import datetime, timedelta
+
+import stripe
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.stripe_event import StripeWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+
+class StripeWebhookProcessor:
+    """Background worker pool for verified Stripe webhook events.
+
+    The webhook route stores each verified event in the ``stripe_webhook_events``
+    inbox and acknowledges Stripe straight away; the follow-up work (DB writes,
+    emails, Discord) runs here. Events are sharded by Stripe customer so each
+    customer's events are handled in arrival order by a single worker, and the
+    unique event id makes Stripe's retries no-ops.
+    """
+
+    def __init__(self):
+        self.num_workers = int(os.getenv('STRIPE_WEBHOOK_WORKERS', '4'))
+        self.max_attempts = int(os.getenv('STRIPE_WEBHOOK_MAX_ATTEMPTS', '5'))
+        self.stale_after = timedelta(minutes=int(os.getenv('STRIPE_WEBHOOK_STALE_MINUTES', '10')))
+        self.handlers = {}
+        self.app = None
+        self.running = False
+        self._queues = []
+        self._threads = []
+
+    def register(self, event_type, handler, with_event=False):
+        """Register ``handler(data_object)`` for a Stripe event type.
+
+        With ``with_event=True`` the handler is called as ``handler(data_object, event)``.
+        """
+        self.handlers[event_type] = (handler, with_event)
+
+    def start(self, app):
+        """Start the worker threads and re-queue events left unfinished by a previous run"""
+        if self.running:
+            return
+        self.app = app
+        self.running = True
+        self._queues = [queue.Queue() for _ in range(self.num_workers)]
+        self._threads = []
+        for index in range(self.num_workers):
+            thread = threading.Thread(target=self._run_worker, args=(index,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        with app.app_context():
+            self._recover_unfinished()
+        logger.info(f"Stripe webhook processor started with {self.num_workers} workers")
+
+    def stop(self):
+        """Stop the worker threads once their queues drain"""
+        self.running = False
+        for work_queue in self._queues:
+            work_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        logger.info("Stripe webhook processor stopped")
+
+    @staticmethod
+    def get_ordering_key(event):
+        """Events are ordered per Stripe customer; events without one are independent"""
+        data_object = event.get('data', {}).get('object', {}) or {}
+        customer = data_object.get('customer')
+        if isinstance(customer, dict):
+            customer = customer.get('id')
+        return customer or event.get('id')
+
+    def ingest(self, event):
+        """Persist a verified event to the inbox and queue it for processing.
+
+        Returns False if the event id was already received (a Stripe retry).
+        """
+        inbox_event = StripeWebhookEvent(
+            event_id=event['id'],
+            event_type=event['type'],
+            ordering_key=self.get_ordering_key(event),
+            payload=json.dumps(event),
+            stripe_created=event.get('created'),
+            status='pending'
+        )
+
+        try:
+            db.session.add(inbox_event)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            logger.info(f"Duplicate Stripe event ignored: {event['id']}")
+            return False
+
+        if self.running:
+            self._enqueue(inbox_event.id, inbox_event.ordering_key)
+        else:
+            # No worker pool (scripts, shell) - process inline
+            self.process_event(inbox_event.id)
+        return True
+
+    def _enqueue(self, inbox_id, ordering_key):
+        shard = zlib.crc32((ordering_key or '').encode()) % self.num_workers
+        self._queues[shard].put(inbox_id)
+
+    def _recover_unfinished(self):
+        """Re-queue pending events and events whose worker died mid-processing"""
+        stale_cutoff = datetime.utcnow() - self.stale_after
+        StripeWebhookEvent.query.filter(
+            StripeWebhookEvent.status == 'processing',
+            StripeWebhookEvent.updated_at < stale_cutoff
+        ).update({'status': 'pending'}, synchronize_session=False)
+        db.session.commit()
+
+        unfinished = db.session.query(StripeWebhookEvent.id, StripeWebhookEvent.ordering_key).filter(
+            StripeWebhookEvent.status == 'pending'
+        ).order_by(StripeWebhookEvent.id.asc()).all()
+
+        for inbox_id, ordering_key in unfinished:
+            self._enqueue(inbox_id, ordering_key)
+
+        if unfinished:
+            logger.info(f"Re-queued {len(unfinished)} unfinished Stripe webhook events")
+
+    def _run_worker(self, index):
+        work_queue = self._queues[index]
+        while True:
+            inbox_id = work_queue.get()
+            if inbox_id is None:
+                break
+            try:
+                with self.app.app_context():
+                    self._process_with_retries(inbox_id)
+            except Exception as e:
+                logger.error(f"Webhook worker {index} error on inbox event {inbox_id}: {str(e)}")
+
+    def _process_with_retries(self, inbox_id):
+        # Retries happen in place so later events for the same customer wait behind this one
+        while self.running:
+            outcome = self.process_event(inbox_id)
+            if outcome != 'retry':
+                return
+            attempts = db.session.get(StripeWebhookEvent, inbox_id).attempts or 1
+            db.session.rollback()
+            time.sleep(min(60, 2 ** attempts))
+
+    def _claim(self, inbox_id):
+        """Atomically move an event from pending to processing; False if another worker owns it"""
+        claimed = StripeWebhookEvent.query.filter(
+            StripeWebhookEvent.id == inbox_id,
+            StripeWebhookEvent.status == 'pending'
+        ).update({
+            'status': 'processing',
+            'attempts': StripeWebhookEvent.attempts + 1,
+            'updated_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def process_event(self, inbox_id):
+        """Run the registered handler for one inbox event.
+
+        Returns 'processed', 'skipped', 'retry' or 'failed'.
+        """
+        if not self._claim(inbox_id):
+            return 'skipped'
+
+        inbox_event = db.session.get(StripeWebhookEvent, inbox_id)
+        event = stripe.Event.construct_from(json.loads(inbox_event.payload), stripe.api_key)
+        handler, with_event = self.handlers.get(inbox_event.event_type, (None, False))
+
+        try:
+            if handler and with_event:
+                handler(event['data']['object'], event)
+            elif handler:
+                handler(event['data']['object'])
+            else:
+                logger.info(f"Unhandled event type: {inbox_event.event_type}")
+
+            inbox_event = db.session.get(StripeWebhookEvent, inbox_id)
+            inbox_event.status = 'processed'
+            inbox_event.last_error = None
+            inbox_event.processed_at = datetime.utcnow()
+            db.session.commit()
+            return 'processed'
+
+        except Exception as e:
+            db.session.rollback()
+            inbox_event = db.session.get(StripeWebhookEvent, inbox_id)
+            inbox_event.last_error = str(e)
+            inbox_event.status = 'failed' if inbox_event.attempts >= self.max_attempts else 'pending'
+            db.session.commit()
+            logger.error(f"Error processing Stripe event {inbox_event.event_id} "
+                         f"(attempt {inbox_event.attempts}): {str(e)}")
+            return 'failed' if inbox_event.status == 'failed' else 'retry'
+
+
+# Global instance
+webhook_processor = StripeWebhookProcessor()